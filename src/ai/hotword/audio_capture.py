@@ -0,0 +1,165 @@
+import collections
+import logging
+import threading
+from typing import Deque, List, Optional
+
+import numpy as np
+import pyaudio
+import webrtcvad
+
+from src.ai.sound_processor.audio_buffer import AudioBuffer
+
+logger = logging.getLogger("MicrophoneCapture")
+
+CAPTURE_SAMPLE_RATE = 16000
+DEFAULT_RING_SECONDS = 2.0
+DEFAULT_PREROLL_S = 0.2
+VAD_FRAME_MS = 30
+
+
+class MicrophoneCapture:
+    """
+    Stream de entrada del micrófono abierto una sola vez y compartido.
+
+    `HotwordDetector` lee de aquí cada trama para Porcupine y la misma trama sirve para
+    grabar la orden posterior, de modo que activar el asistente no abre el dispositivo de
+    nuevo. Las últimas `ring_seconds` de audio se guardan en un buffer circular para poder
+    recuperar el audio inmediatamente anterior a una detección.
+    """
+
+    def __init__(
+        self,
+        frame_length: int,
+        sample_rate: int = CAPTURE_SAMPLE_RATE,
+        input_device_index: Optional[int] = None,
+        ring_seconds: float = DEFAULT_RING_SECONDS
+    ):
+        self.frame_length = frame_length
+        self.sample_rate = sample_rate
+        self.input_device_index = input_device_index
+        max_frames = max(1, int(ring_seconds * sample_rate / frame_length))
+        self._ring: Deque[bytes] = collections.deque(maxlen=max_frames)
+        self._ring_lock = threading.Lock()
+        self._pa: Optional[pyaudio.PyAudio] = None
+        self._stream = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._stream is not None
+
+    def open(self) -> None:
+        if self._stream is not None:
+            return
+        self._pa = pyaudio.PyAudio()
+        self._stream = self._pa.open(
+            rate=self.sample_rate,
+            channels=1,
+            format=pyaudio.paInt16,
+            input=True,
+            frames_per_buffer=self.frame_length,
+            input_device_index=self.input_device_index
+        )
+        logger.info(f"Micrófono abierto ({self.sample_rate} Hz, tramas de {self.frame_length} muestras).")
+
+    def close(self) -> None:
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        if self._pa is not None:
+            self._pa.terminate()
+            self._pa = None
+        with self._ring_lock:
+            self._ring.clear()
+
+    def read_frame(self) -> bytes:
+        """Lee una trama PCM int16 del stream (bloqueante) y la guarda en el buffer circular."""
+        frame = self._stream.read(self.frame_length, exception_on_overflow=False)
+        with self._ring_lock:
+            self._ring.append(frame)
+        return frame
+
+    def recent_audio(self, seconds: float) -> bytes:
+        """Devuelve como mucho los últimos `seconds` de audio del buffer circular."""
+        n_frames = int(seconds * self.sample_rate / self.frame_length)
+        if n_frames <= 0:
+            return b""
+        with self._ring_lock:
+            frames = list(self._ring)[-n_frames:]
+        return b"".join(frames)
+
+
+class UtteranceRecorder:
+    """
+    Acumula tramas PCM tras la palabra clave y decide el final de la orden con webrtcvad.
+
+    Recibe las tramas según llegan (del mismo bucle que alimenta a Porcupine); webrtcvad
+    necesita tramas de 10/20/30 ms, así que el audio se re-trocea internamente en
+    tramas de 30 ms. La grabación termina tras `silence_timeout` segundos seguidos sin voz
+    o al alcanzar `max_duration_s`.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = CAPTURE_SAMPLE_RATE,
+        preroll: bytes = b"",
+        silence_timeout: float = 1.0,
+        vad_aggressiveness: int = 3,
+        max_duration_s: float = 15.0
+    ):
+        self.sample_rate = sample_rate
+        self._vad = webrtcvad.Vad(vad_aggressiveness)
+        self._vad_frame_bytes = sample_rate * VAD_FRAME_MS // 1000 * 2
+        self._max_silent_frames = int(silence_timeout * 1000 / VAD_FRAME_MS)
+        self._max_bytes = int(max_duration_s * sample_rate) * 2
+        self._frames: List[bytes] = [preroll] if preroll else []
+        self._size = len(preroll)
+        self._pending = b""
+        self._silent_frames = 0
+        self._speech_frames = 0
+        self.speech_detected = False
+        self.complete = False
+
+    @property
+    def speech_s(self) -> float:
+        """Segundos de voz (según el VAD) acumulados hasta ahora."""
+        return self._speech_frames * VAD_FRAME_MS / 1000
+
+    def feed(self, frame: bytes) -> bool:
+        """
+        Añade una trama PCM int16.
+
+        Returns:
+            bool: True cuando la orden ha terminado.
+        """
+        if self.complete:
+            return True
+        self._frames.append(frame)
+        self._size += len(frame)
+
+        self._pending += frame
+        while len(self._pending) >= self._vad_frame_bytes:
+            vad_frame, self._pending = self._pending[:self._vad_frame_bytes], self._pending[self._vad_frame_bytes:]
+            if self._vad.is_speech(vad_frame, self.sample_rate):
+                self.speech_detected = True
+                self._speech_frames += 1
+                self._silent_frames = 0
+            else:
+                self._silent_frames += 1
+
+        if self._silent_frames > self._max_silent_frames:
+            logger.info("Silencio detectado, finalizando grabación.")
+            self.complete = True
+        elif self._size >= self._max_bytes:
+            logger.info("Duración máxima de la orden alcanzada, finalizando grabación.")
+            self.complete = True
+        return self.complete
+
+    def to_audio_buffer(self) -> AudioBuffer:
+        """
+        Convierte el PCM acumulado en un AudioBuffer float32 sin pasar por WAV.
+
+        Puede llamarse antes de que termine la orden para procesar el audio capturado hasta
+        ese momento; el buffer devuelto es una copia.
+        """
+        pcm = np.frombuffer(b"".join(self._frames), dtype="<i2")
+        return AudioBuffer(pcm.astype(np.float32) / 32768.0, self.sample_rate, "microphone")
@@ -0,0 +1,107 @@
+"""
+Benchmark de CPU del bucle de escucha de palabra clave en reposo.
+
+Compara el bucle anterior (tres `asyncio.to_thread` por trama, `struct.unpack_from` y
+`asyncio.sleep(0.01)`) con el hilo dedicado actual (`np.frombuffer` y sin saltos al event
+loop salvo en detecciones). Las tramas de silencio se entregan al ritmo real de un
+micrófono (512 muestras a 16 kHz = 32 ms), así que la diferencia de CPU es el coste del
+propio bucle.
+
+Si PICOVOICE_ACCESS_KEY y HOTWORD_PATH están definidas se usa Porcupine real; si no, un
+procesador nulo que mide solo la sobrecarga del bucle.
+
+Uso:
+    python -m src.ai.hotword.benchmark_idle [segundos]
+"""
+import asyncio
+import os
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_LENGTH = 512
+
+
+class _SilentSource:
+    """Entrega tramas de silencio al ritmo de un micrófono real."""
+
+    def __init__(self):
+        self._frame = bytes(FRAME_LENGTH * 2)
+        self._period = FRAME_LENGTH / SAMPLE_RATE
+        self._next = time.perf_counter()
+
+    def read(self, _frame_length: int) -> bytes:
+        self._next += self._period
+        delay = self._next - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        return self._frame
+
+
+def _keyword_processor():
+    access_key = os.getenv("PICOVOICE_ACCESS_KEY")
+    hotword_path = os.getenv("HOTWORD_PATH")
+    if access_key and hotword_path:
+        import pvporcupine
+        porcupine = pvporcupine.create(access_key=access_key, keyword_paths=[hotword_path])
+        return porcupine.process, porcupine.delete, "porcupine"
+    return (lambda pcm: -1), (lambda: None), "nulo"
+
+
+async def _legacy_loop(process, duration: float) -> int:
+    source = _SilentSource()
+    frames = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        pcm = await asyncio.to_thread(source.read, FRAME_LENGTH)
+        pcm = await asyncio.to_thread(struct.unpack_from, "h" * FRAME_LENGTH, pcm)
+        await asyncio.to_thread(process, pcm)
+        await asyncio.sleep(0.01)
+        frames += 1
+    return frames
+
+
+async def _dedicated_thread_loop(process, duration: float) -> int:
+    source = _SilentSource()
+    loop = asyncio.get_running_loop()
+    finished = loop.create_future()
+    frames = [0]
+
+    def run():
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            if process(np.frombuffer(source.read(FRAME_LENGTH), dtype=np.int16)) >= 0:
+                loop.call_soon_threadsafe(lambda: None)
+            frames[0] += 1
+        loop.call_soon_threadsafe(finished.set_result, None)
+
+    threading.Thread(target=run, daemon=True).start()
+    await finished
+    return frames[0]
+
+
+def _measure(name: str, coroutine_factory, process, duration: float) -> None:
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    frames = asyncio.run(coroutine_factory(process, duration))
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+    expected = int(wall * SAMPLE_RATE / FRAME_LENGTH)
+    print(f"{name:<18} CPU {cpu / wall * 100:5.1f}%  tramas {frames}/{expected} (retraso {max(0, expected - frames)} tramas)")
+
+
+def main() -> None:
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+    process, release, processor_name = _keyword_processor()
+    print(f"Escucha en reposo durante {duration:.0f}s por variante (procesador {processor_name})")
+    try:
+        _measure("to_thread x3", _legacy_loop, process, duration)
+        _measure("hilo dedicado", _dedicated_thread_loop, process, duration)
+    finally:
+        release()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,61 +1,102 @@
 import pvporcupine
-import struct
-import pyaudio
+import numpy as np
 import os
 import asyncio
-import httpx
-import wave
-from datetime import datetime
-import webrtcvad
 import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from src.ai.hotword.audio_capture import DEFAULT_PREROLL_S, MicrophoneCapture, UtteranceRecorder
+from src.ai.sound_processor.audio_buffer import AudioBuffer
 
 logger = logging.getLogger("HotwordDetector")
 
+HotwordCallback = Callable[[AudioBuffer, Optional[Awaitable[Any]]], Awaitable[None]]
+EarlyAudioCallback = Callable[[AudioBuffer], Awaitable[Any]]
+
+DEFAULT_EARLY_AUDIO_S = 1.5
+
+
 class HotwordDetector:
-    def __init__(self, access_key, hotword_path, input_device_index=None):
+    """
+    Detector de palabra clave sobre un stream de micrófono persistente.
+
+    Un hilo dedicado lee cada trama y la pasa a Porcupine. Tras una detección sigue
+    leyendo del mismo stream y pasa las tramas a un `UtteranceRecorder`; cuando el VAD
+    decide que la orden ha terminado, entrega el audio en memoria al callback en el event
+    loop, sin escribir archivos ni reabrir el dispositivo.
+
+    Mientras se procesa una orden (callback en curso, incluida la respuesta hablada) la
+    detección queda en pausa, como cuando la grabación bloqueaba la escucha: así ni una
+    segunda palabra clave ni la propia voz del asistente lanzan otro pipeline en paralelo.
+
+    Si se indica `early_callback`, en cuanto la orden acumula `early_audio_s` segundos de
+    voz se lanza con el audio capturado hasta entonces, mientras el VAD sigue decidiendo el
+    final; su tarea se entrega después al callback junto con la orden completa.
+    """
+
+    def __init__(
+        self,
+        access_key,
+        hotword_path,
+        input_device_index=None,
+        preroll_s: float = DEFAULT_PREROLL_S,
+        early_audio_s: float = DEFAULT_EARLY_AUDIO_S
+    ):
         self.access_key = access_key
         self.hotword_path = hotword_path
         self.input_device_index = input_device_index
+        self.preroll_s = preroll_s
+        self.early_audio_s = early_audio_s
         self.porcupine = None
-        self.pa = None
-        self.audio_stream = None
+        self.capture: Optional[MicrophoneCapture] = None
+        self._thread: Optional[threading.Thread] = None
         self._is_listening = False
-        self._callback = None
+        self.frames_processed = 0
+        self.detections = 0
+        self._callback: Optional[HotwordCallback] = None
+        self._early_callback: Optional[EarlyAudioCallback] = None
+        self._callback_tasks: Set[asyncio.Task] = set()
+        self._busy = threading.Event()
+        self.skipped_frames = 0
         self._online_event = asyncio.Event()
 
     def is_online(self) -> bool:
-        return self.porcupine is not None and self.pa is not None and self.audio_stream is not None and self._is_listening
+        return self.porcupine is not None and self.capture is not None and self.capture.is_open and self._is_listening
+
+    async def start(self, callback: HotwordCallback, early_callback: Optional[EarlyAudioCallback] = None):
+        """
+        Abre el micrófono y escucha hasta que se cancele la tarea o se llame a `stop()`.
 
-    async def start(self, callback):
+        La lectura, conversión y `porcupine.process` de cada trama se hacen en un único hilo
+        dedicado; al event loop solo llegan las órdenes grabadas, vía `call_soon_threadsafe`.
+        """
         self._callback = callback
+        self._early_callback = early_callback
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
         try:
             self.porcupine = pvporcupine.create(
                 access_key=self.access_key,
                 keyword_paths=[self.hotword_path]
             )
 
-            self.pa = pyaudio.PyAudio()
-            self.audio_stream = self.pa.open(
-                rate=self.porcupine.sample_rate,
-                channels=1,
-                format=pyaudio.paInt16,
-                input=True,
-                frames_per_buffer=self.porcupine.frame_length,
+            self.capture = MicrophoneCapture(
+                frame_length=self.porcupine.frame_length,
+                sample_rate=self.porcupine.sample_rate,
                 input_device_index=self.input_device_index
             )
+            self.capture.open()
             self._is_listening = True
+            self._thread = threading.Thread(
+                target=self._listen_loop, args=(loop, finished), name="hotword-listener", daemon=True
+            )
+            self._thread.start()
             self._online_event.set()
             logger.info("Escuchando palabras clave...")
 
-            while self._is_listening:
-                pcm = await asyncio.to_thread(self.audio_stream.read, self.porcupine.frame_length)
-                pcm = await asyncio.to_thread(struct.unpack_from, "h" * self.porcupine.frame_length, pcm)
-
-                result = await asyncio.to_thread(self.porcupine.process, pcm)
-                if result >= 0:
-                    logger.info("Palabra activa detectada, activando asistente...")
-                    await self._callback()
-                await asyncio.sleep(0.01)
+            await finished
 
         except asyncio.CancelledError:
             logger.info("Tarea de escucha cancelada.")
@@ -64,100 +105,153 @@ class HotwordDetector:
         finally:
             self.stop()
 
+    def _listen_loop(self, loop: asyncio.AbstractEventLoop, finished: asyncio.Future) -> None:
+        """Bucle del hilo de escucha: lee tramas, las pasa a Porcupine o al grabador de la orden."""
+        recorder: Optional[UtteranceRecorder] = None
+        early: Optional[Future] = None
+        error: Optional[Exception] = None
+        try:
+            while self._is_listening:
+                frame = self.capture.read_frame()
+                self.frames_processed += 1
+
+                if recorder is not None:
+                    if recorder.feed(frame):
+                        if recorder.speech_detected:
+                            # Se marca ya en este hilo para no detectar otra palabra clave antes de que arranque el callback
+                            self._busy.set()
+                            loop.call_soon_threadsafe(self._dispatch_audio, recorder.to_audio_buffer(), early)
+                        else:
+                            logger.info("No se detectó voz tras la palabra clave.")
+                            if early is not None:
+                                early.cancel()
+                        recorder = None
+                        early = None
+                    elif early is None and self._early_callback is not None and recorder.speech_s >= self.early_audio_s:
+                        early = asyncio.run_coroutine_threadsafe(self._early_callback(recorder.to_audio_buffer()), loop)
+                    continue
+
+                if self._busy.is_set():
+                    self.skipped_frames += 1
+                    continue
+
+                if self.porcupine.process(np.frombuffer(frame, dtype=np.int16)) >= 0:
+                    self.detections += 1
+                    logger.info("Palabra activa detectada, activando asistente...")
+                    logger.info("Grabando... Habla ahora.")
+                    recorder = UtteranceRecorder(
+                        sample_rate=self.porcupine.sample_rate,
+                        preroll=self.capture.recent_audio(self.preroll_s)
+                    )
+        except Exception as e:
+            if self._is_listening:
+                error = e
+        finally:
+            try:
+                loop.call_soon_threadsafe(self._finish, finished, error)
+            except RuntimeError:
+                # El event loop ya se cerró durante el apagado
+                pass
+
+    @staticmethod
+    def _finish(finished: asyncio.Future, error: Optional[Exception]) -> None:
+        if finished.done():
+            return
+        if error is not None:
+            finished.set_exception(error)
+        else:
+            finished.set_result(None)
+
+    def _dispatch_audio(self, audio: AudioBuffer, early: Optional[Future]) -> None:
+        """Lanza el callback con la orden grabada; la detección sigue en pausa hasta que termine (se ejecuta en el event loop)."""
+        try:
+            task = asyncio.create_task(self._callback(audio, asyncio.wrap_future(early) if early is not None else None))
+        except Exception:
+            self._busy.clear()
+            raise
+        self._callback_tasks.add(task)
+        task.add_done_callback(self._callback_done)
+
+    def _callback_done(self, task: asyncio.Task) -> None:
+        self._callback_tasks.discard(task)
+        if not self._callback_tasks:
+            self._busy.clear()
+
     def stop(self):
         self._is_listening = False
         self._online_event.clear()
-        if self.audio_stream is not None:
-            self.audio_stream.close()
-            self.audio_stream = None
-        if self.pa is not None:
-            self.pa.terminate()
-            self.pa = None
+        if self._thread is not None and self._thread is not threading.current_thread():
+            # La lectura en curso termina en una trama (~32 ms); después se puede cerrar el stream
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
         if self.porcupine is not None:
             self.porcupine.delete()
             self.porcupine = None
         logger.info("Detenido.")
 
-def record_audio(filename, sample_rate=16000, chunk_size=320, channels=1, silence_timeout=1.0, vad_aggressiveness=3):
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "listening": self._is_listening,
+            "busy": self._busy.is_set(),
+            "frames_processed": self.frames_processed,
+            "skipped_frames": self.skipped_frames,
+            "detections": self.detections
+        }
+
+
+async def identify_speaker_early(audio: AudioBuffer):
+    """Identifica al hablante con el inicio de la orden, mientras el VAD sigue grabando."""
+    from src.api import utils
+
+    if utils._speaker_module is None or not utils._speaker_module.is_online():
+        return None
+    identified_user, _ = await utils._speaker_module.identify_speaker(audio)
+    return identified_user
+
+
+async def hotword_callback_async(audio: AudioBuffer, early_speaker: Optional[Awaitable[Any]] = None):
     """
-    Graba audio hasta que se detecta silencio.
-    
-    Args:
-        filename: Nombre del archivo de salida.
-        sample_rate: Tasa de muestreo del audio (Hz).
-        chunk_size: Tamaño de cada fragmento de audio.
-        channels: Número de canales de audio (1 para mono).
-        silence_timeout: Tiempo en segundos de silencio para detener la grabación.
-        vad_aggressiveness: Nivel de agresividad del VAD (1-3).
+    Procesa en el propio proceso la orden capturada tras la palabra clave (STT, hablante, NLP y TTS).
+
+    `early_speaker` es la identificación lanzada por `identify_speaker_early` con el inicio
+    de la orden; si reconoció al hablante, el pipeline no vuelve a identificarlo.
     """
-    
-    p = pyaudio.PyAudio()
-    stream = None
+    logger.info(f"¡Palabra clave detectada! Procesando {audio.duration:.2f}s de audio...")
+    from fastapi import HTTPException
+    from src.api import utils
+    from src.db.database import get_db
+    from src.services.voice_pipeline import VoicePipeline
+
+    modules = (utils._stt_module, utils._speaker_module, utils._nlp_module)
+    if any(module is None or not module.is_online() for module in modules):
+        logger.warning("Módulos de voz fuera de línea; se descarta la orden capturada.")
+        if early_speaker is not None:
+            early_speaker.cancel()
+        return
+
+    pipeline = VoicePipeline(
+        stt_module=utils._stt_module,
+        speaker_module=utils._speaker_module,
+        nlp_module=utils._nlp_module,
+        tts_module=utils._tts_module
+    )
     try:
-        stream = p.open(format=pyaudio.paInt16,
-                         channels=channels,
-                         rate=sample_rate,
-                         input=True,
-                         frames_per_buffer=chunk_size)
-        
-        vad = webrtcvad.Vad(vad_aggressiveness)
-        frames = []
-        silent_frames = 0
-        max_silent_frames = int(silence_timeout * sample_rate / chunk_size)
-        
-        logger.info("Grabando... Habla ahora.")
-        
-        while True:
-            data = stream.read(chunk_size)
-            frames.append(data)
-            
-            is_speech = vad.is_speech(data, sample_rate)
-            
-            if is_speech:
-                silent_frames = 0
-            else:
-                silent_frames += 1
-                
-            if silent_frames > max_silent_frames:
-                logger.info("Silencio detectado, finalizando grabación.")
-                break
-        
-        wf = wave.open(filename, 'wb')
-        wf.setnchannels(channels)
-        wf.setsampwidth(p.get_sample_size(pyaudio.paInt16))
-        wf.setframerate(sample_rate)
-        wf.writeframes(b''.join(frames))
-        wf.close()
+        result = await pipeline.process_audio(audio, speak=True, early_speaker=early_speaker)
+        logger.info(f"Respuesta del asistente: {result}")
+        async with get_db() as db:
+            await utils._save_api_log(
+                "/hotword/process_audio",
+                {"source": "microphone", "user_id": result["user_id"]},
+                result,
+                db
+            )
+    except HTTPException as e:
+        logger.error(f"Error en procesamiento de hotword: {e.detail}")
     except Exception as e:
-        logger.error(f"Error durante la grabación de audio: {e}")
-        raise
-    finally:
-        if stream is not None:
-            stream.stop_stream()
-            stream.close()
-        if p is not None:
-            p.terminate()
-
-async def hotword_callback_async():
-    logger.info("¡Palabra clave detectada! Activando IA...")
-    audio_filename = f"hotword_audio_{datetime.now().strftime('%Y%m%d%H%M%S')}.wav"
-    await asyncio.to_thread(record_audio, audio_filename)
-
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        try:
-            headers = {"X-Device-API-Key": os.getenv("DEVICE_API_KEY")}
-            with open(audio_filename, "rb") as f:
-                files = {'audio_file': (audio_filename, f, 'audio/wav')}
-                response = await client.post("http://localhost:8000/hotword/hotword/process_audio", files=files, headers=headers)
-                response.raise_for_status()
-                result = response.json()
-                logger.info(f"Respuesta de la API: {result}")
-        except httpx.RequestError as e:
-            logger.error(f"Falló la solicitud HTTP: {e}", exc_info=True)
-        except httpx.HTTPStatusError as e:
-            logger.error(f"Error de estado HTTP: {e.response.status_code} - {e.response.text}", exc_info=True)
-        finally:
-            os.remove(audio_filename)
+        logger.error(f"Error inesperado en procesamiento de hotword: {e}", exc_info=True)
 
 if __name__ == '__main__':
     from dotenv import load_dotenv
@@ -171,15 +265,12 @@ if __name__ == '__main__':
     if not HOTWORD_PATH:
         logger.error("Error: HOTWORD_PATH no encontrada en las variables de entorno.")
         exit()
-    
-    DEVICE_API_KEY = os.getenv("DEVICE_API_KEY")
-    if not DEVICE_API_KEY:
-        logger.error("Error: DEVICE_API_KEY no encontrada en las variables de entorno.")
-        exit()
+
+    async def _log_utterance(audio: AudioBuffer, early: Optional[Awaitable[Any]] = None):
+        logger.info(f"Orden capturada: {audio.duration:.2f}s de audio.")
 
     async def main_hotword_test():
         detector = HotwordDetector(access_key=ACCESS_KEY, hotword_path=HOTWORD_PATH)
-        await detector.start(hotword_callback_async)
+        await detector.start(_log_utterance)
 
     asyncio.run(main_hotword_test())
-    
\ No newline at end of file
@@ -95,7 +95,8 @@ class ConfigManager:
                 "top_k": 40,
                 "repeat_penalty": 1.1,
                 "num_ctx": 8192,
-                "max_tokens": 1024
+                "max_tokens": 1024,
+                "prompt_layout": "prefix_stable"
             },
             "capabilities": [
                 "control_luces",
@@ -112,8 +113,17 @@ class ConfigManager:
                 "longitude": -77.0428
             },
             "stt_model": "small",
+            "stt_max_queue": 4,
+            "stt_max_batch": 4,
+            "stt_batch_window_ms": 25,
+            "stt_vad_aggressiveness": 2,
+            "stt_denoise_mode": "non_stationary",
+            "stt_denoise_skip_snr_db": 25.0,
+            "stt_fast_backend": None,
+            "stt_fast_path_max_s": 8.0,
             "tts_model": "tts_models/multilingual/multi-dataset/xtts_v2",
-            "tts_speaker": "Sofia Hellen"
+            "tts_speaker": "Sofia Hellen",
+            "tts_lookahead": 2
         }
 
     def _validate_timezone(self) -> None:
@@ -3,7 +3,7 @@ import logging
 import re
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, AsyncIterator
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.ai.nlp.memory_brain.memory_manager import MemoryManager
 from src.ai.nlp.core.ollama_manager import OllamaManager
@@ -18,6 +18,8 @@ from src.ai.nlp.context.device_context import DeviceContextManager
 from src.ai.common.constants import IoTConstants
 from src.ai.nlp.memory_brain.routine_scheduler import RoutineScheduler
 from src.ai.nlp.handlers import ResponseHandler, RoutineHandler, ContextHandler, ResponseProcessor
+from src.ai.nlp.handlers.stream_processor import StreamingMarkerFilter
+from src.ai.tts.text_splitter import IncrementalSentenceSplitter
 from src.music_manager.music_command_handler import MusicCommandHandler
 from src.api import utils
 
@@ -153,6 +155,10 @@ class NLPModule:
         """Devuelve True si el módulo NLP está online."""
         return self._response_handler.is_online()
 
+    def get_prompt_eval_stats(self) -> dict:
+        """Devuelve las métricas de evaluación del prompt (tokens evaluados y tiempo hasta el primer token)."""
+        return self._response_handler.get_prompt_eval_stats()
+
     async def get_conversation_history(self, db: AsyncSession, user_id: int, limit: int = 10) -> list:
         """Obtiene el historial de conversación para un usuario."""
         return await self._memory_manager.search_conversation_logs(db, user_id, query="", limit=limit)
@@ -184,6 +190,95 @@ class NLPModule:
         """Genera una respuesta usando Ollama, gestionando memoria, permisos, comandos IoT y Memory Brain."""
         logger.info(f"Generando respuesta para el prompt: '{prompt[:100]}...' (Usuario ID: {user_id})")
 
+        error_response = await self._check_request(prompt, user_id)
+        if error_response:
+            return error_response
+        
+        async with get_db() as db:
+            request_context = await self._prepare_request(db, prompt, user_id)
+            if "error_response" in request_context:
+                return request_context["error_response"]
+            context_result = request_context["context"]
+            
+            # Generar respuesta del LLM
+            full_response_content, llm_error = await self._response_handler.generate_llm_response(
+                context_result["system_prompt"], context_result["prompt_text"]
+            )
+            
+            if llm_error:
+                return self._error_response(llm_error, llm_error, user_name=request_context["user_name"], is_owner=request_context["is_owner"])
+            
+            return await self._finalize_response(db, prompt, user_id, token, request_context, full_response_content)
+
+    async def generate_response_stream(self, prompt: str, user_id: int, token: str) -> AsyncIterator[dict]:
+        """
+        Genera la respuesta en streaming.
+
+        Emite eventos a medida que el LLM genera texto:
+            - {"type": "delta", "text": ...}: texto hablable nuevo (sin marcadores de comandos).
+            - {"type": "sentence", "text": ...}: frase completa, lista para TTS.
+            - {"type": "command", "command": ...}: comando IoT detectado en cuanto está completo.
+            - {"type": "final", "response": {...}}: respuesta procesada, igual que `generate_response`.
+        Los comandos se ejecutan al procesar la respuesta completa, igual que en `generate_response`.
+        """
+        logger.info(f"Generando respuesta en streaming para el prompt: '{prompt[:100]}...' (Usuario ID: {user_id})")
+
+        error_response = await self._check_request(prompt, user_id)
+        if error_response:
+            yield {"type": "final", "response": error_response}
+            return
+        
+        async with get_db() as db:
+            request_context = await self._prepare_request(db, prompt, user_id)
+            if "error_response" in request_context:
+                yield {"type": "final", "response": request_context["error_response"]}
+                return
+            context_result = request_context["context"]
+            
+            marker_filter = StreamingMarkerFilter()
+            sentence_splitter = IncrementalSentenceSplitter()
+            full_response_content = ""
+            try:
+                async for chunk in self._response_handler.stream_llm_response(
+                    context_result["system_prompt"], context_result["prompt_text"]
+                ):
+                    full_response_content += chunk
+                    speakable, commands = marker_filter.feed(chunk)
+                    for event in self._stream_events(speakable, commands, sentence_splitter):
+                        yield event
+            except Exception as e:
+                llm_error = f"Error con Ollama: {e}"
+                logger.error(f"Error en el streaming del LLM: {e}")
+                yield {"type": "final", "response": self._error_response(llm_error, llm_error, user_name=request_context["user_name"], is_owner=request_context["is_owner"])}
+                return
+            
+            speakable, commands = marker_filter.flush()
+            for event in self._stream_events(speakable, commands, sentence_splitter, final=True):
+                yield event
+            
+            if not full_response_content:
+                llm_error = "No se pudo generar una respuesta después de varios intentos."
+                yield {"type": "final", "response": self._error_response(llm_error, llm_error, user_name=request_context["user_name"], is_owner=request_context["is_owner"])}
+                return
+            
+            response = await self._finalize_response(db, prompt, user_id, token, request_context, full_response_content)
+            yield {"type": "final", "response": response}
+
+    @staticmethod
+    def _stream_events(speakable: str, commands: list, sentence_splitter: IncrementalSentenceSplitter, final: bool = False):
+        """Convierte la salida del filtro de marcadores en eventos de streaming."""
+        if speakable:
+            yield {"type": "delta", "text": speakable}
+        sentences = sentence_splitter.feed(speakable) if speakable else []
+        if final:
+            sentences += sentence_splitter.flush()
+        for sentence in sentences:
+            yield {"type": "sentence", "text": sentence}
+        for command in commands:
+            yield {"type": "command", "command": command}
+
+    async def _check_request(self, prompt: str, user_id: int) -> Optional[dict]:
+        """Valida el estado del módulo y la petición. Devuelve una respuesta de error o None."""
         if self._is_closing:
             logger.warning("NLPModule se está cerrando, no se puede generar respuesta.")
             return self._error_response("El módulo NLP se está cerrando.", "Módulo NLP cerrándose")
@@ -201,74 +296,81 @@ class NLPModule:
 
         if user_id is None:
             return self._error_response("user_id es requerido para consultas NLP.", "user_id es requerido")
+        return None
+
+    async def _prepare_request(self, db: AsyncSession, prompt: str, user_id: int) -> dict:
+        """Valida el usuario y prepara el contexto. Devuelve 'error_response' si no se puede continuar."""
+        db_user, user_name, is_owner, user_permissions_str, user_preferences_dict = await self._validate_user(db, user_id)
         
-        # Validar usuario y cargar datos
-        async with get_db() as db:
-            db_user, user_name, is_owner, user_permissions_str, user_preferences_dict = await self._validate_user(db, user_id)
-            
-            if not db_user:
-                return self._error_response("Usuario no autorizado o no encontrado.", "Usuario no autorizado o no encontrado.")
-            
-            # Preparar contexto
-            context_result = await self._context_handler.prepare_context(
-                user_id, prompt, db_user, user_name, is_owner, user_permissions_str, user_preferences_dict
-            )
-            
-            if "error" in context_result:
-                return self._error_response(context_result["error"], context_result["error"], 
-                                          user_name=user_name, is_owner=is_owner)
-            
-            # Generar respuesta del LLM
-            full_response_content, llm_error = await self._response_handler.generate_llm_response(
-                context_result["system_prompt"], context_result["prompt_text"]
-            )
-            
-            if llm_error:
-                return self._error_response(llm_error, llm_error, user_name=user_name, is_owner=is_owner)
-            
-            # Procesar rutinas
-            routine_result = await self._routine_handler.handle_routine_creation(
-                full_response_content, user_id, user_name, is_owner
-            )
-            
-            if routine_result:
-                return self._success_response(
-                    routine_result["response"],
-                    routine_result.get("command"),
-                    user_name=user_name,
-                    is_owner=is_owner
-                )
-            
-            # Procesar respuesta
-            _, iot_commands_db = await self._iot_command_processor.load_commands_from_db(db)
-            
-            if self._memory_brain and user_id and not context_result["has_negation"]:
-                asyncio.create_task(self._routine_handler.execute_automatic_routines(user_id, token))
-            
-            processed_response, extracted_command = await self._response_processor.process_response(
-                db, user_id, full_response_content, token, context_result["has_negation"], iot_commands_db, prompt
+        if not db_user:
+            return {"error_response": self._error_response("Usuario no autorizado o no encontrado.", "Usuario no autorizado o no encontrado.")}
+        
+        # Preparar contexto
+        context_result = await self._context_handler.prepare_context(
+            user_id, prompt, db_user, user_name, is_owner, user_permissions_str, user_preferences_dict
+        )
+        
+        if "error" in context_result:
+            return {"error_response": self._error_response(context_result["error"], context_result["error"], 
+                                                           user_name=user_name, is_owner=is_owner)}
+        
+        return {
+            "db_user": db_user,
+            "user_name": user_name,
+            "is_owner": is_owner,
+            "context": context_result
+        }
+
+    async def _finalize_response(self, db: AsyncSession, prompt: str, user_id: int, token: str, request_context: dict, full_response_content: str) -> dict:
+        """Procesa la respuesta completa del LLM: rutinas, comandos IoT, memoria y Memory Brain."""
+        db_user = request_context["db_user"]
+        user_name = request_context["user_name"]
+        is_owner = request_context["is_owner"]
+        context_result = request_context["context"]
+        
+        # Procesar rutinas
+        routine_result = await self._routine_handler.handle_routine_creation(
+            full_response_content, user_id, user_name, is_owner
+        )
+        
+        if routine_result:
+            return self._success_response(
+                routine_result["response"],
+                routine_result.get("command"),
+                user_name=user_name,
+                is_owner=is_owner
             )
-            
-            # Actualizar contexto de dispositivo
-            self._context_handler.update_device_context(user_id, prompt, extracted_command)
-            
-            # Registrar en Memory Brain (Background)
-            if self._memory_brain and user_id and db_user:
-                asyncio.create_task(self._track_in_memory_brain(user_id, user_name, prompt, processed_response, extracted_command))
-            
-            # Actualizar memoria conversacional (Background)
-            if user_id != 0:
-                asyncio.create_task(self._update_user_memory_background(user_id, prompt, processed_response))
-
-            return {
-                "identified_speaker": user_name or "Desconocido",
-                "response": processed_response,
-                "command": extracted_command,
-                "user_name": user_name,
-                "preference_key": None,
-                "preference_value": None,
-                "is_owner": is_owner
-            }
+        
+        # Procesar respuesta
+        _, iot_commands_db = await self._iot_command_processor.load_commands_from_db(db)
+        
+        if self._memory_brain and user_id and not context_result["has_negation"]:
+            asyncio.create_task(self._routine_handler.execute_automatic_routines(user_id, token))
+        
+        processed_response, extracted_command = await self._response_processor.process_response(
+            db, user_id, full_response_content, token, context_result["has_negation"], iot_commands_db, prompt
+        )
+        
+        # Actualizar contexto de dispositivo
+        self._context_handler.update_device_context(user_id, prompt, extracted_command)
+        
+        # Registrar en Memory Brain (Background)
+        if self._memory_brain and user_id and db_user:
+            asyncio.create_task(self._track_in_memory_brain(user_id, user_name, prompt, processed_response, extracted_command))
+        
+        # Actualizar memoria conversacional (Background)
+        if user_id != 0:
+            asyncio.create_task(self._update_user_memory_background(user_id, prompt, processed_response))
+
+        return {
+            "identified_speaker": user_name or "Desconocido",
+            "response": processed_response,
+            "command": extracted_command,
+            "user_name": user_name,
+            "preference_key": None,
+            "preference_value": None,
+            "is_owner": is_owner
+        }
 
     async def _validate_user(self, db: AsyncSession, user_id: int):
         """Helper para validar usuario"""
@@ -5,6 +5,7 @@ from src.ai.nlp.prompts.prompt_loader import load_system_prompt_template
 from src.ai.nlp.context.device_context import DeviceContextManager
 from src.ai.nlp.prompts.prompt_processor import PromptProcessor
 from src.ai.common.constants import IoTConstants
+from src.ai.nlp.iot.iot_command_catalog import iot_command_catalog
 
 logger = logging.getLogger("ContextHandler")
 
@@ -20,6 +21,8 @@ class ContextHandler:
         self._prompt_processor = PromptProcessor()
         self._system_prompt_data = load_system_prompt_template()
         self._system_prompt_template = self._system_prompt_data["template"]
+        self._static_prompt_template = self._system_prompt_data.get("static_template", self._system_prompt_template)
+        self._dynamic_prompt_template = self._system_prompt_data.get("dynamic_template", "")
         self._routine_creation_instructions = self._system_prompt_data["routine_creation_instructions"]
         self._memory_brain = memory_brain
     
@@ -50,6 +53,9 @@ class ContextHandler:
                 "is_owner": is_owner
             }
         
+        # Con 'prefix_stable' las secciones estáticas van primero y la cola dinámica al final
+        prefix_stable = self._config.get("model", {}).get("prompt_layout", "prefix_stable") == "prefix_stable"
+        
         system_prompt, prompt_text = create_system_prompt(
             config=self._config,
             user_name=user_name,
@@ -61,9 +67,10 @@ class ContextHandler:
             user_preferences_dict=user_preferences_dict,
             prompt=enhanced_prompt,
             conversation_history=formatted_conversation_history,
-            system_prompt_template=self._system_prompt_template,
+            system_prompt_template=self._static_prompt_template if prefix_stable else self._system_prompt_template,
             scheduled_routines_info=scheduled_routines_info,
-            routine_creation_instructions=self._routine_creation_instructions
+            routine_creation_instructions=self._routine_creation_instructions,
+            dynamic_template=self._dynamic_prompt_template if prefix_stable else None
         )
         
         return {
@@ -135,12 +142,10 @@ class ContextHandler:
         return scheduled_routines_info
     
     async def _load_iot_commands(self):
-        """Carga los comandos IoT disponibles"""
+        """Obtiene los comandos IoT disponibles del catálogo en memoria"""
         try:
-            from src.db.database import get_db
-            async with get_db() as db:
-                formatted_iot_commands, iot_commands_db = await self._iot_command_processor.load_commands_from_db(db)
-                return formatted_iot_commands, [cmd.name for cmd in iot_commands_db], None
+            catalog = await iot_command_catalog.ensure_built()
+            return catalog.formatted_commands, catalog.command_names, None
         except Exception as e:
             error_msg = "Error al cargar comandos IoT."
             logger.error(f"No se pudieron cargar los comandos IoT: {e}")
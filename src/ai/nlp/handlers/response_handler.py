@@ -1,12 +1,54 @@
 import asyncio
 import logging
-from typing import Optional, Dict, Tuple, Any
+import time
+from typing import Optional, Dict, Tuple, Any, AsyncIterator
 from ollama import ResponseError
 from httpx import ConnectError
 from src.ai.nlp.core.ollama_manager import OllamaManager
 
 logger = logging.getLogger("ResponseHandler")
 
+class PromptEvalMetrics:
+    """
+    Métricas de evaluación del prompt reportadas por Ollama.
+
+    `prompt_eval_count` solo cuenta los tokens del prompt que Ollama tuvo que evaluar:
+    si el prefijo se reutiliza desde la caché KV, el valor baja a la cola dinámica.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.total_prompt_eval_tokens = 0
+        self.total_prompt_eval_ms = 0.0
+        self.total_first_token_ms = 0.0
+        self.last: Dict[str, Any] = {}
+
+    def record(self, prompt_eval_count: Optional[int], prompt_eval_duration_ns: Optional[int], eval_count: Optional[int], first_token_ms: Optional[float]) -> None:
+        prompt_eval_ms = (prompt_eval_duration_ns or 0) / 1_000_000
+        self.requests += 1
+        self.total_prompt_eval_tokens += prompt_eval_count or 0
+        self.total_prompt_eval_ms += prompt_eval_ms
+        self.total_first_token_ms += first_token_ms or 0.0
+        self.last = {
+            "prompt_eval_count": prompt_eval_count,
+            "prompt_eval_ms": round(prompt_eval_ms, 1),
+            "eval_count": eval_count,
+            "first_token_ms": round(first_token_ms, 1) if first_token_ms is not None else None
+        }
+        logger.info(f"Prompt evaluado: {prompt_eval_count} tokens en {prompt_eval_ms:.1f} ms, primer token en {self.last['first_token_ms']} ms")
+
+    def get_stats(self) -> Dict[str, Any]:
+        requests = self.requests or 1
+        return {
+            "requests": self.requests,
+            "avg_prompt_eval_tokens": round(self.total_prompt_eval_tokens / requests, 1),
+            "avg_prompt_eval_ms": round(self.total_prompt_eval_ms / requests, 1),
+            "avg_first_token_ms": round(self.total_first_token_ms / requests, 1),
+            "last": self.last
+        }
+
+prompt_eval_metrics = PromptEvalMetrics()
+
 class ResponseHandler:
     """Gestiona la comunicación con Ollama y la generación de respuestas del LLM."""
     
@@ -14,35 +56,49 @@ class ResponseHandler:
         self._ollama_manager = ollama_manager
         self._config = config
     
+    async def _open_chat_stream(self, system_prompt: str, prompt_text: str, llm_timeout: float):
+        client = self._ollama_manager.get_async_client()
+        return await asyncio.wait_for(client.chat(
+            model=self._config["model"]["name"],
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt_text}
+            ],
+            options={
+                "temperature": self._config["model"]["temperature"],
+                "num_predict": self._config["model"]["max_tokens"],
+                "top_p": self._config["model"].get("top_p"),
+                "top_k": self._config["model"].get("top_k"),
+                "repeat_penalty": self._config["model"].get("repeat_penalty"),
+                "num_ctx": self._config["model"].get("num_ctx"),
+            },
+            stream=True,
+        ), timeout=llm_timeout)
+
     async def generate_llm_response(self, system_prompt: str, prompt_text: str) -> Tuple[Optional[str], Optional[str]]:
         """Obtiene la respuesta del modelo de lenguaje"""
-        client = self._ollama_manager.get_async_client()
         retries = self._config["model"].get("llm_retries", 2)
         llm_timeout = self._config["model"].get("llm_timeout", 60)
 
         for attempt in range(retries):
             try:
-                response_stream = await asyncio.wait_for(client.chat(
-                    model=self._config["model"]["name"],
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": prompt_text}
-                    ],
-                    options={
-                        "temperature": self._config["model"]["temperature"],
-                        "num_predict": self._config["model"]["max_tokens"],
-                        "top_p": self._config["model"].get("top_p"),
-                        "top_k": self._config["model"].get("top_k"),
-                        "repeat_penalty": self._config["model"].get("repeat_penalty"),
-                        "num_ctx": self._config["model"].get("num_ctx"),
-                    },
-                    stream=True,
-                ), timeout=llm_timeout)
+                started_at = time.perf_counter()
+                response_stream = await self._open_chat_stream(system_prompt, prompt_text, llm_timeout)
 
                 full_response_content = ""
+                first_token_ms = None
                 async for chunk in response_stream:
                     if "content" in chunk["message"]:
+                        if first_token_ms is None and chunk["message"]["content"]:
+                            first_token_ms = (time.perf_counter() - started_at) * 1000
                         full_response_content += chunk["message"]["content"]
+                    if chunk.get("done"):
+                        prompt_eval_metrics.record(
+                            chunk.get("prompt_eval_count"),
+                            chunk.get("prompt_eval_duration"),
+                            chunk.get("eval_count"),
+                            first_token_ms
+                        )
 
                 if not full_response_content:
                     logger.warning("Respuesta vacía de Ollama. Reintentando...")
@@ -59,6 +115,52 @@ class ResponseHandler:
         
         return None, "No se pudo generar una respuesta después de varios intentos."
     
+    async def stream_llm_response(self, system_prompt: str, prompt_text: str) -> AsyncIterator[str]:
+        """
+        Entrega los fragmentos de texto del modelo a medida que se generan.
+
+        Solo se reintenta si el error ocurre antes del primer fragmento; una vez entregado
+        texto, un error corta el streaming con la excepción original.
+        """
+        retries = self._config["model"].get("llm_retries", 2)
+        llm_timeout = self._config["model"].get("llm_timeout", 60)
+
+        for attempt in range(retries):
+            yielded = False
+            try:
+                started_at = time.perf_counter()
+                response_stream = await self._open_chat_stream(system_prompt, prompt_text, llm_timeout)
+
+                first_token_ms = None
+                async for chunk in response_stream:
+                    content = chunk["message"]["content"] if "content" in chunk["message"] else None
+                    if content:
+                        if first_token_ms is None:
+                            first_token_ms = (time.perf_counter() - started_at) * 1000
+                        yielded = True
+                        yield content
+                    if chunk.get("done"):
+                        prompt_eval_metrics.record(
+                            chunk.get("prompt_eval_count"),
+                            chunk.get("prompt_eval_duration"),
+                            chunk.get("eval_count"),
+                            first_token_ms
+                        )
+
+                if yielded:
+                    return
+                logger.warning("Respuesta vacía de Ollama en streaming. Reintentando...")
+
+            except (ResponseError, ConnectError, asyncio.TimeoutError) as e:
+                error_type = "Timeout" if isinstance(e, asyncio.TimeoutError) else "Error con Ollama"
+                logger.error(f"{error_type} en streaming: {e}.")
+                if yielded or attempt == retries - 1:
+                    raise
+        
+    def get_prompt_eval_stats(self) -> Dict[str, Any]:
+        """Devuelve las métricas acumuladas de evaluación del prompt"""
+        return prompt_eval_metrics.get_stats()
+    
     def is_online(self) -> bool:
         """Devuelve True si Ollama está online"""
         return self._ollama_manager.is_online()
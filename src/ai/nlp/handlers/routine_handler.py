@@ -250,7 +250,7 @@ class RoutineHandler:
                                 if self._tts_module and self._tts_module.is_online():
                                     logger.info(f"Enviando mensaje TTS de rutina automática: {message}")
                                     try:
-                                        await self._tts_module.generate_audio_stream(message)
+                                        await self._tts_module.speak(message)
                                         executed_actions_summary.append(f"TTS: '{message}'")
                                     except Exception as tts_e:
                                         logger.error(f"Error al enviar mensaje TTS de rutina automática: {tts_e}")
@@ -308,7 +308,7 @@ class RoutineHandler:
                     if self._tts_module and self._tts_module.is_online():
                         logger.info(f"Enviando mensaje TTS de rutina por nombre: {message}")
                         try:
-                            await self._tts_module.generate_audio_stream(message)
+                            await self._tts_module.speak(message)
                             executed_actions_summary.append(f"TTS: '{message}'")
                         except Exception as tts_e:
                             logger.error(f"Error al enviar mensaje TTS de rutina por nombre: {tts_e}")
@@ -0,0 +1,138 @@
+import difflib
+import logging
+import re
+from typing import List, Tuple
+
+logger = logging.getLogger("StreamProcessor")
+
+# Marcadores que el LLM emite para acciones internas; nunca deben llegar al TTS
+STREAM_MARKERS = (
+    "mqtt_publish:",
+    "iot_command:",
+    "preference_set:",
+    "memory_search:",
+    "name_change:",
+    "temperature_get",
+    "routine_list:",
+)
+_MAX_MARKER_PREFIX = max(len(marker) for marker in STREAM_MARKERS) - 1
+
+# Un comando mqtt_publish está completo cuando le sigue un espacio o salto de línea
+COMPLETED_IOT_COMMAND_REGEX = re.compile(r"(?:iot_command|mqtt_publish):([^\s]+)\s")
+IOT_COMMAND_TAIL_REGEX = re.compile(r"(?:iot_command|mqtt_publish):([^\s]+)$")
+
+
+class StreamingMarkerFilter:
+    """
+    Separa en streaming el texto hablable de los marcadores de comandos del LLM.
+
+    El texto anterior al primer marcador se entrega en cuanto llega; si el final de un
+    fragmento puede ser el comienzo de un marcador (p. ej. 'mqtt_pub'), se retiene hasta
+    el siguiente fragmento. Desde el primer marcador en adelante nada se entrega como
+    texto hablable y los comandos `mqtt_publish:` se detectan en cuanto están completos.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._marker_text = ""
+        self._in_marker = False
+        self._emitted_commands = 0
+
+    @property
+    def marker_detected(self) -> bool:
+        return self._in_marker
+
+    def feed(self, chunk: str) -> Tuple[str, List[str]]:
+        """
+        Procesa un fragmento del LLM.
+
+        Returns:
+            Tuple[str, List[str]]: Texto hablable nuevo y comandos IoT completados en este fragmento.
+        """
+        if self._in_marker:
+            self._marker_text += chunk
+            return "", self._pop_completed_commands()
+
+        text = self._pending + chunk
+        marker_index = min((i for i in (text.find(marker) for marker in STREAM_MARKERS) if i >= 0), default=-1)
+        if marker_index >= 0:
+            self._in_marker = True
+            self._pending = ""
+            self._marker_text = text[marker_index:]
+            logger.debug(f"Marcador de comando detectado en streaming: '{self._marker_text[:30]}'")
+            return text[:marker_index], self._pop_completed_commands()
+
+        hold = self._marker_prefix_length(text)
+        self._pending = text[len(text) - hold:] if hold else ""
+        return text[:len(text) - hold], []
+
+    def flush(self) -> Tuple[str, List[str]]:
+        """Entrega el texto retenido y los comandos pendientes al terminar el streaming."""
+        if not self._in_marker:
+            rest, self._pending = self._pending, ""
+            return rest, []
+        commands = self._pop_completed_commands()
+        tail = IOT_COMMAND_TAIL_REGEX.search(self._marker_text)
+        if tail:
+            commands.append(tail.group(0))
+            self._emitted_commands += 1
+        return "", commands
+
+    def _pop_completed_commands(self) -> List[str]:
+        completed = [m.group(0).strip() for m in COMPLETED_IOT_COMMAND_REGEX.finditer(self._marker_text)]
+        new_commands = completed[self._emitted_commands:]
+        self._emitted_commands = len(completed)
+        return new_commands
+
+    @staticmethod
+    def _marker_prefix_length(text: str) -> int:
+        """Longitud del sufijo de `text` que podría ser el comienzo de un marcador."""
+        for length in range(min(_MAX_MARKER_PREFIX, len(text)), 0, -1):
+            suffix = text[-length:]
+            if any(marker.startswith(suffix) for marker in STREAM_MARKERS):
+                return length
+        return 0
+
+
+# Coincidencias más cortas que esto (en palabras) no cuentan como texto ya hablado
+_MIN_SPOKEN_MATCH_WORDS = 3
+
+
+def _comparable_word(word: str) -> str:
+    return re.sub(r"[^\w]", "", word.lower())
+
+
+def unspoken_remainder(final_response: str, streamed_text: str) -> str:
+    """
+    Devuelve la parte de la respuesta final que no se ha reproducido durante el streaming.
+
+    Se comparan palabra a palabra (sin mayúsculas ni puntuación) la respuesta procesada y
+    el texto ya hablado, y solo se devuelven los tramos de la respuesta que no estaban en
+    él: la continuación, el resultado de un comando insertado en medio o una respuesta que
+    sustituyó por completo a la hablada. Los cambios de limpieza (espacios, puntuación) no
+    hacen que se repita nada.
+    """
+    final_words = (final_response or "").split()
+    streamed_words = [_comparable_word(word) for word in (streamed_text or "").split()]
+    streamed_words = [word for word in streamed_words if word]
+    if not streamed_words:
+        return " ".join(final_words)
+
+    comparable = [_comparable_word(word) for word in final_words]
+    indexed = [(index, word) for index, word in enumerate(comparable) if word]
+    matcher = difflib.SequenceMatcher(None, [word for _, word in indexed], streamed_words, autojunk=False)
+    min_match = min(_MIN_SPOKEN_MATCH_WORDS, len(streamed_words))
+    spoken = set()
+    for block in matcher.get_matching_blocks():
+        if block.size >= min_match:
+            spoken.update(indexed[position][0] for position in range(block.a, block.a + block.size))
+
+    # Las palabras sin contenido comparable (p. ej. un guion suelto) siguen a su vecina anterior
+    remainder = []
+    previous_spoken = True
+    for index, word in enumerate(final_words):
+        is_spoken = index in spoken if comparable[index] else previous_spoken
+        if not is_spoken:
+            remainder.append(word)
+        previous_spoken = is_spoken
+    return " ".join(remainder)
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.db.models import IoTCommand
+
+logger = logging.getLogger("IoTCommandCatalog")
+
+NO_COMMANDS_TEXT = "No hay comandos IoT registrados."
+
+
+class IoTCommandCatalog:
+    """
+    Catálogo versionado de comandos IoT.
+
+    Guarda las filas de `iot_commands`, el bloque de comandos ya formateado para el
+    prompt, la lista de nombres e índices por (mqtt_topic, command_payload) y por nombre.
+    Se construye una vez y solo se reconstruye tras `invalidate()`, que llaman las rutas
+    de creación y borrado de comandos; las consultas NLP no hacen trabajo de BD para él.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._built_version = -1
+        self._build_lock = asyncio.Lock()
+        self.commands: List[IoTCommand] = []
+        self.formatted_commands = NO_COMMANDS_TEXT
+        self.command_names: List[str] = []
+        self._by_topic_payload: Dict[Tuple[str, str], IoTCommand] = {}
+        self._by_name: Dict[str, IoTCommand] = {}
+
+    @property
+    def is_stale(self) -> bool:
+        return self._built_version != self.version
+
+    def invalidate(self) -> None:
+        """Marca el catálogo como obsoleto; se reconstruirá en el siguiente acceso."""
+        self.version += 1
+        logger.debug(f"Catálogo de comandos IoT invalidado (versión {self.version})")
+
+    async def ensure_built(self, db: Optional[AsyncSession] = None) -> "IoTCommandCatalog":
+        """
+        Reconstruye el catálogo si está obsoleto.
+
+        Args:
+            db (Optional[AsyncSession]): Sesión a reutilizar. Si no se indica, se abre una.
+        """
+        if not self.is_stale:
+            return self
+        async with self._build_lock:
+            if not self.is_stale:
+                return self
+            version = self.version
+            if db is not None:
+                commands = await self._fetch(db)
+            else:
+                from src.db.database import get_db
+                async with get_db() as session:
+                    commands = await self._fetch(session)
+            self._build(commands, version)
+        return self
+
+    @staticmethod
+    async def _fetch(db: AsyncSession) -> List[IoTCommand]:
+        result = await db.execute(select(IoTCommand))
+        return list(result.scalars().all())
+
+    def _build(self, commands: List[IoTCommand], version: int) -> None:
+        formatted_commands = (
+            "\n".join(f"- {cmd.name}: mqtt_publish:{cmd.mqtt_topic},{cmd.command_payload}" for cmd in commands)
+            if commands
+            else NO_COMMANDS_TEXT
+        )
+        # Se asigna todo junto para que ningún lector vea un catálogo a medio construir
+        self.commands = commands
+        self.formatted_commands = formatted_commands
+        self.command_names = [cmd.name for cmd in commands]
+        self._by_topic_payload = {(cmd.mqtt_topic, cmd.command_payload): cmd for cmd in reversed(commands)}
+        self._by_name = {cmd.name: cmd for cmd in reversed(commands)}
+        self._built_version = version
+        logger.info(f"Catálogo de comandos IoT construido con {len(commands)} comandos (versión {version})")
+
+    def find_by_topic_payload(self, mqtt_topic: str, command_payload: str) -> Optional[IoTCommand]:
+        return self._by_topic_payload.get((mqtt_topic, command_payload))
+
+    def find_by_name(self, name: str) -> Optional[IoTCommand]:
+        return self._by_name.get(name)
+
+
+iot_command_catalog = IoTCommandCatalog()
@@ -1,18 +1,18 @@
 import asyncio
 import logging
 import re
-import httpx
-import src.db.models as models
+from fastapi import HTTPException
 from typing import Optional, Tuple
 from collections import defaultdict
 import time
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from src.db.models import IoTCommand
 from src.iot.mqtt_client import MQTTClient
 from src.ai.nlp.iot.iot_command_cache import IoTCommandCache
+from src.ai.nlp.iot.iot_command_catalog import iot_command_catalog
 import json
-from src.iot.device_manager import get_device_state, _extract_device_info_from_topic, get_known_locations, get_all_device_types
+from src.iot.device_manager import _extract_device_info_from_topic, get_known_locations, get_all_device_types
+from src.iot.device_state_store import device_state_store
+from src.services.command_dispatcher import command_dispatcher
 from src.ai.common.constants import IoTConstants
 
 logger = logging.getLogger("IoTCommandProcessor")
@@ -64,8 +64,9 @@ class IoTCommandProcessor:
 
         logger.info("Pre-cargando cache de comandos IoT...")
         try:
-            result = await db.execute(select(models.IoTCommand))
-            iot_commands_db = result.scalars().all()
+            iot_command_catalog.invalidate()
+            await iot_command_catalog.ensure_built(db)
+            iot_commands_db = iot_command_catalog.commands
             self.iot_commands = []
             
             for cmd in iot_commands_db:
@@ -115,6 +116,7 @@ class IoTCommandProcessor:
         else:
             self._command_cache.clear()
             logger.debug("Cache de comandos IoT completamente invalidado")
+        iot_command_catalog.invalidate()
 
     def _parse_iot_command(self, command_str: str) -> Tuple[bool, str, Optional[dict]]:
         """Parsea un comando IoT y devuelve sus componentes."""
@@ -353,13 +355,8 @@ class IoTCommandProcessor:
             logger.info(f"Comando IoT: topic='{topic}', payload='{payload}'")
             
             try:
-                result = await db.execute(
-                    select(IoTCommand).filter(
-                        IoTCommand.mqtt_topic == topic,
-                        IoTCommand.command_payload == payload
-                    )
-                )
-                db_command = result.scalars().first()
+                await iot_command_catalog.ensure_built(db)
+                db_command = iot_command_catalog.find_by_topic_payload(topic, payload)
             except Exception as e:
                 logger.error(f"Error al buscar comando en BD: {e}")
                 return f"Error al buscar comando: {str(e)}"
@@ -368,9 +365,10 @@ class IoTCommandProcessor:
             device_type, device_name, _ = _extract_device_info_from_topic(topic, payload)
 
             if device_name and device_type:
-                current_device_state = await get_device_state(db, device_name, device_type)
+                await device_state_store.ensure_loaded()
+                current_device_state = device_state_store.get(device_type, device_name)
                 if current_device_state:
-                    current_status = json.loads(current_device_state.state_json).get("status")
+                    current_status = current_device_state.get("status")
                     desired_status = payload.upper() # Asumiendo que el payload es el estado deseado (ON/OFF/OPEN/CLOSE)
 
                     if current_status == desired_status:
@@ -388,20 +386,8 @@ class IoTCommandProcessor:
                 return "Tipo de comando no soportado."
             
             try:
-                arduino_command = {
-                    "mqtt_topic": db_command.mqtt_topic,
-                    "command_payload": db_command.command_payload
-                }
-                headers = {"Authorization": f"Bearer {token}"}
-                
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        "http://localhost:8000/iot/arduino/send_command",
-                        json=arduino_command,
-                        headers=headers,
-                        timeout=10
-                    )
-                    response.raise_for_status()
+                user = await command_dispatcher.resolve_user(user_id=user_id, token=token)
+                await command_dispatcher.dispatch(db_command.mqtt_topic, db_command.command_payload, user)
                 
                 if user_id:
                     self._record_command(user_id)
@@ -409,11 +395,8 @@ class IoTCommandProcessor:
                 logger.info(f"Comando ejecutado: {db_command.name}")
                 return f"OK {db_command.name}"
 
-            except httpx.TimeoutException:
-                logger.error("Timeout al enviar comando a Arduino")
-                return "Error: Timeout al enviar comando a Arduino."
-            except httpx.HTTPStatusError as e:
-                logger.error(f"Error HTTP: {e.response.status_code}")
+            except HTTPException as e:
+                logger.error(f"Error HTTP: {e.status_code} - {e.detail}")
                 return "Error: No se pudo ejecutar el comando."
             except Exception as e:
                 logger.error(f"Error al ejecutar comando: {e}")
@@ -423,16 +406,10 @@ class IoTCommandProcessor:
         return None
 
     async def load_commands_from_db(self, db: AsyncSession) -> Tuple[str, list]:
-        """Carga y formatea comandos IoT desde la base de datos."""
+        """Devuelve los comandos IoT formateados y sus filas desde el catálogo en memoria."""
         try:
-            result = await db.execute(select(models.IoTCommand))
-            iot_commands_db = result.scalars().all()
-            formatted_commands = (
-                "\n".join([f"- {cmd.name}: mqtt_publish:{cmd.mqtt_topic},{cmd.command_payload}" for cmd in iot_commands_db])
-                if iot_commands_db
-                else "No hay comandos IoT registrados."
-            )
-            return formatted_commands, iot_commands_db
+            await iot_command_catalog.ensure_built(db)
+            return iot_command_catalog.formatted_commands, iot_command_catalog.commands
         except Exception as e:
             logger.error(f"Error al cargar comandos IoT de la base de datos: {e}")
             raise
@@ -450,13 +427,8 @@ class IoTCommandProcessor:
         payload = command_parts["payload"]
         
         try:
-            result = await db.execute(
-                select(IoTCommand).filter(
-                    IoTCommand.mqtt_topic == topic,
-                    IoTCommand.command_payload == payload
-                )
-            )
-            db_command = result.scalars().first()
+            await iot_command_catalog.ensure_built(db)
+            db_command = iot_command_catalog.find_by_topic_payload(topic, payload)
         except Exception as e:
             logger.error(f"Error al validar comando: {e}")
             return False, f"Error al validar comando: {str(e)}"
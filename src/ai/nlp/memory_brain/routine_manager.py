@@ -1,16 +1,11 @@
 import logging
-import os
-import asyncio
-import wave
-import pyaudio
 from datetime import datetime
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Tuple
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.db.models import Routine, IoTCommand
-import httpx
-from src.auth.auth_service import AuthService
+from src.services.command_dispatcher import command_dispatcher
 
 logger = logging.getLogger("RoutineManager")
 
@@ -193,100 +188,45 @@ class RoutineManager:
                 elif a.startswith('mqtt_publish:'):
                     mqtt_actions_in_routine.append(a)
 
-        token = None
-        try:
-            auth_service = AuthService(db)
-            token_data = await auth_service.authenticate_user_by_id(routine.user_id)
-            token = token_data.get("access_token")
-        except Exception as e:
-            logger.error(f"Error obteniendo token para usuario {routine.user_id}: {e}")
+        commands: List[Tuple[str, str]] = [(cmd.mqtt_topic, cmd.command_payload) for cmd in routine.iot_commands]
+        # Si no hay comandos IoT asociados pero existen acciones mqtt_publish en 'actions', procesarlas
+        if not routine.iot_commands and mqtt_actions_in_routine:
+            for action in mqtt_actions_in_routine:
+                command_part = action.replace('mqtt_publish:', '', 1).strip()
+                if ',' in command_part:
+                    topic, payload_value = command_part.split(',', 1)
+                    commands.append((topic.strip(), payload_value.strip()))
+                else:
+                    logger.warning(f"Formato inválido de mqtt_publish en acciones: '{command_part}'")
 
-        if token:
-            headers = {"Authorization": f"Bearer {token}"}
+        if commands:
             try:
-                async with httpx.AsyncClient() as client:
-                    for cmd in routine.iot_commands:
-                        payload = {"mqtt_topic": cmd.mqtt_topic, "command_payload": cmd.command_payload}
-                        try:
-                            response = await client.post(
-                                "http://localhost:8000/iot/arduino/send_command",
-                                json=payload,
-                                headers=headers,
-                                timeout=10
-                            )
-                            response.raise_for_status()
-                            logger.info(f"Comando enviado: {cmd.name}")
-                        except Exception as e:
-                            logger.error(f"Error enviando comando {cmd.name}: {e}")
-                    # Si no hay comandos IoT asociados pero existen acciones mqtt_publish en 'actions', procesarlas
-                    if not routine.iot_commands and mqtt_actions_in_routine:
-                        for action in mqtt_actions_in_routine:
-                            try:
-                                command_part = action.replace('mqtt_publish:', '', 1).strip()
-                                if ',' in command_part:
-                                    topic, payload_value = command_part.split(',', 1)
-                                else:
-                                    logger.warning(f"Formato inválido de mqtt_publish en acciones: '{command_part}'")
-                                    continue
-                                payload = {"mqtt_topic": topic.strip(), "command_payload": payload_value.strip()}
-                                response = await client.post(
-                                    "http://localhost:8000/iot/arduino/send_command",
-                                    json=payload,
-                                    headers=headers,
-                                    timeout=10
-                                )
-                                response.raise_for_status()
-                                logger.info(f"Comando MQTT por acciones enviado: {topic.strip()} -> {payload_value.strip()}")
-                            except Exception as e:
-                                logger.error(f"Error enviando acción MQTT desde acciones: {e}")
+                user = await command_dispatcher.resolve_user(user_id=routine.user_id)
+                results = await command_dispatcher.dispatch_many(commands, user)
+                for result in results:
+                    if result["success"]:
+                        logger.info(f"Comando enviado: {result['topic']} -> {result['payload']}")
+                    else:
+                        logger.error(f"Error enviando comando {result['topic']} -> {result['payload']}: {result['error']}")
             except Exception as e:
-                logger.error(f"Error inicializando cliente HTTP para ejecutar rutina {routine.id}: {e}")
+                logger.error(f"Error ejecutando comandos IoT de la rutina {routine.id}: {e}")
 
-        # Ejecutar TTS si hay mensajes
+        # Ejecutar TTS si hay mensajes (síntesis en memoria y salida de audio persistente)
         if tts_messages:
-            device_api_key = os.getenv("DEVICE_API_KEY")
-            if not device_api_key:
-                logger.error("DEVICE_API_KEY no configurado; no se pueden ejecutar acciones TTS de rutinas")
+            from src.api import utils
+            tts_module = utils._tts_module
+            if tts_module is None or not tts_module.is_online():
+                logger.error("Módulo TTS no disponible; no se pueden ejecutar acciones TTS de rutinas")
             else:
-                tts_headers = {"X-Device-API-Key": device_api_key}
-                try:
-                    async with httpx.AsyncClient() as client:
-                        for msg in tts_messages:
-                            try:
-                                response = await client.post(
-                                    "http://localhost:8000/tts/tts/generate_audio",
-                                    json={"text": msg},
-                                    headers=tts_headers,
-                                    timeout=30
-                                )
-                                response.raise_for_status()
-                                try:
-                                    data = response.json()
-                                    paths = data.get("audio_file_paths", []) if isinstance(data, dict) else []
-                                except Exception:
-                                    paths = []
-                                if paths:
-                                    for p in paths:
-                                        try:
-                                            logger.info(f"Reproduciendo audio TTS de rutina {routine.id}: {p}")
-                                            success = await asyncio.to_thread(self._play_audio_wav, p)
-                                            if success:
-                                                logger.info(f"Audio TTS reproducido: {p}")
-                                            else:
-                                                logger.error(f"Error reproduciendo audio TTS: {p}")
-                                        finally:
-                                            try:
-                                                if os.path.exists(p):
-                                                    os.remove(p)
-                                                    logger.info(f"Audio temporal eliminado: {p}")
-                                            except Exception as e:
-                                                logger.error(f"Error eliminando audio temporal {p}: {e}")
-                                else:
-                                    logger.info(f"TTS ejecutado para rutina {routine.id}: '{msg}'")
-                            except Exception as e:
-                                logger.error(f"Error ejecutando TTS para rutina {routine.id}: {e}")
-                except Exception as e:
-                    logger.error(f"Error inicializando cliente HTTP para TTS en rutina {routine.id}: {e}")
+                for msg in tts_messages:
+                    try:
+                        logger.info(f"Reproduciendo TTS de rutina {routine.id}: '{msg}'")
+                        if await tts_module.speak(msg):
+                            logger.info(f"TTS ejecutado para rutina {routine.id}: '{msg}'")
+                        else:
+                            logger.error(f"Error reproduciendo TTS de rutina {routine.id}: '{msg}'")
+                    except Exception as e:
+                        logger.error(f"Error ejecutando TTS para rutina {routine.id}: {e}")
 
         routine.last_executed = datetime.now()
         routine.execution_count += 1
@@ -294,52 +234,6 @@ class RoutineManager:
         logger.info(f"Rutina ejecutada: {routine.name}")
         return command_names
 
-    def _play_audio_wav(self, file_path: str) -> bool:
-        if not os.path.exists(file_path):
-            logger.error(f"Archivo de audio no encontrado: {file_path}")
-            return False
-        p = None
-        stream = None
-        wf = None
-        try:
-            wf = wave.open(file_path, 'rb')
-            p = pyaudio.PyAudio()
-            if wf.getsampwidth() not in [1, 2, 4]:
-                logger.error(f"Formato de audio inválido en {file_path}")
-                return False
-            stream = p.open(
-                format=p.get_format_from_width(wf.getsampwidth()),
-                channels=wf.getnchannels(),
-                rate=wf.getframerate(),
-                output=True
-            )
-            chunk_size = 1024
-            data = wf.readframes(chunk_size)
-            while len(data) > 0:
-                stream.write(data)
-                data = wf.readframes(chunk_size)
-            return True
-        except Exception as e:
-            logger.error(f"Error al reproducir audio {file_path}: {e}")
-            return False
-        finally:
-            if stream is not None:
-                try:
-                    stream.stop_stream()
-                    stream.close()
-                except Exception:
-                    pass
-            if p is not None:
-                try:
-                    p.terminate()
-                except Exception:
-                    pass
-            if wf is not None:
-                try:
-                    wf.close()
-                except Exception:
-                    pass
-
     async def check_routine_triggers(
         self, 
         db: AsyncSession, 
@@ -1,10 +1,29 @@
 import logging
 from datetime import datetime
-from typing import Any
+from typing import Any, Dict, Optional, Tuple
 from src.utils.datetime_utils import get_current_datetime, format_date_human_readable, format_time_only, get_country_from_timezone
 
 logger = logging.getLogger("PromptCreator")
 
+# Valores que no cambian entre peticiones mientras no cambie la configuración o el catálogo de comandos
+STATIC_PROMPT_KEYS = ("assistant_name", "language", "iot_commands", "iot_command_names", "capabilities", "routine_creation_instructions")
+
+# Último prefijo estático renderizado: (clave, texto)
+_static_prefix_cache: Tuple[Optional[tuple], str] = (None, "")
+
+def _render_static_prefix(static_template: str, format_dict: Dict[str, str]) -> str:
+    """Renderiza el prefijo estático, reutilizando el último resultado si los valores no cambiaron."""
+    global _static_prefix_cache
+    static_values = tuple(format_dict[key] for key in STATIC_PROMPT_KEYS)
+    cache_key = (static_template, static_values)
+    if _static_prefix_cache[0] == cache_key:
+        return _static_prefix_cache[1]
+
+    static_prefix = static_template.format(**{key: format_dict[key] for key in STATIC_PROMPT_KEYS})
+    _static_prefix_cache = (cache_key, static_prefix)
+    logger.debug("Prefijo estático del system_prompt renderizado de nuevo.")
+    return static_prefix
+
 def _safe_format_value(value: Any) -> str:
     """Convierte valores a strings seguros para formateo del system prompt."""
     if value is None:
@@ -58,11 +77,16 @@ def create_system_prompt(
     system_prompt_template: str,
     conversation_history: str = "",
     scheduled_routines_info: str = "",
-    routine_creation_instructions: str = ""
+    routine_creation_instructions: str = "",
+    dynamic_template: Optional[str] = None
 ) -> tuple[str, str]:
     """
     Crea el system_prompt y el prompt_text para Ollama.
     Valida que el template esté correctamente formado antes de formatear.
+
+    Si se indica `dynamic_template`, `system_prompt_template` debe contener solo secciones
+    estáticas: el resultado es un prefijo idéntico entre peticiones (que Ollama puede
+    reutilizar de su caché KV) seguido de la cola dinámica de la petición.
     """
     logger.debug("Construyendo system_prompt para Ollama.")
     
@@ -115,7 +139,17 @@ def create_system_prompt(
     }
 
     try:
-        system_prompt = system_prompt_template.format(**format_dict)
+        if dynamic_template is not None:
+            try:
+                static_prefix = _render_static_prefix(system_prompt_template, format_dict)
+            except KeyError as e:
+                # El template estático usa valores dinámicos: se formatea completo, sin prefijo estable
+                logger.warning(f"El template estático contiene la clave dinámica {e}; se desactiva el prefijo estable.")
+                static_prefix = system_prompt_template.format(**format_dict)
+            dynamic_tail = dynamic_template.format(**format_dict)
+            system_prompt = f"{static_prefix}\n\n{dynamic_tail}" if dynamic_tail else static_prefix
+        else:
+            system_prompt = system_prompt_template.format(**format_dict)
         logger.debug("System_prompt construido correctamente.")
     except KeyError as e:
         logger.error(f"Error: Clave de formato no encontrada en el template: {e}")
@@ -13,6 +13,10 @@ except ImportError:
 
 YAML_PATH = os.path.join(os.path.dirname(__file__), "system_prompt.yaml")
 
+# Secciones con valores que cambian en cada petición (hora, usuario, historial).
+# Se ensamblan aparte, después del resto, para que el prefijo del prompt sea idéntico entre llamadas.
+DYNAMIC_SECTION_KEYS = ["request_context"]
+
 def load_system_prompt_template() -> Dict[str, str]:
     """
     Carga el template del system prompt desde YAML si está disponible,
@@ -27,6 +31,8 @@ def load_system_prompt_template() -> Dict[str, str]:
     from src.ai.nlp.system_prompt import SYSTEM_PROMPT_TEMPLATE
     return {
         "template": SYSTEM_PROMPT_TEMPLATE,
+        "static_template": SYSTEM_PROMPT_TEMPLATE,
+        "dynamic_template": "",
         "routine_creation_instructions": "" # Fallback for routine creation instructions
     }
 
@@ -80,7 +86,7 @@ def _load_from_yaml() -> Optional[Dict[str, str]]:
 
         # Incluir cualquier otra sección que exista en el YAML y no esté en ordered_keys
         for key, value in sections.items():
-            if key not in ordered_keys:
+            if key not in ordered_keys and key not in DYNAMIC_SECTION_KEYS:
                 combined_parts.append(value)
 
         combined_prompt = "\n\n".join(combined_parts)
@@ -89,8 +95,13 @@ def _load_from_yaml() -> Optional[Dict[str, str]]:
         if footer:
             combined_prompt += f"\n\n{footer}"
 
+        static_template = combined_prompt.strip()
+        dynamic_template = "\n\n".join(sections[k] for k in DYNAMIC_SECTION_KEYS if k in sections).strip()
+
         return {
-            "template": combined_prompt.strip(),
+            "template": f"{static_template}\n\n{dynamic_template}".strip(),
+            "static_template": static_template,
+            "dynamic_template": dynamic_template,
             "routine_creation_instructions": routine_creation_instructions_content
         }
 
@@ -1,6 +1,7 @@
 import logging
 from typing import Tuple, Optional, Any
 from src.db.database import get_db
+from src.ai.nlp.iot.iot_command_catalog import iot_command_catalog
 
 logger = logging.getLogger("ValidationHelper")
 
@@ -23,11 +24,10 @@ class ValidationHelper:
             return db_user, db_user.nombre, db_user.is_owner, user_permissions_str, user_preferences_dict
     
     async def load_iot_commands(self, iot_processor) -> Tuple[Optional[Any], Optional[list[str]], Optional[str]]:
-        """Carga los comandos IoT desde la base de datos"""
+        """Obtiene los comandos IoT del catálogo en memoria"""
         try:
-            async with get_db() as db:
-                formatted_iot_commands, iot_commands_db = await iot_processor.load_commands_from_db(db)
-                return formatted_iot_commands, [cmd.name for cmd in iot_commands_db], None
+            catalog = await iot_command_catalog.ensure_built()
+            return catalog.formatted_commands, catalog.command_names, None
         except Exception as e:
             error_msg = "Error al cargar comandos IoT."
             logger.error(f"No se pudieron cargar los comandos IoT: {e}")
@@ -0,0 +1,94 @@
+import io
+import logging
+import os
+import subprocess
+from dataclasses import dataclass
+from typing import Optional, Union
+
+import numpy as np
+import resampy
+import soundfile as sf
+
+logger = logging.getLogger("AudioBuffer")
+
+TARGET_SAMPLE_RATE = 16000
+
+
+@dataclass(frozen=True)
+class AudioBuffer:
+    """
+    Audio decodificado en memoria: mono, float32 y a 16 kHz.
+
+    Se decodifica una sola vez por solicitud y la misma instancia se comparte entre
+    supresión de ruido, STT e identificación de hablante. Los consumidores no deben
+    modificar `samples` en el sitio; las transformaciones devuelven un buffer nuevo.
+    """
+
+    samples: np.ndarray
+    sample_rate: int = TARGET_SAMPLE_RATE
+    source: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.sample_rate if self.sample_rate else 0.0
+
+    def with_samples(self, samples: np.ndarray) -> "AudioBuffer":
+        """Devuelve un buffer con las mismas propiedades y otras muestras."""
+        return AudioBuffer(np.asarray(samples, dtype=np.float32), self.sample_rate, self.source)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, source: Optional[str] = None) -> "AudioBuffer":
+        """
+        Decodifica el contenido de un archivo de audio (WAV, FLAC, OGG...) en memoria.
+
+        Si soundfile no reconoce el formato se recurre a FFmpeg por tuberías, sin
+        escribir archivos temporales.
+
+        Raises:
+            ValueError: Si el audio no se puede decodificar o está vacío.
+        """
+        try:
+            audio, sample_rate = sf.read(io.BytesIO(data), dtype="float32", always_2d=False)
+        except Exception as e:
+            logger.debug(f"soundfile no pudo decodificar {source or 'el audio'} ({e}). Usando FFmpeg.")
+            audio, sample_rate = cls._decode_with_ffmpeg(data), TARGET_SAMPLE_RATE
+        return cls._normalize(audio, sample_rate, source)
+
+    @classmethod
+    def from_file(cls, path: Union[str, os.PathLike]) -> "AudioBuffer":
+        """Lee y decodifica un archivo de audio del disco."""
+        with open(path, "rb") as audio_file:
+            return cls.from_bytes(audio_file.read(), source=str(path))
+
+    @classmethod
+    def _normalize(cls, audio: np.ndarray, sample_rate: int, source: Optional[str]) -> "AudioBuffer":
+        if audio.ndim > 1:
+            audio = audio.mean(axis=1)
+        if sample_rate != TARGET_SAMPLE_RATE:
+            audio = resampy.resample(audio, sample_rate, TARGET_SAMPLE_RATE)
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+        if audio.size == 0:
+            raise ValueError(f"El audio está vacío: {source or 'buffer en memoria'}")
+        return cls(audio, TARGET_SAMPLE_RATE, source)
+
+    @staticmethod
+    def _decode_with_ffmpeg(data: bytes) -> np.ndarray:
+        try:
+            result = subprocess.run(
+                ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+                 "-f", "f32le", "-ac", "1", "-ar", str(TARGET_SAMPLE_RATE), "pipe:1"],
+                input=data, capture_output=True, check=True
+            )
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            raise ValueError(f"No se pudo decodificar el audio: {e}") from e
+        return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+AudioInput = Union[str, os.PathLike, AudioBuffer]
+
+
+def as_audio_buffer(audio: AudioInput) -> AudioBuffer:
+    """Devuelve `audio` si ya es un AudioBuffer o lo decodifica desde la ruta indicada."""
+    if isinstance(audio, AudioBuffer):
+        return audio
+    return AudioBuffer.from_file(audio)
@@ -4,47 +4,164 @@ import numpy as np
 import os
 import logging
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from src.ai.sound_processor.audio_buffer import AudioBuffer, AudioInput, as_audio_buffer
 
 logger = logging.getLogger("NoiseSuppressor")
 
-def suppress_noise(audio_path: str, sr: int = 16000) -> str:
+STATIONARY = "stationary"
+NON_STATIONARY = "non_stationary"
+NOISE_MODES = (STATIONARY, NON_STATIONARY)
+
+DEFAULT_NOISE_MODE = NON_STATIONARY
+# Por encima de esta relación señal/ruido estimada el clip se considera limpio y no se procesa
+DEFAULT_SKIP_SNR_DB = 25.0
+# Las grabaciones más largas que esto se procesan en trozos en paralelo
+PARALLEL_CHUNK_S = 10.0
+CHUNK_OVERLAP_S = 0.5
+
+_SNR_FRAME_MS = 30
+_NOISE_ESTIMATION_S = 0.5
+
+_chunk_executor = ThreadPoolExecutor(max_workers=max(1, min(4, os.cpu_count() or 1)), thread_name_prefix="denoise")
+
+
+def estimate_snr_db(samples: np.ndarray, sr: int) -> float:
+    """
+    Estimación rápida de la relación señal/ruido a partir de la energía por tramas de 30 ms.
+
+    Toma el percentil 10 de la energía como suelo de ruido y el percentil 90 como nivel de
+    voz; cuesta una pasada sobre las muestras, frente al STFT completo de la supresión.
+    """
+    frame_length = max(1, sr * _SNR_FRAME_MS // 1000)
+    n_frames = len(samples) // frame_length
+    if n_frames < 2:
+        return 0.0
+    frames = samples[:n_frames * frame_length].reshape(n_frames, frame_length)
+    energy = np.einsum("ij,ij->i", frames, frames) / frame_length
+    noise_floor, speech_level = np.percentile(energy, [10, 90])
+    if noise_floor <= 0:
+        return float("inf") if speech_level > 0 else 0.0
+    return float(10 * np.log10(speech_level / noise_floor))
+
+
+def reduce_noise_array(samples: np.ndarray, sr: int, mode: str = DEFAULT_NOISE_MODE) -> np.ndarray:
     """
-    Aplica supresión de ruido a un archivo de audio.
+    Suprime el ruido de un array en memoria y devuelve un array nuevo.
+
+    El ruido se estima con los primeros 0.5 s del clip. Las grabaciones largas se dividen en
+    trozos de `PARALLEL_CHUNK_S` con un solape que se funde linealmente, y los trozos se
+    procesan en paralelo con el mismo perfil de ruido.
 
     Args:
-        audio_path (str): La ruta al archivo de audio de entrada.
-        sr (int): La frecuencia de muestreo esperada del audio.
+        samples (np.ndarray): Audio mono float32.
+        sr (int): Frecuencia de muestreo.
+        mode (str): "stationary" (más rápido, ruido constante) o "non_stationary".
+    """
+    if mode not in NOISE_MODES:
+        raise ValueError(f"Modo de supresión de ruido desconocido: {mode}")
+    stationary = mode == STATIONARY
+
+    noise_length = int(_NOISE_ESTIMATION_S * sr)
+    if len(samples) < noise_length:
+        logger.warning("Audio demasiado corto para estimar ruido de los primeros 0.5s. Usando todo el audio para estimación de ruido.")
+        return nr.reduce_noise(y=samples, sr=sr, stationary=stationary, n_fft=2048, hop_length=512, win_length=2048).astype(np.float32)
+    y_noise = samples[:noise_length]
+
+    chunk_length = int(PARALLEL_CHUNK_S * sr)
+    if len(samples) <= chunk_length:
+        return _reduce_noise_chunk(samples, sr, stationary, y_noise)
+
+    overlap = int(CHUNK_OVERLAP_S * sr)
+    starts = list(range(0, len(samples) - overlap, chunk_length - overlap))
+    chunks = [samples[start:start + chunk_length] for start in starts]
+    results = list(_chunk_executor.map(lambda chunk: _reduce_noise_chunk(chunk, sr, stationary, y_noise), chunks))
+
+    output = np.empty(len(samples), dtype=np.float32)
+    fade_in = np.linspace(0.0, 1.0, overlap, dtype=np.float32)
+    for index, (start, result) in enumerate(zip(starts, results)):
+        if index == 0:
+            output[start:start + len(result)] = result
+            continue
+        blend = min(overlap, len(result))
+        head = output[start:start + blend]
+        output[start:start + blend] = head * (1.0 - fade_in[:blend]) + result[:blend] * fade_in[:blend]
+        output[start + blend:start + len(result)] = result[blend:]
+    logger.debug(f"Supresión de ruido en {len(chunks)} trozos paralelos")
+    return output
+
+
+def _reduce_noise_chunk(samples: np.ndarray, sr: int, stationary: bool, y_noise: np.ndarray) -> np.ndarray:
+    return nr.reduce_noise(y=samples, sr=sr, n_fft=2048, hop_length=512, win_length=2048,
+                           prop_decrease=1.0, # Reducir todo el ruido posible
+                           stationary=stationary,
+                           chunk_size=1024, # Procesar en chunks para eficiencia
+                           n_jobs=1, # El paralelismo se hace por trozos en reduce_noise_array
+                           time_constant_s=2.0, # Constante de tiempo para adaptación (no estacionario)
+                           freq_mask_smooth_hz=500, # Suavizado de máscara de frecuencia
+                           use_tqdm=False, # No usar tqdm para evitar dependencias de UI
+                           # Estimación de ruido del inicio del audio
+                           y_noise=y_noise).astype(np.float32)
+
+
+def denoise_buffer(
+    audio: AudioBuffer,
+    mode: str = DEFAULT_NOISE_MODE,
+    skip_snr_db: Optional[float] = DEFAULT_SKIP_SNR_DB
+) -> Optional[AudioBuffer]:
+    """
+    Aplica supresión de ruido a un audio ya decodificado, sin pasar por disco.
+
+    Args:
+        audio (AudioBuffer): Audio mono float32 a 16 kHz.
+        mode (str): "stationary" o "non_stationary".
+        skip_snr_db (Optional[float]): Si la SNR estimada la supera, se devuelve el audio sin
+            procesar. None desactiva la comprobación.
 
     Returns:
-        str: La ruta al archivo de audio temporal con el ruido suprimido.
-             Retorna None si ocurre un error.
+        Optional[AudioBuffer]: Buffer con el ruido suprimido (o el original si ya está limpio),
+        o None si ocurre un error.
     """
     try:
-        # Cargar el audio
-        audio, current_sr = sf.read(audio_path)
+        if skip_snr_db is not None:
+            snr_db = estimate_snr_db(audio.samples, audio.sample_rate)
+            if snr_db >= skip_snr_db:
+                logger.debug(f"SNR estimada {snr_db:.1f} dB >= {skip_snr_db} dB en {audio.source}; se omite la supresión de ruido.")
+                return audio
 
-        # Si el audio es estéreo, convertir a mono promediando los canales
-        if audio.ndim > 1:
-            audio = audio.mean(axis=1)
+        reduced_noise = reduce_noise_array(audio.samples, audio.sample_rate, mode)
+        logger.debug(f"Ruido suprimido en memoria para {audio.source} ({audio.duration:.2f}s, modo {mode})")
+        return audio.with_samples(reduced_noise)
+    except Exception as e:
+        logger.error(f"Error al aplicar supresión de ruido a {audio.source}: {e}")
+        return None
 
-        # Asegurarse de que el audio sea float32
-        audio = audio.astype(np.float32)
 
-        segment_for_noise_estimation = int(0.5 * current_sr)
-        if len(audio) < segment_for_noise_estimation:
-            logger.warning(f"Audio demasiado corto para estimar ruido de los primeros 0.5s. Usando todo el audio para estimación de ruido en {audio_path}.")
-            reduced_noise = nr.reduce_noise(y=audio, sr=current_sr, n_fft=2048, hop_length=512, win_length=2048)
-        else:
-            reduced_noise = nr.reduce_noise(y=audio, sr=current_sr, n_fft=2048, hop_length=512, win_length=2048,
-                                            prop_decrease=1.0, # Reducir todo el ruido posible
-                                            stationary=False, # El ruido puede no ser estacionario
-                                            chunk_size=1024, # Procesar en chunks para eficiencia
-                                            n_jobs=1, # Usar un solo core para evitar problemas de paralelismo
-                                            time_constant_s=2.0, # Constante de tiempo para adaptación
-                                            freq_mask_smooth_hz=500, # Suavizado de máscara de frecuencia
-                                            use_tqdm=False, # No usar tqdm para evitar dependencias de UI
-                                            # Estimación de ruido del inicio del audio
-                                            y_noise=audio[0:segment_for_noise_estimation])
+def suppress_noise(audio: AudioInput, sr: int = 16000, mode: str = DEFAULT_NOISE_MODE) -> Optional[str]:
+    """
+    Aplica supresión de ruido a un archivo de audio o a un AudioBuffer y guarda el resultado.
+
+    Para el procesamiento interno (STT, hablante) usar `denoise_buffer`, que no escribe en disco.
+
+    Args:
+        audio (AudioInput): La ruta al archivo de audio de entrada o el audio ya decodificado.
+        sr (int): La frecuencia de muestreo esperada del audio.
+        mode (str): "stationary" o "non_stationary".
+
+    Returns:
+        Optional[str]: La ruta al archivo de audio temporal con el ruido suprimido.
+             Retorna None si ocurre un error.
+    """
+    try:
+        buffer = as_audio_buffer(audio)
+        if buffer.sample_rate != sr:
+            logger.warning(f"Frecuencia de muestreo {buffer.sample_rate} Hz distinta de la esperada ({sr} Hz).")
+        # Petición explícita de supresión: no se omite aunque el audio parezca limpio
+        denoised = denoise_buffer(buffer, mode=mode, skip_snr_db=None)
+        if denoised is None:
+            return None
 
         # Crear un nombre de archivo temporal único
         temp_dir = "temp_audio"
@@ -52,11 +169,11 @@ def suppress_noise(audio_path: str, sr: int = 16000) -> str:
         temp_audio_path = os.path.join(temp_dir, f"denoised_audio_{uuid.uuid4().hex}.wav")
 
         # Guardar el audio procesado en un archivo temporal
-        sf.write(temp_audio_path, reduced_noise, current_sr)
-        logger.info(f"Ruido suprimido para {audio_path}. Archivo temporal guardado en {temp_audio_path}")
+        sf.write(temp_audio_path, denoised.samples, denoised.sample_rate)
+        logger.info(f"Ruido suprimido para {buffer.source}. Archivo temporal guardado en {temp_audio_path}")
         return temp_audio_path
     except Exception as e:
-        logger.error(f"Error al aplicar supresión de ruido a {audio_path}: {e}")
+        logger.error(f"Error al aplicar supresión de ruido a {getattr(audio, 'source', audio)}: {e}")
         return None
 
 if __name__ == "__main__":
@@ -0,0 +1,64 @@
+import logging
+
+import numpy as np
+import webrtcvad
+
+from src.ai.sound_processor.audio_buffer import AudioBuffer
+
+logger = logging.getLogger("VoiceActivity")
+
+DEFAULT_VAD_AGGRESSIVENESS = 2
+VAD_FRAME_MS = 30
+DEFAULT_SPEECH_PADDING_MS = 200
+_WEBRTC_SAMPLE_RATES = (8000, 16000, 32000, 48000)
+
+
+def trim_silence(
+    audio: AudioBuffer,
+    aggressiveness: int = DEFAULT_VAD_AGGRESSIVENESS,
+    padding_ms: int = DEFAULT_SPEECH_PADDING_MS
+) -> AudioBuffer:
+    """
+    Recorta el silencio inicial y final de un audio usando webrtcvad.
+
+    Se conserva desde la primera hasta la última trama con voz, más `padding_ms` a cada
+    lado para no cortar consonantes. Si no se detecta voz, o la frecuencia de muestreo no
+    es compatible con webrtcvad, se devuelve el audio sin cambios.
+
+    Args:
+        audio (AudioBuffer): Audio mono float32.
+        aggressiveness (int): Agresividad de webrtcvad (0-3).
+        padding_ms (int): Margen que se mantiene alrededor de la voz detectada.
+
+    Returns:
+        AudioBuffer: Audio recortado (una vista de las muestras originales, sin copia).
+    """
+    if audio.sample_rate not in _WEBRTC_SAMPLE_RATES:
+        logger.debug(f"Frecuencia {audio.sample_rate} Hz no soportada por webrtcvad; no se recorta.")
+        return audio
+
+    frame_length = audio.sample_rate * VAD_FRAME_MS // 1000
+    n_frames = len(audio.samples) // frame_length
+    if n_frames == 0:
+        return audio
+
+    pcm = (np.clip(audio.samples[:n_frames * frame_length], -1.0, 1.0) * 32767).astype("<i2").tobytes()
+    frame_bytes = frame_length * 2
+    vad = webrtcvad.Vad(aggressiveness)
+    speech_frames = [
+        index for index in range(n_frames)
+        if vad.is_speech(pcm[index * frame_bytes:(index + 1) * frame_bytes], audio.sample_rate)
+    ]
+    if not speech_frames:
+        logger.debug(f"No se detectó voz en {audio.source}; se mantiene el audio completo.")
+        return audio
+
+    padding = audio.sample_rate * padding_ms // 1000
+    start = max(0, speech_frames[0] * frame_length - padding)
+    end = min(len(audio.samples), (speech_frames[-1] + 1) * frame_length + padding)
+    if start == 0 and end == len(audio.samples):
+        return audio
+
+    trimmed = audio.with_samples(audio.samples[start:end])
+    logger.debug(f"Silencio recortado en {audio.source}: {audio.duration:.2f}s -> {trimmed.duration:.2f}s")
+    return trimmed
@@ -1,10 +1,12 @@
 import numpy as np
-import json
 from typing import Optional, Tuple, List
 from concurrent.futures import ThreadPoolExecutor
 from resemblyzer import VoiceEncoder, preprocess_wav
 from src.db.database import get_db
 from src.db.models import User
+from src.db.embedding_codec import encode_embedding
+from src.ai.speaker.speaker_index import speaker_index
+from src.ai.sound_processor.audio_buffer import AudioBuffer, AudioInput
 import logging
 import asyncio
 import torch
@@ -16,12 +18,14 @@ class SpeakerRecognitionModule:
     """
 Módulo para el reconocimiento de hablantes utilizando resemblyzer y SQLAlchemy para la gestión de usuarios.
 Permite registrar nuevos hablantes y identificar hablantes existentes a partir de muestras de audio.
+Los embeddings registrados se consultan en `speaker_index`, una matriz en memoria que se mantiene
+al día con los cambios de la tabla de usuarios.
     """
     def __init__(self):
         self.device: str = "cuda" if torch.cuda.is_available() else "cpu"
         self._encoder = VoiceEncoder(device=self.device)
         self._online = True
-        self._registered_users: List[User] = []
+        self._index = speaker_index
         self._executor = ThreadPoolExecutor(max_workers=4)
         self.identification_threshold: float = 0.35 # Ajustado para ser más permisivo
         self.registration_threshold: float = 0.35 # Ajustado para ser más permisivo
@@ -29,12 +33,10 @@ Permite registrar nuevos hablantes y identificar hablantes existentes a partir d
 
     async def _load_registered_users(self) -> None:
         """
-        Carga los usuarios registrados desde la base de datos en la memoria del módulo de forma asíncrona.
+        Carga una única vez los embeddings de los usuarios registrados en el índice en memoria.
         """
-        async with get_db() as db:
-            users = await db.execute(select(User))
-            self._registered_users = users.scalars().all()
-            logger.info(f"Cargados {len(self._registered_users)} usuarios registrados.")
+        await self._index.ensure_loaded()
+        logger.info(f"Índice de hablantes con {len(self._index)} usuarios registrados.")
 
     async def load_users(self) -> None:
         """
@@ -56,177 +58,154 @@ Permite registrar nuevos hablantes y identificar hablantes existentes a partir d
             self._executor.shutdown(wait=True)
             logger.info("ThreadPoolExecutor cerrado.")
 
-    async def _register_speaker_sync(self, name: str, audio_path: str, is_owner: bool = False) -> Optional[str]:
+    @staticmethod
+    def _load_wav(audio: AudioInput) -> np.ndarray:
+        """Prepara el audio para resemblyzer reutilizando las muestras si ya está decodificado."""
+        if isinstance(audio, AudioBuffer):
+            return preprocess_wav(audio.samples, source_sr=audio.sample_rate)
+        return preprocess_wav(audio)
+
+    async def _find_duplicate_voice(self, new_embedding: np.ndarray, exclude_user_id: Optional[int] = None) -> Optional[int]:
+        """
+        Busca en el índice un usuario con una voz demasiado parecida al nuevo embedding.
+
+        Returns:
+            Optional[int]: ID del usuario que ya tiene esa voz, o None.
+        """
+        await self._index.ensure_loaded()
+        candidates = self._index.top2(new_embedding, exclude_user_id=exclude_user_id)
+        if not candidates:
+            return None
+        user_id, similarity = candidates[0]
+        distance = 1 - similarity
+        logger.debug(f"Voz más parecida: usuario {user_id} (distancia = {distance:.4f})")
+        return user_id if distance < self.registration_threshold else None
+
+    async def _register_speaker_sync(self, name: str, audio: AudioInput, is_owner: bool = False) -> Optional[bytes]:
         """
         Lógica síncrona para registrar un hablante.
         """
         try:
-            wav = preprocess_wav(audio_path)
+            wav = self._load_wav(audio)
             new_embedding = self._encoder.embed_utterance(wav)
             # Asegurar que el embedding sea L2-normalizado para una comparación robusta
             new_embedding = new_embedding / np.linalg.norm(new_embedding)
-            new_embedding_str = json.dumps(new_embedding.tolist())
-            logger.debug(f"Nuevo embedding generado para {name}: {new_embedding_str}")
+            new_embedding_data = encode_embedding(new_embedding)
+            logger.debug(f"Nuevo embedding generado para {name} ({new_embedding.shape[0]} dimensiones)")
             
             async with get_db() as db:
-                await self._load_registered_users()
-
                 existing_user_by_name = await db.execute(select(User).filter(User.nombre == name))
                 if existing_user_by_name.scalar_one_or_none():
                     logger.warning(f"El usuario \'{name}\' ya está registrado por nombre. No se puede registrar con la misma voz.")
                     return None
 
-                logger.debug(f"Comprobando embeddings duplicados. Usuarios registrados actualmente: {[u.nombre for u in self._registered_users]}")
-                for user in self._registered_users:
-                    logger.debug(f"Embedding cargado de la base de datos para {user.nombre}: {user.speaker_embedding}")
-                    if user.speaker_embedding is None:
-                        logger.debug(f"Usuario {user.nombre} no tiene speaker_embedding, saltando comparación.")
-                        continue
-                    registered_embedding = np.array(json.loads(user.speaker_embedding))
-                    # Asegurar que el embedding registrado también sea L2-normalizado
-                    registered_embedding = registered_embedding / np.linalg.norm(registered_embedding)
-                    similarity = np.dot(new_embedding, registered_embedding)
-                    distance = 1 - similarity
-                    logger.debug(f"Comparando nuevo embedding con usuario {user.nombre}: distancia = {distance:.4f}")
-                    
-                    if distance < self.registration_threshold:
-                        logger.warning(f"La voz proporcionada ya está registrada por el usuario {user.nombre}. No se puede registrar {name}.")
-                        return None
+            duplicate_user_id = await self._find_duplicate_voice(new_embedding)
+            if duplicate_user_id is not None:
+                logger.warning(f"La voz proporcionada ya está registrada por el usuario ID {duplicate_user_id}. No se puede registrar {name}.")
+                return None
 
-                return new_embedding_str
+            return new_embedding_data
         except Exception as e:
             logger.error(f"Error al registrar hablante: {e}")
             return None
-        finally:
-            pass
 
-    async def register_speaker(self, name: str, audio_path: str, is_owner: bool = False) -> Optional[str]:
+    async def register_speaker(self, name: str, audio: AudioInput, is_owner: bool = False) -> Optional[bytes]:
         """
         Registra un nuevo hablante en el sistema.
         Genera un embedding de voz y lo guarda en la base de datos.
         """
         logger.info(f"Registrando hablante: {name}")
-        return await self._register_speaker_sync(name, audio_path, is_owner)
+        return await self._register_speaker_sync(name, audio, is_owner)
 
-    async def update_speaker_voice(self, user_id: int, audio_path: str) -> Optional[str]:
+    async def update_speaker_voice(self, user_id: int, audio: AudioInput) -> Optional[bytes]:
         """
         Actualiza la voz de un hablante existente en el sistema.
         Genera un embedding de voz y lo devuelve si no hay duplicados con otros usuarios.
         """
         logger.info(f"Actualizando voz para el usuario ID: {user_id}")
         try:
-            wav = preprocess_wav(audio_path)
+            wav = self._load_wav(audio)
             new_embedding = self._encoder.embed_utterance(wav)
             # Asegurar que el embedding sea L2-normalizado para una comparación robusta
             new_embedding = new_embedding / np.linalg.norm(new_embedding)
-            new_embedding_str = json.dumps(new_embedding.tolist())
-            logger.debug(f"Nuevo embedding generado para el usuario ID {user_id}: {new_embedding_str}")
+            new_embedding_data = encode_embedding(new_embedding)
+            logger.debug(f"Nuevo embedding generado para el usuario ID {user_id} ({new_embedding.shape[0]} dimensiones)")
             
-            async with get_db():
-                await self._load_registered_users()
-
-                logger.debug(f"Comprobando embeddings duplicados para el usuario ID {user_id}. Usuarios registrados actualmente: {[u.nombre for u in self._registered_users]}")
-                for user in self._registered_users:
-                    if user.id == user_id:
-                        continue
+            duplicate_user_id = await self._find_duplicate_voice(new_embedding, exclude_user_id=user_id)
+            if duplicate_user_id is not None:
+                logger.warning(f"La voz proporcionada ya está registrada por el usuario ID {duplicate_user_id}. No se puede actualizar la voz para el usuario ID {user_id}.")
+                return None
 
-                    logger.debug(f"Embedding cargado de la base de datos para {user.nombre}: {user.speaker_embedding}")
-                    if user.speaker_embedding is None:
-                        logger.debug(f"Usuario {user.nombre} no tiene speaker_embedding, saltando comparación.")
-                        continue
-                    registered_embedding = np.array(json.loads(user.speaker_embedding))
-                    # Asegurar que el embedding registrado también sea L2-normalizado
-                    registered_embedding = registered_embedding / np.linalg.norm(registered_embedding)
-                    similarity = np.dot(new_embedding, registered_embedding)
-                    distance = 1 - similarity
-                    logger.debug(f"Comparando nuevo embedding con usuario {user.nombre}: distancia = {distance:.4f}")
-
-                    if distance < self.registration_threshold:
-                        logger.warning(f"La voz proporcionada ya está registrada por el usuario {user.nombre}. No se puede actualizar la voz para el usuario ID {user_id}.")
-                        return None
-
-                return new_embedding_str
+            return new_embedding_data
         except Exception as e:
             logger.error(f"Error al actualizar la voz del hablante para el usuario ID {user_id}: {e}")
             return None
-        finally:
-            pass
 
-    def _identify_speaker_sync_blocking(self, audio_path: str, registered_users: List[User]) -> Tuple[Optional[User], Optional[np.ndarray]]:
+    def _identify_speaker_sync_blocking(self, audio: AudioInput) -> Tuple[Optional[int], Optional[np.ndarray]]:
         """
         Lógica síncrona para identificar un hablante, ejecutada en un ThreadPoolExecutor.
+        Puntúa el audio contra todos los usuarios con un único producto matriz-vector.
+
+        Returns:
+            Tuple[Optional[int], Optional[np.ndarray]]: ID del usuario identificado (o None) y el embedding generado.
         """
         if not self.is_online():
             logger.warning("El módulo de reconocimiento de hablante está fuera de línea.")
             return None, None
         
         try:
-            wav = preprocess_wav(audio_path)
+            wav = self._load_wav(audio)
             new_embedding = self._encoder.embed_utterance(wav)
             # Asegurar que el embedding sea L2-normalizado para una comparación robusta
             new_embedding = new_embedding / np.linalg.norm(new_embedding)
         except Exception as e:
             logger.error(f"Error al generar embedding para el audio: {e}")
             return None, None
-        finally:
-            pass
-
-        if not registered_users:
-            logger.info("No se encontraron usuarios registrados. Devolviendo solo el embedding generado.")
-            return None, new_embedding
-
-        distances = []
-        for user in registered_users:
-            if user.speaker_embedding is None:
-                logger.debug(f"Usuario {user.nombre} no tiene speaker_embedding, saltando identificación.")
-                continue
-            registered_embedding = np.array(json.loads(user.speaker_embedding))
-            # Asegurar que el embedding registrado también sea L2-normalizado
-            registered_embedding = registered_embedding / np.linalg.norm(registered_embedding)
-            similarity = np.dot(new_embedding, registered_embedding)
-            distance = 1 - similarity
-            logger.debug(f"Comparando con {user.nombre}: distancia = {distance:.4f}")
-            distances.append((user, distance))
 
-        if not distances:
+        candidates = self._index.top2(new_embedding)
+        if not candidates:
             logger.info("No hay embeddings válidos para identificación.")
             return None, new_embedding
 
-        distances.sort(key=lambda x: x[1])
-        logger.debug(f"Top candidatos: {[(u.nombre, f'{d:.4f}') for u, d in distances[:3]]}")
-        best_user, best_dist = distances[0]
-        second_dist = distances[1][1] if len(distances) > 1 else None
+        logger.debug(f"Top candidatos: {[(user_id, f'{1 - similarity:.4f}') for user_id, similarity in candidates]}")
+        best_user_id, best_similarity = candidates[0]
+        best_dist = 1 - best_similarity
+        second_dist = 1 - candidates[1][1] if len(candidates) > 1 else None
 
         if best_dist < self.identification_threshold and (second_dist is None or (second_dist - best_dist) >= self.identification_margin):
-            logger.info(f"Hablante identificado: {best_user.nombre} (distancia={best_dist:.4f})")
-            return best_user, new_embedding
+            logger.info(f"Hablante identificado: usuario ID {best_user_id} (distancia={best_dist:.4f})")
+            return best_user_id, new_embedding
         else:
             logger.info("Hablante Desconocido")
             return None, new_embedding
 
-    async def identify_speaker(self, audio_path: str) -> Tuple[Optional[User], Optional[np.ndarray]]:
+    async def identify_speaker(self, audio: AudioInput) -> Tuple[Optional[User], Optional[np.ndarray]]:
         """
         Identifica un hablante a partir de una muestra de audio de manera asíncrona.
         
         Args:
-            audio_path (str): La ruta al archivo de audio para identificar al hablante.
+            audio (AudioInput): AudioBuffer ya decodificado o ruta al archivo de audio.
         
         Returns:
             Tuple[Optional[User], Optional[np.ndarray]]: Una tupla con el usuario identificado y su embedding, o None si no se identifica.
         """
-        await self._load_registered_users() # Asegurarse de que los usuarios estén cargados
+        await self._load_registered_users() # Asegurarse de que el índice esté cargado
         loop = asyncio.get_running_loop()
-        identified_user, new_embedding = await loop.run_in_executor(
+        identified_user_id, new_embedding = await loop.run_in_executor(
             self._executor,
             self._identify_speaker_sync_blocking,
-            audio_path,
-            self._registered_users
+            audio
         )
+        if identified_user_id is None:
+            return None, new_embedding
+
+        async with get_db() as db:
+            identified_user = await db.get(User, identified_user_id)
         return identified_user, new_embedding
 
-    async def register_speaker_multi(self, name: str, audio_paths: List[str], is_owner: bool = False) -> Optional[str]:
+    async def register_speaker_multi(self, name: str, audios: List[AudioInput], is_owner: bool = False) -> Optional[bytes]:
         try:
-            wavs = [preprocess_wav(p) for p in audio_paths]
+            wavs = [self._load_wav(a) for a in audios]
             if hasattr(self._encoder, "embed_speaker"):
                 new_embedding = self._encoder.embed_speaker(wavs)
             else:
@@ -234,32 +213,21 @@ Permite registrar nuevos hablantes y identificar hablantes existentes a partir d
                 new_embedding = np.mean(parts, axis=0)
             # Asegurar que el embedding sea L2-normalizado para una comparación robusta
             new_embedding = new_embedding / np.linalg.norm(new_embedding)
-            new_embedding_str = json.dumps(new_embedding.tolist())
+            new_embedding_data = encode_embedding(new_embedding)
             async with get_db() as db:
-                await self._load_registered_users()
                 existing_user_by_name = await db.execute(select(User).filter(User.nombre == name))
                 if existing_user_by_name.scalar_one_or_none():
                     return None
-                for user in self._registered_users:
-                    if user.speaker_embedding is None:
-                        continue
-                    registered_embedding = np.array(json.loads(user.speaker_embedding))
-                    # Asegurar que el embedding registrado también sea L2-normalizado
-                    registered_embedding = registered_embedding / np.linalg.norm(registered_embedding)
-                    similarity = np.dot(new_embedding, registered_embedding)
-                    distance = 1 - similarity
-                    if distance < self.registration_threshold:
-                        return None
-                return new_embedding_str
+            if await self._find_duplicate_voice(new_embedding) is not None:
+                return None
+            return new_embedding_data
         except Exception as e:
             logger.error(f"Error en register_speaker_multi: {e}")
             return None
-        finally:
-            pass
 
-    async def update_speaker_voice_multi(self, user_id: int, audio_paths: List[str]) -> Optional[str]:
+    async def update_speaker_voice_multi(self, user_id: int, audios: List[AudioInput]) -> Optional[bytes]:
         try:
-            wavs = [preprocess_wav(p) for p in audio_paths]
+            wavs = [self._load_wav(a) for a in audios]
             if hasattr(self._encoder, "embed_speaker"):
                 new_embedding = self._encoder.embed_speaker(wavs)
             else:
@@ -267,25 +235,10 @@ Permite registrar nuevos hablantes y identificar hablantes existentes a partir d
                 new_embedding = np.mean(parts, axis=0)
             # Asegurar que el embedding sea L2-normalizado para una comparación robusta
             new_embedding = new_embedding / np.linalg.norm(new_embedding)
-            new_embedding_str = json.dumps(new_embedding.tolist())
-            async with get_db():
-                await self._load_registered_users()
-                for user in self._registered_users:
-                    if user.id == user_id:
-                        continue
-                    if user.speaker_embedding is None:
-                        continue
-                    registered_embedding = np.array(json.loads(user.speaker_embedding))
-                    # Asegurar que el embedding registrado también sea L2-normalizado
-                    registered_embedding = registered_embedding / np.linalg.norm(registered_embedding)
-                    similarity = np.dot(new_embedding, registered_embedding)
-                    distance = 1 - similarity
-                    if distance < self.registration_threshold:
-                        return None
-                return new_embedding_str
+            new_embedding_data = encode_embedding(new_embedding)
+            if await self._find_duplicate_voice(new_embedding, exclude_user_id=user_id) is not None:
+                return None
+            return new_embedding_data
         except Exception as e:
             logger.error(f"Error en update_speaker_voice_multi: {e}")
             return None
-        finally:
-            pass
-        
\ No newline at end of file
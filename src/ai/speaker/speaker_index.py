@@ -0,0 +1,189 @@
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, object_session
+
+from src.db.embedding_codec import decode_embedding
+from src.db.models import User
+
+logger = logging.getLogger("SpeakerEmbeddingIndex")
+
+EMBEDDING_DIM = 256
+_INITIAL_CAPACITY = 16
+
+
+def decode_speaker_embedding(value: Any) -> Optional[np.ndarray]:
+    """Convierte el valor almacenado en `users.speaker_embedding` en un vector float32, o None."""
+    return decode_embedding(value, legacy_dtype=np.float32)
+
+
+class SpeakerEmbeddingIndex:
+    """
+    Galería de embeddings de voz en una única matriz float32 contigua.
+
+    Cada fila es un embedding L2-normalizado y `_ids` guarda el usuario de cada fila, de
+    modo que puntuar un audio contra todos los usuarios es un único producto
+    matriz-vector. Las filas se actualizan en el sitio cuando se registra, cambia o elimina
+    un embedding y se confirma la transacción (ver `_register_user_listeners`), sin volver a leer la tabla de usuarios.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self._matrix = np.zeros((_INITIAL_CAPACITY, dim), dtype=np.float32)
+        self._ids = np.zeros(_INITIAL_CAPACITY, dtype=np.int64)
+        self._positions: Dict[int, int] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._positions
+
+    async def ensure_loaded(self) -> None:
+        """Carga una única vez los embeddings de voz de todos los usuarios."""
+        if self.loaded:
+            return
+        from src.db.database import get_db
+        async with get_db() as db:
+            result = await db.execute(
+                select(User.id, User.speaker_embedding).filter(User.speaker_embedding.isnot(None))
+            )
+            rows = result.all()
+        with self._lock:
+            for user_id, value in rows:
+                embedding = decode_speaker_embedding(value)
+                if embedding is not None:
+                    self._upsert_locked(user_id, embedding)
+            self.loaded = True
+        logger.info(f"Índice de hablantes cargado con {self._size} embeddings.")
+
+    def upsert(self, user_id: int, embedding: np.ndarray) -> None:
+        """Añade o reemplaza en el sitio el embedding de un usuario."""
+        with self._lock:
+            self._upsert_locked(user_id, embedding)
+
+    def remove(self, user_id: int) -> None:
+        """Elimina el embedding de un usuario moviendo la última fila a su posición."""
+        with self._lock:
+            position = self._positions.pop(user_id, None)
+            if position is None:
+                return
+            last = self._size - 1
+            if position != last:
+                self._matrix[position] = self._matrix[last]
+                self._ids[position] = self._ids[last]
+                self._positions[int(self._ids[position])] = position
+            self._size = last
+
+    def top2(self, query: np.ndarray, exclude_user_id: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        Devuelve hasta dos (user_id, similitud coseno) ordenados de mayor a menor similitud.
+
+        Args:
+            query (np.ndarray): Embedding a comparar.
+            exclude_user_id (Optional[int]): Usuario que no debe considerarse (p. ej. al actualizar su voz).
+        """
+        query = self._normalize(query)
+        with self._lock:
+            size = self._size
+            if size == 0:
+                return []
+            scores = self._matrix[:size] @ query
+            ids = self._ids[:size].copy()
+            if exclude_user_id is not None and exclude_user_id in self._positions:
+                scores[self._positions[exclude_user_id]] = -np.inf
+
+        k = min(2, size)
+        candidates = np.argpartition(-scores, k - 1)[:k] if size > k else np.arange(size)
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(int(ids[i]), float(scores[i])) for i in candidates if np.isfinite(scores[i])]
+
+    def _upsert_locked(self, user_id: int, embedding: np.ndarray) -> None:
+        embedding = self._normalize(embedding)
+        position = self._positions.get(user_id)
+        if position is None:
+            if self._size == len(self._ids):
+                self._grow()
+            position = self._size
+            self._size += 1
+            self._positions[user_id] = position
+            self._ids[position] = user_id
+        self._matrix[position] = embedding
+
+    def _grow(self) -> None:
+        capacity = len(self._ids) * 2
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        self._matrix, self._ids = matrix, ids
+
+    def _normalize(self, embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        if embedding.shape[0] != self.dim:
+            raise ValueError(f"Dimensión de embedding {embedding.shape[0]} distinta de {self.dim}")
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+
+speaker_index = SpeakerEmbeddingIndex()
+
+
+_PENDING_CHANGES_KEY = "speaker_index_changes"
+
+
+def _stage_change(target: User, embedding: Optional[np.ndarray]) -> None:
+    """
+    Anota en la sesión el cambio de embedding de un usuario (None = eliminar).
+
+    Los eventos de mapper se disparan en el flush, antes de saber si la transacción se
+    confirmará; el índice solo se toca en `after_commit` y lo anotado se descarta en
+    `after_rollback`.
+    """
+    session = object_session(target)
+    if session is None:
+        return
+    session.info.setdefault(_PENDING_CHANGES_KEY, {})[target.id] = embedding
+
+
+def _register_user_listeners() -> None:
+    """Mantiene el índice al día con cualquier alta, cambio o baja confirmada de `users.speaker_embedding`."""
+
+    @event.listens_for(User, "after_insert")
+    def _after_insert(mapper, connection, target: User):
+        if speaker_index.loaded and target.speaker_embedding is not None:
+            _stage_change(target, decode_speaker_embedding(target.speaker_embedding))
+
+    @event.listens_for(User, "after_update")
+    def _after_update(mapper, connection, target: User):
+        if speaker_index.loaded and inspect(target).attrs.speaker_embedding.history.has_changes():
+            _stage_change(target, decode_speaker_embedding(target.speaker_embedding))
+
+    @event.listens_for(User, "after_delete")
+    def _after_delete(mapper, connection, target: User):
+        if speaker_index.loaded:
+            _stage_change(target, None)
+
+    @event.listens_for(Session, "after_commit")
+    def _after_commit(session: Session):
+        changes = session.info.pop(_PENDING_CHANGES_KEY, None)
+        if not changes or not speaker_index.loaded:
+            return
+        for user_id, embedding in changes.items():
+            if embedding is None:
+                speaker_index.remove(user_id)
+            else:
+                speaker_index.upsert(user_id, embedding)
+
+    @event.listens_for(Session, "after_rollback")
+    def _after_rollback(session: Session):
+        session.info.pop(_PENDING_CHANGES_KEY, None)
+
+
+_register_user_listeners()
@@ -1,58 +1,110 @@
 import whisper
 import numpy as np
-import soundfile as sf
 import subprocess
 import resampy
 import torch
 import warnings
 import logging
-from typing import Optional
+import time
+import asyncio
+from typing import Optional, Dict, Any, List, Tuple
 from concurrent.futures import ThreadPoolExecutor
-from src.ai.sound_processor.noise_suppressor import suppress_noise
-import os
+from src.ai.sound_processor.audio_buffer import AudioBuffer, AudioInput, as_audio_buffer
+from src.ai.sound_processor.noise_suppressor import DEFAULT_NOISE_MODE, DEFAULT_SKIP_SNR_DB, denoise_buffer
+from src.ai.sound_processor.vad import DEFAULT_VAD_AGGRESSIVENESS, trim_silence
+from src.ai.stt.whisper_batcher import DEFAULT_BATCH_WINDOW_MS, DEFAULT_MAX_BATCH_SIZE, WhisperBatcher
+
+try:
+    from faster_whisper import WhisperModel as FasterWhisperModel
+except ImportError:
+    FasterWhisperModel = None
 
 warnings.filterwarnings("ignore", message=".*flash attention.*")
 
 logger = logging.getLogger("STTModule")
 
+DEFAULT_MAX_QUEUE_SIZE = 4
+DEFAULT_FAST_PATH_MAX_S = 8.0
+
+class STTQueueFullError(Exception):
+    """Se lanza cuando la cola de transcripción está llena y la solicitud se rechaza."""
+
+    def __init__(self, max_queue_size: int):
+        self.max_queue_size = max_queue_size
+        super().__init__(f"La cola de transcripción está llena ({max_queue_size} solicitudes pendientes).")
+
 class STTModule:
     """
     Módulo para la transcripción de voz a texto (STT) utilizando el modelo Whisper.
 
     Permite cargar un modelo Whisper, verificar la disponibilidad de FFmpeg y transcribir
-    archivos de audio a texto de forma concurrente.
+    audio a texto de forma concurrente. Las solicitudes que coinciden en el tiempo se
+    decodifican juntas en micro-lotes (ver `WhisperBatcher`).
     """
-    def __init__(self, model_name: Optional[str] = None):
+    def __init__(
+        self,
+        model_name: Optional[str] = None,
+        max_queue_size: Optional[int] = None,
+        max_batch_size: Optional[int] = None,
+        batch_window_ms: Optional[float] = None
+    ):
         """
         Inicializa el módulo STT.
 
         Args:
             model_name (str): Nombre del modelo Whisper a cargar (ej. "tiny", "base", "small", "medium").
                             Si no se proporciona, se carga desde la configuración.
+            max_queue_size (int): Número máximo de transcripciones admitidas a la vez (en cola o en curso).
+                            Si no se proporciona, se carga desde la configuración ("stt_max_queue").
+            max_batch_size (int): Máximo de solicitudes decodificadas juntas en un lote ("stt_max_batch").
+            batch_window_ms (float): Espera máxima para agrupar solicitudes concurrentes ("stt_batch_window_ms").
         """
-        # Cargar model_name desde config si no se proporciona
+        config = self._load_stt_config()
         if model_name is None:
-            try:
-                from pathlib import Path
-                from src.ai.nlp.config.config_manager import ConfigManager
-                
-                project_root = Path(__file__).parent.parent.parent.parent
-                config_path = project_root / "config" / "config.json"
-                config_manager = ConfigManager(config_path)
-                config = config_manager.get_config()
-                model_name = config.get("stt_model", "base")
-                logger.info(f"Modelo STT cargado desde configuración: {model_name}")
-            except Exception as e:
-                logger.warning(f"No se pudo cargar modelo STT desde config: {e}. Usando 'base' por defecto.")
-                model_name = "base"
+            model_name = config.get("stt_model", "base")
+            logger.info(f"Modelo STT: {model_name}")
+        if max_queue_size is None:
+            max_queue_size = int(config.get("stt_max_queue", DEFAULT_MAX_QUEUE_SIZE))
+        if max_batch_size is None:
+            max_batch_size = int(config.get("stt_max_batch", DEFAULT_MAX_BATCH_SIZE))
+        if batch_window_ms is None:
+            batch_window_ms = float(config.get("stt_batch_window_ms", DEFAULT_BATCH_WINDOW_MS))
+        self.vad_aggressiveness: int = int(config.get("stt_vad_aggressiveness", DEFAULT_VAD_AGGRESSIVENESS))
+        self.denoise_mode: str = config.get("stt_denoise_mode", DEFAULT_NOISE_MODE)
+        self.denoise_skip_snr_db: Optional[float] = config.get("stt_denoise_skip_snr_db", DEFAULT_SKIP_SNR_DB)
+        self.fast_backend: Optional[str] = config.get("stt_fast_backend")
+        self.fast_path_max_s: float = float(config.get("stt_fast_path_max_s", DEFAULT_FAST_PATH_MAX_S))
         
         self._model = None
+        self._fast_model = None
+        self._fast_path_requests: int = 0
         self._online: bool = False
         self.model_name: str = model_name
         self.device: str = "cuda" if torch.cuda.is_available() else "cpu"
-        self._executor = ThreadPoolExecutor(max_workers=2)
+        # Un hilo por solicitud de un lote: preprocesan en paralelo y esperan juntas al decode
+        self._executor = ThreadPoolExecutor(max_workers=max(2, max_batch_size))
+        self.max_queue_size: int = max(1, max_queue_size)
+        self._pending: int = 0
+        self._rejected: int = 0
+        self._last_queue_wait: float = 0.0
+        self._last_decode_time: float = 0.0
+        self._batcher = WhisperBatcher(self._decode_mel_batch, max_batch_size, batch_window_ms / 1000)
         self._load_model()
 
+    @staticmethod
+    def _load_stt_config() -> Dict[str, Any]:
+        """Lee la configuración general; devuelve un dict vacío si no está disponible."""
+        try:
+            from pathlib import Path
+            from src.ai.nlp.config.config_manager import ConfigManager
+            
+            project_root = Path(__file__).parent.parent.parent.parent
+            config_path = project_root / "config" / "config.json"
+            return ConfigManager(config_path).get_config()
+        except Exception as e:
+            logger.warning(f"No se pudo cargar configuración STT desde config: {e}. Usando valores por defecto.")
+            return {}
+
     def _check_ffmpeg(self) -> bool:
         """
         Verifica si FFmpeg está instalado y accesible en la variable de entorno PATH.
@@ -84,6 +136,27 @@ class STTModule:
         except Exception as e:
             logger.error(f"Error al cargar el modelo Whisper: {e}")
             self._online = False
+            return
+
+        self._load_fast_model()
+
+    def _load_fast_model(self) -> None:
+        """
+        Carga el backend rápido opcional para clips cortos ("stt_fast_backend": "faster_whisper").
+        Si no está configurado o instalado, todas las solicitudes usan Whisper.
+        """
+        if self.fast_backend != "faster_whisper":
+            return
+        if FasterWhisperModel is None:
+            logger.warning("stt_fast_backend='faster_whisper' configurado pero faster-whisper no está instalado. Se usará Whisper.")
+            return
+        try:
+            compute_type = "float16" if self.device == "cuda" else "int8"
+            self._fast_model = FasterWhisperModel(self.model_name, device=self.device, compute_type=compute_type)
+            logger.info(f"Backend rápido faster-whisper cargado ({compute_type}) para clips de hasta {self.fast_path_max_s}s.")
+        except Exception as e:
+            logger.error(f"Error al cargar faster-whisper: {e}. Se usará Whisper.")
+            self._fast_model = None
 
     def is_online(self) -> bool:
         """
@@ -101,53 +174,81 @@ class STTModule:
         if self._executor:
             self._executor.shutdown(wait=True)
             logger.info("ThreadPoolExecutor del módulo STT cerrado.")
+        self._batcher.shutdown()
+
+    def _preprocess(self, audio: AudioInput) -> Optional[AudioBuffer]:
+        """
+        Suprime el ruido (se omite si la SNR estimada indica que el audio ya está limpio) y
+        después recorta el silencio con VAD.
 
-    def _transcribe_audio_sync(self, audio_path: str) -> Optional[str]:
+        La supresión y la estimación de SNR trabajan sobre el clip completo: el perfil de
+        ruido se toma de su inicio, que tras el recorte contendría ya voz.
+
+        Returns:
+            Optional[AudioBuffer]: Audio listo para Whisper, o None si falla la supresión de ruido.
         """
-        Lógica síncrona para transcribir un archivo de audio a texto.
+        buffer = as_audio_buffer(audio)
+        denoised = denoise_buffer(buffer, mode=self.denoise_mode, skip_snr_db=self.denoise_skip_snr_db)
+        if denoised is None:
+            logger.error(f"No se pudo suprimir el ruido del audio: {buffer.source}")
+            return None
+        denoised = trim_silence(denoised, self.vad_aggressiveness)
+        if denoised.sample_rate != whisper.audio.SAMPLE_RATE:
+            logger.warning(f"La frecuencia de muestreo del audio es {denoised.sample_rate} Hz, se esperaba {whisper.audio.SAMPLE_RATE} Hz. Remuestreando audio.")
+            samples = resampy.resample(denoised.samples, denoised.sample_rate, whisper.audio.SAMPLE_RATE)
+            denoised = AudioBuffer(samples.astype(np.float32), whisper.audio.SAMPLE_RATE, denoised.source)
+        return denoised
+
+    def _prepare_mel(self, audio: AudioBuffer) -> torch.Tensor:
+        """Calcula el espectrograma mel de la ventana de 30 s que espera el encoder de Whisper."""
+        return whisper.log_mel_spectrogram(whisper.pad_or_trim(audio.samples)).to(self.device)
+
+    def _transcribe_fast(self, audio: AudioBuffer) -> str:
+        """Transcribe un clip corto con faster-whisper (decodificación voraz, sin marcas de tiempo)."""
+        segments, _ = self._fast_model.transcribe(
+            audio.samples, language="es", beam_size=1, without_timestamps=True, condition_on_previous_text=False
+        )
+        self._fast_path_requests += 1
+        return "".join(segment.text for segment in segments).strip()
+
+    def _decode_mel_batch(self, mels: List[torch.Tensor]) -> List[str]:
+        """Decodifica varios mel de la misma forma en un único forward de Whisper."""
+        options = whisper.DecodingOptions(language="es", fp16=self.device == "cuda")
+        results = whisper.decode(self._model, torch.stack(mels), options)
+        return [result.text for result in results]
+
+    def _transcribe_audio_sync(self, audio: AudioInput) -> Optional[str]:
+        """
+        Lógica síncrona para transcribir audio a texto.
+
+        El preprocesado (recorte VAD y supresión de ruido) se hace en el hilo que llama. Los
+        clips cortos van al backend rápido si está disponible; el resto se entrega al
+        planificador de micro-lotes para compartir el forward con solicitudes concurrentes.
 
         Args:
-            audio_path (str): La ruta al archivo de audio a transcribir.
+            audio (AudioInput): Audio ya decodificado (AudioBuffer) o ruta a un archivo de audio.
 
         Returns:
             Optional[str]: El texto transcrito si la operación fue exitosa, None en caso de error.
         """
         try:
-            denoised_audio_path = suppress_noise(audio_path)
-            if denoised_audio_path is None:
-                logger.error(f"No se pudo suprimir el ruido del audio: {audio_path}")
+            speech = self._preprocess(audio)
+            if speech is None:
                 return None
-
-            audio, sr = sf.read(denoised_audio_path)
-            if sr != whisper.audio.SAMPLE_RATE:
-                logger.warning(f"La frecuencia de muestreo del audio es {sr} Hz, se esperaba {whisper.audio.SAMPLE_RATE} Hz. Remuestreando audio.")
-                audio = resampy.resample(audio, sr, whisper.audio.SAMPLE_RATE)
-                sr = whisper.audio.SAMPLE_RATE
-            if audio.ndim > 1:
-                audio = audio.mean(axis=1)
-            audio = audio.astype(np.float32)
-            audio = whisper.pad_or_trim(audio)
-            
-            mel = whisper.log_mel_spectrogram(audio).to(self.device)
-            
-            options = whisper.DecodingOptions(language="es", fp16=self.device == "cuda")
-            result = whisper.decode(self._model, mel, options)
-            
-            return result.text
+            if self._fast_model is not None and speech.duration <= self.fast_path_max_s:
+                return self._transcribe_fast(speech)
+            mel = self._prepare_mel(speech)
+            return self._batcher.submit(mel, key=tuple(mel.shape)).result()
         except Exception as e:
-            logger.error(f"Error durante la transcripción del audio '{audio_path}': {e}")
+            logger.error(f"Error durante la transcripción del audio '{getattr(audio, 'source', audio)}': {e}")
             return None
-        finally:
-            if 'denoised_audio_path' in locals() and denoised_audio_path and os.path.exists(denoised_audio_path):
-                os.remove(denoised_audio_path)
-                logger.debug(f"Archivo temporal eliminado: {denoised_audio_path}")
 
-    def transcribe_audio(self, audio_path: str):
+    def transcribe_audio(self, audio: AudioInput):
         """
-        Transcribe un archivo de audio a texto de manera asíncrona.
+        Transcribe audio a texto de manera asíncrona.
 
         Args:
-            audio_path (str): La ruta al archivo de audio a transcribir.
+            audio (AudioInput): AudioBuffer o ruta al archivo de audio a transcribir.
 
         Returns:
             concurrent.futures.Future: Un objeto Future que representa el resultado de la operación.
@@ -158,4 +259,76 @@ class STTModule:
             future.set_result(None)
             return future
         
-        return self._executor.submit(self._transcribe_audio_sync, audio_path)
\ No newline at end of file
+        return self._executor.submit(self._transcribe_audio_sync, audio)
+
+    def _timed_transcribe_sync(self, audio: AudioInput, enqueued_at: float) -> Tuple[Optional[str], float, float]:
+        """
+        Ejecuta la transcripción midiendo por separado el tiempo de espera en cola y el de decodificación.
+
+        Returns:
+            Tuple[Optional[str], float, float]: Texto transcrito, espera en cola (s) y decodificación (s).
+        """
+        started_at = time.perf_counter()
+        text = self._transcribe_audio_sync(audio)
+        return text, started_at - enqueued_at, time.perf_counter() - started_at
+
+    async def transcribe_audio_async(self, audio: AudioInput) -> Dict[str, Any]:
+        """
+        Transcribe audio sin bloquear el event loop.
+
+        La solicitud se admite solo si hay hueco en la cola acotada; en caso contrario se
+        rechaza de inmediato para que la API pueda responder 503 en lugar de acumular trabajo.
+
+        Args:
+            audio (AudioInput): AudioBuffer ya decodificado o ruta al archivo de audio a transcribir.
+
+        Returns:
+            Dict[str, Any]: text, queue_wait_ms y decode_ms.
+
+        Raises:
+            STTQueueFullError: Si ya hay max_queue_size transcripciones pendientes.
+        """
+        if not self.is_online():
+            logger.warning("El módulo STT está fuera de línea. No se puede transcribir el audio.")
+            return {"text": None, "queue_wait_ms": 0.0, "decode_ms": 0.0}
+
+        if self._pending >= self.max_queue_size:
+            self._rejected += 1
+            logger.warning(f"Cola STT llena ({self._pending}/{self.max_queue_size}). Solicitud rechazada.")
+            raise STTQueueFullError(self.max_queue_size)
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            text, queue_wait, decode_time = await loop.run_in_executor(
+                self._executor, self._timed_transcribe_sync, audio, time.perf_counter()
+            )
+        finally:
+            self._pending -= 1
+
+        self._last_queue_wait = queue_wait
+        self._last_decode_time = decode_time
+        logger.info(f"Transcripción completada: espera en cola {queue_wait * 1000:.0f} ms, decodificación {decode_time * 1000:.0f} ms")
+        return {
+            "text": text,
+            "queue_wait_ms": round(queue_wait * 1000, 1),
+            "decode_ms": round(decode_time * 1000, 1)
+        }
+
+    def get_queue_stats(self) -> Dict[str, Any]:
+        """
+        Devuelve el estado de la cola de transcripción.
+
+        Returns:
+            Dict[str, Any]: Solicitudes pendientes, capacidad, rechazos, últimos tiempos medidos y
+            estadísticas de los micro-lotes de Whisper.
+        """
+        return {
+            "pending": self._pending,
+            "max_queue_size": self.max_queue_size,
+            "rejected": self._rejected,
+            "last_queue_wait_ms": round(self._last_queue_wait * 1000, 1),
+            "last_decode_ms": round(self._last_decode_time * 1000, 1),
+            "fast_path_requests": self._fast_path_requests,
+            "batching": self._batcher.get_stats()
+        }
@@ -0,0 +1,149 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger("WhisperBatcher")
+
+DEFAULT_BATCH_WINDOW_MS = 25
+DEFAULT_MAX_BATCH_SIZE = 4
+
+_STOP = object()
+
+
+@dataclass
+class _BatchItem:
+    payload: Any
+    key: Hashable
+    future: Future = field(default_factory=Future)
+
+
+class WhisperBatcher:
+    """
+    Planificador de micro-lotes para la inferencia de Whisper.
+
+    Un único hilo consume la cola: toma la primera solicitud, espera como mucho
+    `batch_window_s` a que lleguen más (hasta `max_batch_size`) y llama a `decode_batch`
+    una vez por grupo de solicitudes con la misma clave (p. ej. la forma del mel), de
+    modo que solicitudes concurrentes comparten un único forward del modelo. Cada
+    resultado se entrega en el Future de su solicitud.
+    """
+
+    def __init__(
+        self,
+        decode_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        batch_window_s: float = DEFAULT_BATCH_WINDOW_MS / 1000
+    ):
+        """
+        Args:
+            decode_batch (Callable[[List[Any]], List[Any]]): Decodifica una lista de entradas y
+                devuelve un resultado por entrada, en el mismo orden.
+            max_batch_size (int): Máximo de solicitudes por lote.
+            batch_window_s (float): Tiempo máximo de espera para completar un lote.
+        """
+        self._decode_batch = decode_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_window_s = max(0.0, batch_window_s)
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._batches = 0
+        self._batched_items = 0
+        self._last_batch_size = 0
+        self._last_batch_time = 0.0
+
+    def submit(self, payload: Any, key: Hashable = None) -> Future:
+        """
+        Encola una entrada para el siguiente lote.
+
+        Returns:
+            Future: Se resuelve con el resultado de `decode_batch` para esta entrada.
+        """
+        self._ensure_started()
+        item = _BatchItem(payload, key)
+        self._queue.put(item)
+        return item.future
+
+    def shutdown(self) -> None:
+        """Detiene el hilo del planificador tras procesar las solicitudes ya encoladas."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._thread = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self._batches,
+            "batched_requests": self._batched_items,
+            "avg_batch_size": round(self._batched_items / self._batches, 2) if self._batches else 0.0,
+            "last_batch_size": self._last_batch_size,
+            "last_batch_ms": round(self._last_batch_time * 1000, 1),
+            "max_batch_size": self.max_batch_size,
+            "batch_window_ms": round(self.batch_window_s * 1000, 1),
+        }
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="whisper-batcher", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            stop = self._collect(batch)
+            self._process(batch)
+            if stop:
+                return
+
+    def _collect(self, batch: List[_BatchItem]) -> bool:
+        """Completa el lote hasta `max_batch_size` o hasta que venza la ventana. Devuelve True si se pidió parar."""
+        deadline = time.perf_counter() + self.batch_window_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                return False
+            if item is _STOP:
+                return True
+            batch.append(item)
+        return False
+
+    def _process(self, batch: List[_BatchItem]) -> None:
+        groups: Dict[Hashable, List[_BatchItem]] = {}
+        for item in batch:
+            groups.setdefault(item.key, []).append(item)
+
+        started_at = time.perf_counter()
+        for items in groups.values():
+            items = [item for item in items if item.future.set_running_or_notify_cancel()]
+            if not items:
+                continue
+            try:
+                results = self._decode_batch([item.payload for item in items])
+                if len(results) != len(items):
+                    raise RuntimeError(f"decode_batch devolvió {len(results)} resultados para {len(items)} entradas")
+            except Exception as e:
+                logger.error(f"Error decodificando un lote de {len(items)} solicitudes: {e}")
+                for item in items:
+                    item.future.set_exception(e)
+                continue
+            for item, result in zip(items, results):
+                item.future.set_result(result)
+
+        self._last_batch_time = time.perf_counter() - started_at
+        self._last_batch_size = len(batch)
+        self._batches += 1
+        self._batched_items += len(batch)
+        if len(batch) > 1:
+            logger.debug(f"Lote Whisper de {len(batch)} solicitudes decodificado en {self._last_batch_time * 1000:.0f} ms")
@@ -0,0 +1,93 @@
+import logging
+import threading
+from typing import Optional
+
+import numpy as np
+import pyaudio
+
+logger = logging.getLogger("AudioOutput")
+
+DEFAULT_OUTPUT_SAMPLE_RATE = 24000
+_WRITE_CHUNK_FRAMES = 2048
+
+
+class AudioOutputDevice:
+    """
+    Salida de audio persistente compartida por todo el proceso.
+
+    El stream de PyAudio (float32, mono) se abre la primera vez que se reproduce algo y se
+    reutiliza en las siguientes reproducciones; solo se reabre si cambia la frecuencia de
+    muestreo. Las reproducciones se serializan con un lock, de modo que dos respuestas no
+    se mezclan en el altavoz.
+    """
+
+    def __init__(self):
+        self._pa: Optional[pyaudio.PyAudio] = None
+        self._stream = None
+        self._sample_rate: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def play(self, samples: np.ndarray, sample_rate: int = DEFAULT_OUTPUT_SAMPLE_RATE) -> bool:
+        """
+        Reproduce un buffer PCM (bloqueante; usar desde un hilo con `asyncio.to_thread`).
+
+        Args:
+            samples (np.ndarray): Audio mono en float [-1, 1] o int16.
+            sample_rate (int): Frecuencia de muestreo del buffer.
+
+        Returns:
+            bool: True si la reproducción fue exitosa, False en caso contrario.
+        """
+        pcm = self._to_float32(samples)
+        if pcm.size == 0:
+            return True
+        with self._lock:
+            try:
+                stream = self._ensure_stream(sample_rate)
+                for start in range(0, len(pcm), _WRITE_CHUNK_FRAMES):
+                    stream.write(pcm[start:start + _WRITE_CHUNK_FRAMES].tobytes())
+                return True
+            except Exception as e:
+                logger.error(f"Error al reproducir audio: {e}")
+                self._close_locked()
+                return False
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_locked()
+
+    def _ensure_stream(self, sample_rate: int):
+        if self._stream is not None and self._sample_rate == sample_rate:
+            return self._stream
+        self._close_locked()
+        self._pa = pyaudio.PyAudio()
+        self._stream = self._pa.open(format=pyaudio.paFloat32, channels=1, rate=sample_rate, output=True)
+        self._sample_rate = sample_rate
+        logger.info(f"Salida de audio abierta a {sample_rate} Hz.")
+        return self._stream
+
+    def _close_locked(self) -> None:
+        if self._stream is not None:
+            try:
+                self._stream.stop_stream()
+                self._stream.close()
+            except Exception as e:
+                logger.error(f"Error al cerrar stream de audio: {e}")
+            self._stream = None
+        if self._pa is not None:
+            try:
+                self._pa.terminate()
+            except Exception as e:
+                logger.error(f"Error al terminar PyAudio: {e}")
+            self._pa = None
+        self._sample_rate = None
+
+    @staticmethod
+    def _to_float32(samples: np.ndarray) -> np.ndarray:
+        samples = np.asarray(samples)
+        if samples.dtype == np.int16:
+            return samples.astype(np.float32) / 32768.0
+        return np.ascontiguousarray(np.clip(samples, -1.0, 1.0), dtype=np.float32)
+
+
+audio_output = AudioOutputDevice()
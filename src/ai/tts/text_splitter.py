@@ -5,14 +5,19 @@ logger = logging.getLogger("TextSplitter")
 
 MAX_SENTENCE_LENGTH = 150  # Define la longitud máxima de una frase en caracteres
 
+# Divide por puntos, signos de interrogación, signos de exclamación, comas, dos puntos o punto y coma, manteniendo el delimitador.
+SENTENCE_DELIMITER_REGEX = re.compile(r'(\.(?![0-9]|\s*Son las )|(?<!\d):(?![\d])|!|\?|;|,|-)')
+
+# Caracteres que deben seguir a un delimitador para resolver sus condiciones de anticipación ('.' seguido de ' Son las ')
+_DELIMITER_LOOKAHEAD_CHARS = 10
+
 def _split_text_into_sentences(text: str) -> list[str]:
     """
     Divide un texto en una lista de frases utilizando signos de puntuación como delimitadores.
     Además, divide frases muy largas en segmentos más pequeños.
     """
     logger.debug(f"Texto original para dividir: {text[:100]}...")
-    # Divide por puntos, signos de interrogación, signos de exclamación, comas, dos puntos o punto y coma, manteniendo el delimitador.
-    sentences = re.split(r'(\.(?![0-9]|\s*Son las )|(?<!\d):(?![\d])|!|\?|;|,|-)', text)
+    sentences = SENTENCE_DELIMITER_REGEX.split(text)
     
     # Reconstruye las frases con sus delimitadores y filtra cadenas vacías
     result = []
@@ -64,4 +69,40 @@ def _split_text_into_sentences(text: str) -> list[str]:
             final_result.append(sentence.strip())
 
     logger.debug(f"Frases finales después de la división por longitud: {len(final_result)} frases. Contenido: {final_result}")
-    return [s for s in final_result if s]
\ No newline at end of file
+    return [s for s in final_result if s]
+
+
+class IncrementalSentenceSplitter:
+    """
+    Divide en frases un texto que llega por fragmentos (streaming del LLM).
+
+    Aplica las mismas reglas que `_split_text_into_sentences`, pero solo entrega el texto
+    hasta el último delimitador ya confirmado; el resto queda en el búfer hasta el
+    siguiente fragmento o hasta `flush()`.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, text: str) -> list[str]:
+        """Añade un fragmento y devuelve las frases que ya están completas."""
+        self._buffer += text
+        cut = 0
+        for match in SENTENCE_DELIMITER_REGEX.finditer(self._buffer):
+            if len(self._buffer) - match.end() < _DELIMITER_LOOKAHEAD_CHARS:
+                break
+            cut = match.end()
+
+        if not cut and len(self._buffer) > MAX_SENTENCE_LENGTH:
+            # Frase demasiado larga sin delimitador: cortar en el último espacio permitido
+            cut = self._buffer.rfind(' ', 0, MAX_SENTENCE_LENGTH) + 1
+
+        if not cut:
+            return []
+        complete, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        return _split_text_into_sentences(complete)
+
+    def flush(self) -> list[str]:
+        """Devuelve las frases que quedan en el búfer al terminar el texto."""
+        rest, self._buffer = self._buffer, ""
+        return _split_text_into_sentences(rest) if rest.strip() else []
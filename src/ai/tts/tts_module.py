@@ -5,10 +5,17 @@ import logging
 from concurrent.futures import ThreadPoolExecutor
 import asyncio
 from pathlib import Path
+import time
 import uuid
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Tuple, TypeVar, Union
+
+import numpy as np
+
+from src.ai.tts.audio_output import DEFAULT_OUTPUT_SAMPLE_RATE, audio_output
 from src.ai.tts.text_splitter import _split_text_into_sentences
 
 BUFFER_SIZE = 2
+DEFAULT_LOOKAHEAD = BUFFER_SIZE
 MODEL_NAME = "tts_models/multilingual/multi-dataset/xtts_v2"
 SPEAKER = "Sofia Hellen"
 
@@ -17,6 +24,10 @@ logger = logging.getLogger("TTSModule")
 AUDIO_OUTPUT_DIR = Path("src/ai/tts/generated_audio")
 AUDIO_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
+T = TypeVar("T")
+Sentences = Union[Iterable[str], AsyncIterable[str]]
+_END_OF_STREAM = object()
+
 class TTSModule:
     """
     Módulo para la síntesis de voz a texto (TTS) utilizando el modelo XTTSv2.
@@ -24,16 +35,17 @@ class TTSModule:
     Permite cargar un modelo TTS, verificar su estado en línea y generar archivos de audio
     a partir de texto de forma concurrente.
     """
-    def __init__(self, model_name: str = None, speaker: str = None):
+    def __init__(self, model_name: str = None, speaker: str = None, lookahead: int = None):
         """
         Inicializa el módulo TTS.
 
         Args:
             model_name (str): Nombre del modelo TTS a cargar. Si no se proporciona, se carga desde la configuración.
             speaker (str): Nombre del hablante a utilizar para la síntesis de voz. Si no se proporciona, se carga desde la configuración.
+            lookahead (int): Frases que se sintetizan por delante de la que se está reproduciendo. Si no se proporciona, se carga desde la configuración.
         """
-        # Cargar model_name y speaker desde config si no se proporcionan
-        if model_name is None or speaker is None:
+        # Cargar model_name, speaker y lookahead desde config si no se proporcionan
+        if model_name is None or speaker is None or lookahead is None:
             try:
                 from pathlib import Path
                 from src.ai.nlp.config.config_manager import ConfigManager
@@ -50,6 +62,9 @@ class TTSModule:
                 if speaker is None:
                     speaker = config.get("tts_speaker", "Sofia Hellen")
                     logger.info(f"Speaker TTS cargado desde configuración: {speaker}")
+
+                if lookahead is None:
+                    lookahead = int(config.get("tts_lookahead", DEFAULT_LOOKAHEAD))
                     
             except Exception as e:
                 logger.warning(f"No se pudo cargar configuración TTS: {e}. Usando valores por defecto.")
@@ -57,11 +72,22 @@ class TTSModule:
                     model_name = "tts_models/multilingual/multi-dataset/xtts_v2"
                 if speaker is None:
                     speaker = "Sofia Hellen"
+                if lookahead is None:
+                    lookahead = DEFAULT_LOOKAHEAD
         
         self.tts = None
         self.is_online_status: bool = False
         self.model_name: str = model_name
         self.speaker: str = speaker
+        self.lookahead: int = max(1, lookahead)
+        self._stream_stats: Dict[str, float] = {
+            "streams": 0,
+            "sentences": 0,
+            "gaps": 0,
+            "total_gap_ms": 0.0,
+            "max_gap_ms": 0.0,
+            "last_first_audio_ms": 0.0,
+        }
         self.device: str = "cuda" if torch.cuda.is_available() else "cpu"
         self._executor = ThreadPoolExecutor(max_workers=2)
         self._load_model()
@@ -89,13 +115,20 @@ class TTSModule:
         """
         return self.is_online_status
 
+    @property
+    def output_sample_rate(self) -> int:
+        """Frecuencia de muestreo del audio que genera el modelo cargado."""
+        synthesizer = getattr(self.tts, "synthesizer", None)
+        return getattr(synthesizer, "output_sample_rate", None) or DEFAULT_OUTPUT_SAMPLE_RATE
+
     def shutdown(self) -> None:
         """
-        Cierra el ThreadPoolExecutor.
+        Cierra el ThreadPoolExecutor y la salida de audio compartida.
         """
         if self._executor:
             self._executor.shutdown(wait=True)
             logger.info("ThreadPoolExecutor del módulo TTS cerrado.")
+        audio_output.close()
 
     def _generate_speech_sync(self, text: str, file_path: str) -> str | None:
         """
@@ -141,7 +174,7 @@ class TTSModule:
     async def generate_audio_files_from_text(self, text: str) -> list[Path]:
         """
         Genera múltiples archivos de audio a partir de un texto largo, dividiéndolo en frases.
-        La generación es secuencial para garantizar el orden correcto y la calidad.
+        Las frases se sintetizan en orden, una tras otra, sin pausas artificiales entre ellas.
 
         Args:
             text (str): El texto completo a convertir en voz.
@@ -153,48 +186,179 @@ class TTSModule:
             logger.warning("El módulo TTS está fuera de línea. No se pueden generar archivos de audio.")
             return []
 
-        os.makedirs(AUDIO_OUTPUT_DIR, exist_ok=True)
-        sentences = _split_text_into_sentences(text)
-        
-        generated_file_paths = []
-        for i, sentence in enumerate(sentences):
-            if not sentence:
-                logger.warning(f"Frase {i+1} vacía, saltando...")
-                continue
-            
-            try:
-                current_tts_audio_output_path = AUDIO_OUTPUT_DIR / f"tts_audio_{uuid.uuid4()}_{i}.wav"
-                logger.info(f"Generando audio {i+1}/{len(sentences)}: '{sentence[:50]}...'")
-                
-                future = self.generate_speech(sentence, str(current_tts_audio_output_path))
-                result = await asyncio.to_thread(future.result)
-                
-                if result and os.path.exists(result):
-                    generated_file_paths.append(Path(result))
-                    logger.info(f"Audio {i+1} generado exitosamente: {result}")
-                else:
-                    logger.error(f"Error: Audio {i+1} no generado correctamente")
-                    
-                await asyncio.sleep(0.1)
-                
-            except Exception as e:
-                logger.error(f"Error al generar audio {i+1}: {str(e)}")
-                continue
-        
+        generated_file_paths = [path async for path in self.generate_audio_stream(text)]
         if not generated_file_paths:
             logger.warning("No se generó ningún archivo de audio")
             return []
-            
-        logger.info(f"Generados {len(generated_file_paths)}/{len(sentences)} archivos de audio")
+
+        logger.info(f"Generados {len(generated_file_paths)} archivos de audio")
         return generated_file_paths
 
-    async def generate_audio_stream(self, text: str):
+    def _synthesize_sync(self, text: str) -> Optional[np.ndarray]:
+        """
+        Lógica síncrona para sintetizar un texto directamente a memoria.
+
+        Args:
+            text (str): El texto a convertir en voz.
+
+        Returns:
+            Optional[np.ndarray]: Audio mono float32 a `output_sample_rate`, o None si falló.
+        """
+        try:
+            wav = self.tts.tts(text=text, speaker=self.speaker, language="es")
+            return np.asarray(wav, dtype=np.float32)
+        except Exception as e:
+            logger.error(f"Error al generar voz: {e}")
+            return None
+
+    async def synthesize_pcm(self, sentence: str) -> Optional[np.ndarray]:
+        """
+        Genera en memoria el audio de una sola frase ya dividida (p. ej. recibida en streaming del LLM).
+
+        Args:
+            sentence (str): Frase a convertir en voz.
+
+        Returns:
+            Optional[np.ndarray]: Audio PCM float32 a `output_sample_rate`, o None si falló.
+        """
+        if not self.is_online() or not sentence:
+            return None
+
+        loop = asyncio.get_running_loop()
+        pcm = await loop.run_in_executor(self._executor, self._synthesize_sync, sentence)
+        if pcm is None or pcm.size == 0:
+            logger.error(f"Error: Audio no generado correctamente para la frase: '{sentence[:50]}...'")
+            return None
+        logger.info(f"GENERATED: Audio generado para la frase '{sentence[:50]}...' ({pcm.size / self.output_sample_rate:.2f}s)")
+        return pcm
+
+    async def _synthesize_file(self, sentence: str) -> Optional[Path]:
+        """Genera el archivo WAV de una frase en el executor; devuelve su ruta o None si falló."""
+        os.makedirs(AUDIO_OUTPUT_DIR, exist_ok=True)
+        output_path = AUDIO_OUTPUT_DIR / f"tts_stream_audio_{uuid.uuid4()}.wav"
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._executor, self._generate_speech_sync, sentence, str(output_path))
+        if result and os.path.exists(result):
+            logger.info(f"GENERATED: Audio generado para la frase '{sentence[:50]}...': {result}")
+            return Path(result)
+        logger.error(f"Error: Audio no generado correctamente para la frase: '{sentence[:50]}...'")
+        return None
+
+    async def _pipelined(
+        self,
+        sentences: Sentences,
+        synthesize: Callable[[str], Awaitable[Optional[T]]],
+        lookahead: Optional[int] = None
+    ) -> AsyncIterator[T]:
+        """
+        Productor/consumidor de síntesis por frases.
+
+        Una tarea productora sintetiza las frases en orden (una a la vez, el modelo no se usa
+        en paralelo) y deja los resultados en una cola; como mucho `lookahead` frases quedan
+        sintetizadas o en síntesis por delante de la que el consumidor tiene entre manos. Así
+        la frase i+1 se genera en el executor mientras se reproduce la frase i.
+
+        El tiempo que el consumidor espera a la siguiente frase es el hueco audible entre
+        frases y se acumula en las métricas de `get_stats()`.
+        """
+        depth = max(1, lookahead if lookahead is not None else self.lookahead)
+        slots = asyncio.Semaphore(depth)
+        ready: asyncio.Queue = asyncio.Queue()
+
+        async def produce() -> None:
+            try:
+                async for sentence in _iterate_sentences(sentences):
+                    if not sentence:
+                        continue
+                    await slots.acquire()
+                    try:
+                        result = await synthesize(sentence)
+                    except Exception as e:
+                        logger.error(f"Error al generar audio para la frase '{sentence[:50]}...': {str(e)}")
+                        result = None
+                    if result is None:
+                        slots.release()
+                        continue
+                    ready.put_nowait(result)
+            finally:
+                ready.put_nowait(_END_OF_STREAM)
+
+        stats = self._stream_stats
+        stats["streams"] += 1
+        producer = asyncio.create_task(produce())
+        first = True
+        try:
+            while True:
+                wait_start = time.perf_counter()
+                item = await ready.get()
+                if item is _END_OF_STREAM:
+                    break
+                slots.release()
+                waited_ms = (time.perf_counter() - wait_start) * 1000
+                if first:
+                    stats["last_first_audio_ms"] = waited_ms
+                    first = False
+                else:
+                    stats["gaps"] += 1
+                    stats["total_gap_ms"] += waited_ms
+                    stats["max_gap_ms"] = max(stats["max_gap_ms"], waited_ms)
+                stats["sentences"] += 1
+                yield item
+        finally:
+            if not producer.done():
+                producer.cancel()
+            try:
+                await producer
+            except asyncio.CancelledError:
+                pass
+
+    async def generate_pcm_stream(self, text: Union[str, Sentences], lookahead: Optional[int] = None) -> AsyncIterator[Tuple[np.ndarray, int]]:
+        """
+        Devuelve el audio en memoria de cada frase en orden, sintetizando por adelantado.
+
+        Args:
+            text (Union[str, Sentences]): Texto completo (se divide en frases) o frases ya divididas,
+                síncronas o asíncronas (p. ej. las que llegan en streaming del LLM).
+            lookahead (Optional[int]): Profundidad de síntesis adelantada; por defecto `self.lookahead`.
+
+        Yields:
+            Tuple[np.ndarray, int]: Audio PCM float32 de la frase y su frecuencia de muestreo.
+        """
+        if not self.is_online():
+            logger.warning("El módulo TTS está fuera de línea. No se puede generar voz en streaming.")
+            return
+
+        sentences = _split_text_into_sentences(text) if isinstance(text, str) else text
+        async for pcm in self._pipelined(sentences, self.synthesize_pcm, lookahead):
+            yield pcm, self.output_sample_rate
+
+    async def speak(self, text: Union[str, Sentences], lookahead: Optional[int] = None) -> bool:
+        """
+        Sintetiza un texto frase a frase y lo reproduce por la salida de audio persistente.
+
+        Mientras suena una frase, las siguientes se sintetizan en el executor.
+
+        Args:
+            text (Union[str, Sentences]): Texto a decir, o frases ya divididas.
+            lookahead (Optional[int]): Profundidad de síntesis adelantada; por defecto `self.lookahead`.
+
+        Returns:
+            bool: True si se reprodujo al menos una frase, False en caso contrario.
+        """
+        played = False
+        async for pcm, sample_rate in self.generate_pcm_stream(text, lookahead):
+            played = await asyncio.to_thread(audio_output.play, pcm, sample_rate) or played
+        return played
+
+    async def generate_audio_stream(self, text: str, lookahead: Optional[int] = None):
         """
         Genera archivos de audio a partir de un texto largo, dividiéndolo en frases,
         y devuelve cada archivo de audio tan pronto como está disponible (streaming).
+        La frase siguiente se sintetiza mientras el consumidor procesa la actual.
 
         Args:
             text (str): El texto completo a convertir en voz.
+            lookahead (Optional[int]): Profundidad de síntesis adelantada; por defecto `self.lookahead`.
 
         Yields:
             Path: La ruta a un archivo de audio generado.
@@ -203,27 +367,35 @@ class TTSModule:
             logger.warning("El módulo TTS está fuera de línea. No se puede generar voz en streaming.")
             return
 
-        os.makedirs(AUDIO_OUTPUT_DIR, exist_ok=True)
-        sentences = _split_text_into_sentences(text)
-
-        for i, sentence in enumerate(sentences):
-            if not sentence:
-                logger.warning(f"Frase {i+1} vacía, saltando...")
-                continue
+        async for path in self._pipelined(_split_text_into_sentences(text), self._synthesize_file, lookahead):
+            yield path
 
-            try:
-                current_tts_audio_output_path = AUDIO_OUTPUT_DIR / f"tts_stream_audio_{uuid.uuid4()}_{i}.wav"
-                logger.info(f"GENERATED: Generando audio {i+1}/{len(sentences)}: '{sentence[:50]}...' en {current_tts_audio_output_path}")
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Devuelve las métricas de síntesis en streaming.
 
-                future = self.generate_speech(sentence, str(current_tts_audio_output_path))
-                result = await asyncio.to_thread(future.result)
+        Returns:
+            Dict[str, Any]: Profundidad de lookahead, frases servidas y huecos entre frases
+                (tiempo que el consumidor esperó a la siguiente frase) en milisegundos.
+        """
+        stats = self._stream_stats
+        gaps = stats["gaps"]
+        return {
+            "lookahead": self.lookahead,
+            "streams": int(stats["streams"]),
+            "sentences": int(stats["sentences"]),
+            "gaps": int(gaps),
+            "avg_gap_ms": round(stats["total_gap_ms"] / gaps, 2) if gaps else 0.0,
+            "max_gap_ms": round(stats["max_gap_ms"], 2),
+            "last_first_audio_ms": round(stats["last_first_audio_ms"], 2),
+        }
 
-                if result and os.path.exists(result):
-                    yield Path(result)
-                    logger.info(f"GENERATED: Audio {i+1} generado y enviado: {result}")
-                else:
-                    logger.error(f"Error: Audio {i+1} no generado correctamente para la frase: '{sentence[:50]}...'")
 
-            except Exception as e:
-                logger.error(f"Error al generar audio {i+1} para la frase '{sentence[:50]}...': {str(e)}")
-                continue
+async def _iterate_sentences(sentences: Sentences) -> AsyncIterator[str]:
+    """Recorre de forma uniforme frases en una lista o en un iterable asíncrono."""
+    if hasattr(sentences, "__aiter__"):
+        async for sentence in sentences:
+            yield sentence
+    else:
+        for sentence in sentences:
+            yield sentence
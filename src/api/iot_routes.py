@@ -6,10 +6,12 @@ import logging
 import asyncio
 from src.api.utils import get_mqtt_client
 from src.iot import device_manager
+from src.iot.device_state_store import device_state_store
+from src.services.command_dispatcher import command_dispatcher
+from src.ai.nlp.iot.iot_command_catalog import iot_command_catalog
 import json
 from src.db.models import IoTCommand as DBLoTCommand, EnergyConsumption, User, TemperatureHistory
 from sqlalchemy import select
-from src.websocket.connection_manager import manager
 from datetime import datetime, timedelta
 from src.api.auth_router import get_current_user
 
@@ -19,61 +21,7 @@ iot_router = APIRouter()
 
 @iot_router.post("/arduino/send_command", status_code=status.HTTP_200_OK)
 async def send_arduino_command(command: ArduinoCommandSend, current_user: User = Depends(get_current_user)):
-    mqtt_client = get_mqtt_client()
-    if not mqtt_client or not mqtt_client.is_connected:
-        logger.error("MQTT client no está inicializado o conectado.")
-        raise HTTPException(status_code=500, detail="MQTT client no está inicializado o conectado.")
-    
-    device_type, device_name, requested_state = device_manager._extract_device_info_from_topic(command.mqtt_topic, command.command_payload)
-
-    if not device_name or not device_type:
-        # Si no se puede extraer información válida, verificar si es un comando de estado (status/get)
-        if command.mqtt_topic.endswith("/status/get"):
-            logger.info(f"Comando de estado detectado para {command.mqtt_topic}. Publicando sin guardar en DB.")
-            success = await mqtt_client.publish(command.mqtt_topic, command.command_payload)
-            if not success:
-                logger.error(f"Fallo al enviar comando MQTT de estado a {command.mqtt_topic} con payload {command.command_payload}")
-                raise HTTPException(status_code=500, detail="Fallo al enviar comando MQTT de estado.")
-            return {"status": "Comando de estado enviado exitosamente", "topic": command.mqtt_topic, "payload": command.command_payload}
-        else:
-            logger.warning(f"No se pudo extraer información de dispositivo válida del tema MQTT: {command.mqtt_topic}")
-            raise HTTPException(status_code=400, detail="Tema MQTT o payload de comando inválido.")
-
-    async with get_db() as session:
-        current_device_state = await device_manager.get_device_state(session, device_name, device_type)
-
-        if current_device_state:
-            current_state_json = json.loads(current_device_state.state_json)
-            current_status = current_state_json.get("status")
-
-            if current_status and current_status.lower() == requested_state.lower():
-                logger.info(f"El dispositivo {device_name} ya está en el estado solicitado: {requested_state}")
-                await manager.broadcast(json.dumps({"type": "device_status_update", "device_name": device_name, "status": requested_state, "message": "El dispositivo ya está en el estado solicitado"}))
-                return {"status": f"El dispositivo {device_name} ya está en el estado solicitado: {requested_state}", "topic": command.mqtt_topic, "payload": command.command_payload}
-        else:
-            await device_manager.update_device_state(
-                session,
-                device_name=device_name,
-                new_state={"status": requested_state},
-                device_type=device_type
-            )
-            logger.info(f"Creado nuevo dispositivo {device_name} de tipo {device_type} con estado inicial {requested_state}")
-            await manager.broadcast(json.dumps({"type": "device_created", "device_name": device_name, "device_type": device_type, "status": requested_state, "message": "Nuevo dispositivo creado"}))
-
-        success = await mqtt_client.publish(command.mqtt_topic, command.command_payload)
-
-        if not success:
-            logger.error(f"Fallo al enviar comando MQTT a {command.mqtt_topic} con payload {command.command_payload}")
-            raise HTTPException(status_code=500, detail="Fallo al enviar comando MQTT.")
-
-        await device_manager.process_mqtt_message_and_update_state(session, command.mqtt_topic, command.command_payload)
-        await device_manager.record_current_device_count(session, current_user.id)
-        
-        updated_device_state = await device_manager.get_device_state(session, device_name, device_type)
-        if updated_device_state:
-            await manager.broadcast(json.dumps({"type": "device_state_updated", "device_name": updated_device_state.device_name, "device_type": updated_device_state.device_type, "state": json.loads(updated_device_state.state_json), "message": "Estado del dispositivo actualizado"}))
-
-        return {"status": "Comando enviado y estado del dispositivo actualizado", "topic": command.mqtt_topic, "payload": command.command_payload}
+    return await command_dispatcher.dispatch(command.mqtt_topic, command.command_payload, current_user)
 
 @iot_router.post("/commands", response_model=List[IoTCommand], status_code=status.HTTP_201_CREATED)
 async def create_iot_command(commands: Union[IoTCommandCreate, List[IoTCommandCreate]]):
@@ -84,14 +32,18 @@ async def create_iot_command(commands: Union[IoTCommandCreate, List[IoTCommandCr
         commands = [commands]
 
     created_commands = []
-    async with get_db() as session:
-        for command_data in commands:
-            db_command = DBLoTCommand(**command_data.model_dump())
-            session.add(db_command)
-            await session.commit()
-            await session.refresh(db_command)
-            logger.info(f"Comando IoT '{command_data.name}' creado exitosamente.")
-            created_commands.append(db_command)
+    try:
+        async with get_db() as session:
+            for command_data in commands:
+                db_command = DBLoTCommand(**command_data.model_dump())
+                session.add(db_command)
+                await session.commit()
+                await session.refresh(db_command)
+                logger.info(f"Comando IoT '{command_data.name}' creado exitosamente.")
+                created_commands.append(db_command)
+    finally:
+        if created_commands:
+            iot_command_catalog.invalidate()
     return created_commands
 
 @iot_router.get("/commands", response_model=List[IoTCommand])
@@ -130,6 +82,7 @@ async def delete_iot_command(command_id: int):
 
         await session.delete(command)
         await session.commit()
+        iot_command_catalog.invalidate()
         logger.info(f"Comando IoT con ID {command_id} eliminado exitosamente.")
         return {"message": "Comando eliminado exitosamente"}
 
@@ -138,35 +91,32 @@ async def get_single_device_state(device_name: str, device_type: str):
     """
     Obtiene el estado de un único dispositivo IoT por su nombre y tipo.
     """
-    async with get_db() as session:
-        device_state = await device_manager.get_device_state(session, device_name, device_type)
-        if device_state is None:
-            logger.warning(f"Estado del dispositivo {device_name} no encontrado.")
-            raise HTTPException(status_code=404, detail="Estado del dispositivo no encontrado")
-        logger.info(f"Estado del dispositivo {device_name} obtenido exitosamente.")
-        return DeviceState(id=device_state.id, device_name=device_state.device_name, device_type=device_state.device_type, state_json=json.loads(device_state.state_json), last_updated=device_state.last_updated)
+    device_states = await device_state_store.list_states(device_type=device_type, device_name=device_name)
+    if not device_states:
+        logger.warning(f"Estado del dispositivo {device_name} no encontrado.")
+        raise HTTPException(status_code=404, detail="Estado del dispositivo no encontrado")
+    logger.info(f"Estado del dispositivo {device_name} obtenido exitosamente.")
+    return DeviceState(**device_states[0])
 
 @iot_router.get("/device_states", response_model=List[DeviceState])
 async def get_all_device_states():
     """
-    Obtiene el estado de todos los dispositivos IoT almacenados en la base de datos.
+    Obtiene el estado de todos los dispositivos IoT desde el registro en memoria.
     """
-    async with get_db() as session:
-        device_states = await device_manager.get_all_device_states(session)
-        return [DeviceState(id=ds.id, device_name=ds.device_name, device_type=ds.device_type, state_json=json.loads(ds.state_json), last_updated=ds.last_updated) for ds in device_states]
+    device_states = await device_state_store.list_states()
+    return [DeviceState(**ds) for ds in device_states]
 
 @iot_router.get("/device_states/by_type/{device_type}", response_model=List[DeviceState])
 async def get_device_states_by_type_route(device_type: str):
     """
     Obtiene el estado de todos los dispositivos IoT de un tipo específico.
     """
-    async with get_db() as session:
-        device_states = await device_manager.get_device_states_by_type(session, device_type)
-        if not device_states:
-            logger.warning(f"No se encontraron dispositivos del tipo {device_type}.")
-            raise HTTPException(status_code=404, detail=f"No se encontraron estados de dispositivo para el tipo {device_type}")
-        logger.info(f"Estados de dispositivos del tipo {device_type} obtenidos exitosamente.")
-        return [DeviceState(id=ds.id, device_name=ds.device_name, device_type=ds.device_type, state_json=json.loads(ds.state_json), last_updated=ds.last_updated) for ds in device_states]
+    device_states = await device_state_store.list_states(device_type=device_type)
+    if not device_states:
+        logger.warning(f"No se encontraron dispositivos del tipo {device_type}.")
+        raise HTTPException(status_code=404, detail=f"No se encontraron estados de dispositivo para el tipo {device_type}")
+    logger.info(f"Estados de dispositivos del tipo {device_type} obtenidos exitosamente.")
+    return [DeviceState(**ds) for ds in device_states]
 
 @iot_router.get("/device_types", response_model=DeviceTypeList)
 async def get_all_device_types_route():
@@ -1,4 +1,3 @@
-import json
 from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect
 import logging
 import asyncio
@@ -17,7 +16,7 @@ from src.api.music_schemas import (
     MusicSeekRequest,
 )
 from src.api import utils
-from src.websocket.connection_manager import manager as ws_manager
+from src.websocket.connection_manager import MUSIC_TOPIC, manager as ws_manager
 from src.db.database import get_db
 from src.auth.auth_service import get_current_user
 from src.db.models import MusicPlayLog, User
@@ -149,7 +148,7 @@ async def stop_music():
             "position": 0,
             "duration": 0,
         }
-        await ws_manager.broadcast(json.dumps(msg, ensure_ascii=False))
+        await ws_manager.publish_state(MUSIC_TOPIC, msg)
 
         return response_obj
     except Exception as e:
@@ -223,7 +222,7 @@ async def seek_music(request: MusicSeekRequest):
             "duration": utils._music_manager.get_duration(),
         }
         await broadcast(msg)
-        await ws_manager.broadcast(json.dumps(msg, ensure_ascii=False))
+        await ws_manager.publish_state(MUSIC_TOPIC, msg)
         return response_obj
     except Exception as e:
         logger.error(f"Error en /music/seek: {e}", exc_info=True)
@@ -1,4 +1,6 @@
 from fastapi import APIRouter, HTTPException, Request, Depends
+from fastapi.responses import StreamingResponse
+import json
 from src.db.database import get_db
 from src.api.nlp_schemas import (
     NLPQuery, NLPResponse, ConversationHistoryResponse, ConversationLogEntry
@@ -64,6 +66,55 @@ async def query_nlp(
         raise HTTPException(status_code=500, detail=f"Error al procesar la consulta NLP: {str(e)}")
 
 
+@nlp_router.post("/nlp/query/stream")
+async def query_nlp_stream(
+    query: NLPQuery,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Consulta NLP en streaming. Devuelve eventos NDJSON (uno por línea): 'delta' con el texto
+    parcial, 'sentence' con cada frase completa, 'command' con los comandos IoT detectados y
+    un último evento 'final' con la respuesta procesada.
+    """
+    token = request.headers.get("Authorization")
+    if not token:
+        raise HTTPException(status_code=401, detail="Token de autorización no proporcionado.")
+    
+    if token.startswith("Bearer "):
+        token = token.split(" ")[1]
+
+    if utils._nlp_module is None:
+        raise HTTPException(status_code=503, detail="El módulo NLP está fuera de línea")
+
+    async def event_stream():
+        final_response = None
+        try:
+            async for event in utils._nlp_module.generate_response_stream(query.prompt, user_id=current_user.id, token=token):
+                if event["type"] == "final":
+                    final_response = event["response"]
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"Error inesperado en consulta NLP en streaming: {e}", exc_info=True)
+            yield json.dumps({"type": "error", "detail": f"Error al procesar la consulta NLP: {str(e)}"}, ensure_ascii=False) + "\n"
+            return
+
+        if final_response is not None:
+            async with get_db() as db:
+                try:
+                    await utils._save_api_log("/nlp/query/stream", query.dict(), final_response, db)
+                except Exception as log_error:
+                    logger.error(f"Error al guardar log de API: {log_error}")
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+@nlp_router.get("/nlp/prompt_stats")
+async def get_prompt_eval_stats():
+    """Devuelve los tokens de prompt evaluados por Ollama y el tiempo hasta el primer token."""
+    if utils._nlp_module is None:
+        raise HTTPException(status_code=503, detail="El módulo NLP está fuera de línea")
+    return utils._nlp_module.get_prompt_eval_stats()
+
 @nlp_router.get("/nlp/history", response_model=ConversationHistoryResponse)
 async def get_user_conversation_history(
     limit: int = 100,
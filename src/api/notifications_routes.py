@@ -5,10 +5,12 @@ from typing import List, Optional
 from src.db.database import get_async_db
 from src.db.models import User
 from src.auth.auth_service import get_current_user
-from src.api.notifications_schemas import NotificationCreate, NotificationUpdate, NotificationResponse, NotificationsListResponse, NotificationStatusUpdate
+from src.api.notifications_schemas import NotificationCreate, NotificationUpdate, NotificationResponse, NotificationsListResponse, NotificationStatusUpdate, UnreadCountResponse
+from src.notification.action_events import action_event_bus
 from src.notification.notification import (
     log_user_action_dependency,
     get_notifications_logic,
+    get_unread_count_logic,
     get_notification_types_logic,
     create_notification_logic,
     update_notification_logic,
@@ -26,10 +28,24 @@ async def get_notifications(
     offset: int = Query(default=0, ge=0, description="Número de notificaciones a omitir"),
     since: Optional[str] = Query(default=None, description="ISO datetime para filtrar por fecha mínima"),
     status: Optional[str] = Query(default=None, description="Filtrar por estado de notificación para el usuario (e.g., 'new', 'read', 'archived')"),
+    before_id: Optional[int] = Query(default=None, description="Cursor: id de la última notificación recibida (sustituye a offset)"),
     current_user: User = Depends(get_current_user)
 ):
     """Devuelve la lista de notificaciones, con filtros opcionales."""
-    return await get_notifications_logic(db, current_user, type, limit, offset, since, status)
+    return await get_notifications_logic(db, current_user, type, limit, offset, since, status, before_id)
+
+@notifications_router.get("/unread_count", response_model=UnreadCountResponse, dependencies=[Depends(get_current_user)])
+async def get_unread_count(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Devuelve el número de notificaciones sin leer del usuario actual."""
+    return await get_unread_count_logic(db, current_user)
+
+@notifications_router.get("/action_events/stats", dependencies=[Depends(get_current_user)])
+async def get_action_event_stats():
+    """Devuelve el estado del bus de acciones de usuario (pendientes, escritas y descartadas)."""
+    return action_event_bus.get_stats()
 
 @notifications_router.get("/types", response_model=List[str], dependencies=[Depends(get_current_user)])
 async def get_notification_types(db: AsyncSession = Depends(get_async_db),
@@ -60,10 +76,11 @@ async def update_notification(
 @notifications_router.delete("/{notification_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(get_current_user)])
 async def delete_notification(
     notification_id: int,
-    db: AsyncSession = Depends(get_async_db)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
 ):
     """Elimina una notificación."""
-    return await delete_notification_logic(db, notification_id)
+    return await delete_notification_logic(db, notification_id, current_user)
 
 @notifications_router.put("/{notification_id}/status", response_model=NotificationResponse, dependencies=[Depends(get_current_user)])
 async def update_notification_status(
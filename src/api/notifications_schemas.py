@@ -18,6 +18,10 @@ class NotificationsListResponse(BaseModel):
     total: int
     limit: int
     offset: int
+    next_before_id: Optional[int] = None
+
+class UnreadCountResponse(BaseModel):
+    unread: int
 
 class NotificationCreate(BaseModel):
     type: str
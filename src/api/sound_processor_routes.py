@@ -1,36 +1,39 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Depends
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Query
+import asyncio
 import logging
-from pathlib import Path
-import tempfile
 from src.api.sound_processor_schemas import AudioProcessResponse
-from src.ai.sound_processor.noise_suppressor import suppress_noise
+from src.ai.sound_processor.noise_suppressor import DEFAULT_NOISE_MODE, NOISE_MODES, suppress_noise
 from src.auth.auth_service import get_current_user
+from src.api import utils
 
 logger = logging.getLogger("SoundProcessorRoutes")
 
 sound_processor_router = APIRouter()
 
 @sound_processor_router.post("/process_audio", response_model=AudioProcessResponse)
-async def process_audio(audio_file: UploadFile = File(...), current_user: str = Depends(get_current_user)):
+async def process_audio(
+    audio_file: UploadFile = File(...),
+    mode: str = Query(DEFAULT_NOISE_MODE, description="'stationary' o 'non_stationary'"),
+    current_user: str = Depends(get_current_user)
+):
     """Procesa un archivo de audio aplicando supresión de ruido y devuelve la ruta al archivo procesado."""
+    if mode not in NOISE_MODES:
+        raise HTTPException(status_code=400, detail=f"Modo no válido. Opciones: {', '.join(NOISE_MODES)}")
     try:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            input_file_location = Path(tmpdir) / audio_file.filename
-            with open(input_file_location, "wb+") as file_object:
-                content = await audio_file.read()
-                file_object.write(content)
-            
-            processed_audio_path = suppress_noise(str(input_file_location))
+        audio = await utils.read_audio_upload(audio_file)
+        processed_audio_path = await asyncio.to_thread(suppress_noise, audio, mode=mode)
 
-            if processed_audio_path is None:
-                raise HTTPException(status_code=500, detail="Error al procesar el audio.")
-            
-            # En un entorno de producción, deberías mover processed_audio_path a un almacenamiento persistente
-            # y devolver una URL accesible. Para este ejemplo, devolvemos la ruta temporal.
-            # Asegúrate de que el cliente pueda acceder a este archivo temporal si es necesario.
-            logger.info(f"Audio procesado y guardado en: {processed_audio_path}")
-            return AudioProcessResponse(processed_audio_path=processed_audio_path)
+        if processed_audio_path is None:
+            raise HTTPException(status_code=500, detail="Error al procesar el audio.")
+        
+        # En un entorno de producción, deberías mover processed_audio_path a un almacenamiento persistente
+        # y devolver una URL accesible. Para este ejemplo, devolvemos la ruta temporal.
+        # Asegúrate de que el cliente pueda acceder a este archivo temporal si es necesario.
+        logger.info(f"Audio procesado y guardado en: {processed_audio_path}")
+        return AudioProcessResponse(processed_audio_path=processed_audio_path)
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error al procesar audio: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Error interno del servidor al procesar audio.")
\ No newline at end of file
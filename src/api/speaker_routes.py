@@ -4,8 +4,6 @@ from src.db.database import get_db
 from src.api.speaker_schemas import UserListResponse, UserCharacteristic, SpeakerUpdateOwnerRequest
 from src.api.schemas import StatusResponse
 import logging
-from pathlib import Path
-import tempfile
 from src.db.models import User
 from src.api import utils
 from src.auth.auth_service import AuthService, get_current_user
@@ -34,20 +32,15 @@ async def register_speaker(
 
             if existing_user:
                 if existing_user.speaker_embedding is None:
-                    with tempfile.TemporaryDirectory() as tmpdir:
-                        file_location = Path(tmpdir) / audio_file.filename
-                        with open(file_location, "wb+") as file_object:
-                            content = await audio_file.read()
-                            file_object.write(content)
-
-                        embedding_str = await utils._speaker_module.update_speaker_voice(
-                            existing_user.id, str(file_location)
-                        )
+                    audio = await utils.read_audio_upload(audio_file)
+                    embedding_data = await utils._speaker_module.update_speaker_voice(
+                        existing_user.id, audio
+                    )
 
-                    if embedding_str is None:
+                    if embedding_data is None:
                         raise HTTPException(status_code=409, detail="La voz proporcionada ya está registrada por otro usuario.")
 
-                    existing_user.speaker_embedding = embedding_str
+                    existing_user.speaker_embedding = embedding_data
                     await db.commit()
                     await db.refresh(existing_user)
 
@@ -64,24 +57,19 @@ async def register_speaker(
                 else:
                     raise HTTPException(status_code=409, detail="El usuario ya tiene un embedding de voz registrado.")
             else:
-                with tempfile.TemporaryDirectory() as tmpdir:
-                    file_location = Path(tmpdir) / audio_file.filename
-                    with open(file_location, "wb+") as file_object:
-                        content = await audio_file.read()
-                        file_object.write(content)
-
-                    embedding_str = await utils._speaker_module.register_speaker(
-                        name, str(file_location), is_owner=is_owner
-                    )
+                audio = await utils.read_audio_upload(audio_file)
+                embedding_data = await utils._speaker_module.register_speaker(
+                    name, audio, is_owner=is_owner
+                )
 
-                if embedding_str is None:
+                if embedding_data is None:
                     raise HTTPException(status_code=409, detail="La voz ya está registrada por otro usuario.")
 
                 await auth_service.register_user(
                     username=name,
                     password=generated_password,
                     is_owner=is_owner,
-                    speaker_embedding=embedding_str
+                    speaker_embedding=embedding_data
                 )
                 token = await auth_service.authenticate_user(
                     username=name,
@@ -118,17 +106,12 @@ async def register_owner_speaker(
             auth_service = AuthService(db)
             generated_password = utils.generate_random_password()
 
-        with tempfile.TemporaryDirectory() as tmpdir:
-            file_location = Path(tmpdir) / audio_file.filename
-            with open(file_location, "wb+") as file_object:
-                content = await audio_file.read()
-                file_object.write(content)
-            
-            embedding_str = await utils._speaker_module.register_speaker(
-                name, str(file_location), is_owner=True
-            )
+        audio = await utils.read_audio_upload(audio_file)
+        embedding_data = await utils._speaker_module.register_speaker(
+            name, audio, is_owner=True
+        )
 
-        if embedding_str is None:
+        if embedding_data is None:
             raise HTTPException(status_code=409, detail="La voz ya está registrada por otro usuario.")
         
         async with get_db() as db:
@@ -138,7 +121,7 @@ async def register_owner_speaker(
                 username=name,
                 password=generated_password,
                 is_owner=True,
-                speaker_embedding=embedding_str
+                speaker_embedding=embedding_data
             )
             token = await auth_service.authenticate_user(
                 username=name,
@@ -173,13 +156,8 @@ async def identify_speaker(audio_file: UploadFile = File(...)):
                 logger.info("No hay usuarios registrados en el sistema")
                 raise HTTPException(status_code=404, detail="No hay usuarios registrados")
         
-        with tempfile.TemporaryDirectory() as tmpdir:
-            file_location = Path(tmpdir) / audio_file.filename
-            with open(file_location, "wb+") as file_object:
-                content = await audio_file.read()
-                file_object.write(content)
-            
-            identified_user, _ = await utils._speaker_module.identify_speaker(str(file_location))
+        audio = await utils.read_audio_upload(audio_file)
+        identified_user, _ = await utils._speaker_module.identify_speaker(audio)
 
         if identified_user is None:
             raise HTTPException(status_code=404, detail="Usuario no identificado")
@@ -225,18 +203,13 @@ async def add_voice_to_user(
             if not user:
                 raise HTTPException(status_code=404, detail=f"Usuario con ID '{user_id}' no encontrado.")
 
-            with tempfile.TemporaryDirectory() as tmpdir:
-                file_location = Path(tmpdir) / audio_file.filename
-                with open(file_location, "wb+") as file_object:
-                    content = await audio_file.read()
-                    file_object.write(content)
-                
-                embedding_str = await utils._speaker_module.update_speaker_voice(user.id, str(file_location))
+            audio = await utils.read_audio_upload(audio_file)
+            embedding_data = await utils._speaker_module.update_speaker_voice(user.id, audio)
 
-            if embedding_str is None:
+            if embedding_data is None:
                 raise HTTPException(status_code=409, detail="La voz proporcionada ya está registrada por otro usuario.")
             
-            user.speaker_embedding = embedding_str
+            user.speaker_embedding = embedding_data
             await db.commit()
             await db.refresh(user)
 
@@ -3,9 +3,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from src.db.database import get_db
 from src.api.stt_schemas import STTResponse
 import logging
-from pathlib import Path
-import tempfile
 from src.api import utils
+from src.ai.stt.stt import STTQueueFullError
 from src.auth.auth_service import get_current_user
 from src.db.models import User
 
@@ -13,6 +12,23 @@ logger = logging.getLogger("APIRoutes")
 
 stt_router = APIRouter()
 
+async def _transcribe_upload(audio_file: UploadFile) -> STTResponse:
+    """Decodifica el audio subido en memoria y lo transcribe a través de la cola acotada del módulo STT."""
+    audio = await utils.read_audio_upload(audio_file)
+    try:
+        result = await utils._stt_module.transcribe_audio_async(audio)
+    except STTQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+    if result["text"] is None:
+        raise HTTPException(status_code=500, detail="No se pudo transcribir el audio")
+
+    return STTResponse(
+        text=result["text"],
+        queue_wait_ms=result["queue_wait_ms"],
+        decode_ms=result["decode_ms"]
+    )
+
 @stt_router.post("/stt/transcribe", response_model=STTResponse)
 async def transcribe_audio(
     audio_file: UploadFile = File(...),
@@ -23,22 +39,13 @@ async def transcribe_audio(
         raise HTTPException(status_code=503, detail="El módulo STT está fuera de línea")
     
     try:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            file_location = Path(tmpdir) / audio_file.filename
-            with open(file_location, "wb+") as file_object:
-                content = await audio_file.read()
-                file_object.write(content)
-            
-            transcribed_text = utils._stt_module.transcribe_audio(str(file_location)).result()
-
-        if transcribed_text is None:
-            raise HTTPException(status_code=500, detail="No se pudo transcribir el audio")
-        
-        response_obj = STTResponse(text=transcribed_text)
+        response_obj = await _transcribe_upload(audio_file)
         async with get_db() as db:
             await utils._save_api_log("/stt/transcribe", {"filename": audio_file.filename}, response_obj.dict(), db)
         return response_obj
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error en transcripción STT para /stt/transcribe: {e}")
         raise HTTPException(status_code=500, detail="Error al transcribir el audio")
@@ -54,23 +61,20 @@ async def transcribe_audio_authenticated(
         raise HTTPException(status_code=503, detail="El módulo STT está fuera de línea")
     
     try:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            file_location = Path(tmpdir) / audio_file.filename
-            with open(file_location, "wb+") as file_object:
-                content = await audio_file.read()
-                file_object.write(content)
-            
-            transcribed_text = utils._stt_module.transcribe_audio(str(file_location)).result()
-
-        if transcribed_text is None:
-            raise HTTPException(status_code=500, detail="No se pudo transcribir el audio")
-        
-        response_obj = STTResponse(text=transcribed_text)
+        response_obj = await _transcribe_upload(audio_file)
         async with get_db() as db:
             await utils._save_api_log("/stt/transcribe/auth", {"filename": audio_file.filename, "user_id": current_user.id}, response_obj.dict(), db)
         return response_obj
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error en transcripción STT autenticada para /stt/transcribe/auth: {e}")
         raise HTTPException(status_code=500, detail="Error al transcribir el audio")
-        
\ No newline at end of file
+
+@stt_router.get("/stt/queue")
+async def get_stt_queue_stats():
+    """Devuelve el estado de la cola de transcripción (pendientes, rechazos y tiempos)."""
+    if utils._stt_module is None:
+        raise HTTPException(status_code=503, detail="El módulo STT está fuera de línea")
+    return utils._stt_module.get_queue_stats()
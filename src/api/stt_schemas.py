@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from typing import Optional
 
 class STTRequest(BaseModel):
     """Modelo para la solicitud de transcripción de audio."""
@@ -7,4 +8,5 @@ class STTRequest(BaseModel):
 class STTResponse(BaseModel):
     """Modelo para la respuesta de transcripción de audio."""
     text: str
-    
\ No newline at end of file
+    queue_wait_ms: Optional[float] = None
+    decode_ms: Optional[float] = None
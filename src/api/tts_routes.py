@@ -48,3 +48,10 @@ async def generate_audio(request: TTSTextRequest, db: AsyncSession = Depends(get
     except Exception as e:
         logger.error(f"Error en generación de audio TTS para /tts/generate_audio: {e}")
         raise HTTPException(status_code=500, detail="Error al generar el audio")
+
+@tts_router.get("/tts/stats")
+async def get_tts_stats():
+    """Devuelve las métricas de síntesis en streaming (lookahead y huecos entre frases)."""
+    if utils._tts_module is None:
+        raise HTTPException(status_code=503, detail="El módulo TTS está fuera de línea")
+    return utils._tts_module.get_stats()
@@ -4,13 +4,15 @@ from datetime import datetime
 import json
 from src.ai.nlp.core.nlp_core import NLPModule
 from src.ai.stt.stt import STTModule
+from src.ai.sound_processor.audio_buffer import AudioBuffer
 from src.ai.speaker.speaker import SpeakerRecognitionModule
 from src.ai.tts.tts_module import TTSModule
 from src.rc.rc_core import FaceRecognitionCore 
-from src.ai.hotword.hotword import HotwordDetector, hotword_callback_async
+from src.ai.hotword.hotword import HotwordDetector, hotword_callback_async, identify_speaker_early
 from src.db.database import SessionLocal
 from src.iot import device_manager
 from src.iot.mqtt_client import MQTTClient
+from src.iot.device_state_store import device_state_store
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.db.models import APILog
 import asyncio
@@ -23,6 +25,7 @@ from src.ai.nlp.config.config_manager import ConfigManager
 from src.services.audit_service import get_audit_service
 import random
 import string
+from fastapi import HTTPException, UploadFile
 
 logger = logging.getLogger("APIUtils")
 
@@ -268,7 +271,7 @@ async def _initialize_hotword_module() -> None:
         )
         
         if _hotword_module:
-            _hotword_task = asyncio.create_task(_hotword_module.start(hotword_callback_async))
+            _hotword_task = asyncio.create_task(_hotword_module.start(hotword_callback_async, early_callback=identify_speaker_early))
             await _hotword_module._online_event.wait()
             logger.info(f"Módulo Hotword inicializado correctamente. Online: {_hotword_module.is_online()}")
         else:
@@ -284,8 +287,9 @@ async def _initialize_mqtt_client() -> None:
 
 
     if mqtt_broker and mqtt_port:
+        await device_state_store.start()
         _mqtt_client = await ErrorHandler.safe_execute_async(
-            lambda: MQTTClient(broker=mqtt_broker, port=int(mqtt_port), session_factory=SessionLocal, device_manager=device_manager),
+            lambda: MQTTClient(broker=mqtt_broker, port=int(mqtt_port), session_factory=SessionLocal, device_manager=device_manager, state_store=device_state_store),
             default_return=None,
             context="initialize_nlp.mqtt_client"
         )
@@ -348,6 +352,7 @@ async def shutdown_mqtt_client() -> None:
         )
         logger.info("Desconectando cliente MQTT...")
         _mqtt_client = None
+    await device_state_store.stop()
 
 async def shutdown_speaker_module() -> None:
     global _speaker_module
@@ -394,6 +399,20 @@ def generate_random_password(length: int = 12) -> str:
     password = ''.join(random.choice(characters) for i in range(length))
     return password
 
+async def read_audio_upload(audio_file: UploadFile) -> AudioBuffer:
+    """
+    Lee un audio subido y lo decodifica en memoria (16 kHz mono float32) sin escribirlo a disco.
+
+    Raises:
+        HTTPException: 400 si el audio no se puede decodificar.
+    """
+    content = await audio_file.read()
+    try:
+        return await asyncio.to_thread(AudioBuffer.from_bytes, content, audio_file.filename)
+    except ValueError as e:
+        logger.error(f"No se pudo decodificar el audio '{audio_file.filename}': {e}")
+        raise HTTPException(status_code=400, detail="Audio inválido o en un formato no soportado")
+
 async def enable_module(module_name: str) -> bool:
     """
     Habilita un módulo dinámicamente.
@@ -8,12 +8,22 @@ websocket_router = APIRouter()
 
 @websocket_router.websocket("/ws/{client_id}")
 async def websocket_general_endpoint(websocket: WebSocket, client_id: str):
-    await manager.connect(websocket)
+    await manager.connect(websocket, client_id)
     try:
         while True:
             data = await websocket.receive_text()
             logger.info(f"Mensaje recibido de {client_id}: {data}")
+            if await manager.handle_client_message(websocket, data):
+                continue
             await manager.send_personal_message(f"Tú escribiste: {data}", websocket)
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
         logger.info(f"Cliente #{client_id} desconectado")
+    except Exception as e:
+        logger.warning(f"Conexión con el cliente #{client_id} cerrada por error: {e}")
+    finally:
+        manager.disconnect(websocket)
+
+@websocket_router.get("/ws/stats")
+async def get_websocket_stats():
+    """Devuelve el estado de las colas de salida de los clientes WebSocket (profundidad y descartes)."""
+    return manager.get_stats()
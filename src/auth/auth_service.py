@@ -28,7 +28,7 @@ class AuthService:
         result = await db.execute(select(User).filter(User.nombre == username))
         return result.scalar_one_or_none()
 
-    async def register_user(self, username: str, password: str, is_owner: bool = False, face_embedding: str = None, speaker_embedding: str = None) -> User:
+    async def register_user(self, username: str, password: str, is_owner: bool = False, face_embedding: bytes = None, speaker_embedding: bytes = None) -> User:
         """
         Registra un nuevo usuario en el sistema.
         """
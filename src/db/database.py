@@ -54,7 +54,21 @@ async def create_all_tables() -> None:
     except Exception as e:
         logger.warning(f"No se pudieron importar todos los modelos: {e}. Intentando importar lo que exista.")
         from db import models
-    
+
+    try:
+        from src.db.migrations import migrate_user_embeddings
+        async with SessionLocal() as db:
+            await migrate_user_embeddings(db)
+    except Exception as e:
+        logger.error(f"Error al migrar embeddings de usuarios: {e}")
+
+    try:
+        from src.db.migrations import migrate_global_notification_fanout
+        async with SessionLocal() as db:
+            await migrate_global_notification_fanout(db)
+    except Exception as e:
+        logger.error(f"Error al migrar notificaciones globales: {e}")
+
     try:
         from src.db.migrations import create_nlp_indexes
         async with SessionLocal() as db:
@@ -71,6 +85,14 @@ async def create_all_tables() -> None:
     except Exception as e:
         logger.error(f"Error al crear índices de rutinas: {e}")
 
+    try:
+        from src.db.migrations import create_notification_indexes
+        async with SessionLocal() as db:
+            await create_notification_indexes(db)
+            logger.info("Índices de notificaciones creados exitosamente")
+    except Exception as e:
+        logger.error(f"Error al crear índices de notificaciones: {e}")
+
     try:
         from src.db.migrations import create_music_indexes
         async with SessionLocal() as db:
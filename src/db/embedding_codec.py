@@ -0,0 +1,71 @@
+import json
+import logging
+import struct
+from typing import Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger("EmbeddingCodec")
+
+# Cabecera de 8 bytes: firma, código de dtype, reservado y dimensión (little-endian).
+# Con 8 bytes el vector queda alineado y `np.frombuffer` lo lee sin copiar.
+EMBEDDING_MAGIC = b"EMB"
+_HEADER = struct.Struct("<3sBxxH")
+HEADER_SIZE = _HEADER.size
+
+_DTYPE_CODES = {1: np.dtype("<f4"), 2: np.dtype("<f8")}
+_CODES_BY_DTYPE = {dtype: code for code, dtype in _DTYPE_CODES.items()}
+
+
+def encode_embedding(embedding: np.ndarray, dtype: Any = np.float32) -> bytes:
+    """
+    Serializa un embedding como cabecera tipada + vector binario.
+
+    Args:
+        embedding (np.ndarray): Vector a guardar; se aplana a una dimensión.
+        dtype: Tipo de almacenamiento (float32 por defecto, float64 admitido).
+
+    Returns:
+        bytes: Valor listo para `users.speaker_embedding` o `users.face_embedding`.
+    """
+    target = np.dtype(dtype).newbyteorder("<")
+    if target not in _CODES_BY_DTYPE:
+        raise ValueError(f"Tipo de embedding no soportado: {target}")
+    vector = np.ascontiguousarray(embedding, dtype=target).reshape(-1)
+    return _HEADER.pack(EMBEDDING_MAGIC, _CODES_BY_DTYPE[target], vector.shape[0]) + vector.tobytes()
+
+
+def is_encoded_embedding(value: Any) -> bool:
+    """Indica si `value` ya está en el formato binario con cabecera."""
+    return (
+        isinstance(value, (bytes, bytearray, memoryview))
+        and len(value) >= HEADER_SIZE
+        and bytes(value[:len(EMBEDDING_MAGIC)]) == EMBEDDING_MAGIC
+    )
+
+
+def decode_embedding(value: Any, legacy_dtype: Any = np.float64) -> Optional[np.ndarray]:
+    """
+    Convierte un embedding almacenado en un vector NumPy, o None si no es válido.
+
+    El formato binario se lee sin copia con `np.frombuffer` (el array resultante es de solo
+    lectura). También se aceptan los formatos anteriores: texto JSON con la lista de floats
+    (voz) y bytes crudos de `tobytes()` sin cabecera (cara), interpretados con `legacy_dtype`.
+    """
+    if value is None:
+        return None
+    try:
+        if is_encoded_embedding(value):
+            _, code, dim = _HEADER.unpack_from(value)
+            dtype = _DTYPE_CODES.get(code)
+            if dtype is None or len(value) != HEADER_SIZE + dim * dtype.itemsize:
+                raise ValueError(f"cabecera inconsistente (dtype={code}, dim={dim}, bytes={len(value)})")
+            embedding = np.frombuffer(value, dtype=dtype, count=dim, offset=HEADER_SIZE)
+        elif isinstance(value, str):
+            embedding = np.asarray(json.loads(value), dtype=np.float32)
+        else:
+            embedding = np.frombuffer(value, dtype=legacy_dtype)
+    except (TypeError, ValueError) as e:
+        logger.error(f"Embedding almacenado inválido: {e}")
+        return None
+    return embedding if embedding.ndim == 1 and embedding.size else None
@@ -253,4 +253,146 @@ async def drop_temperature_indexes(db: AsyncSession) -> None:
         logger.error(f"Error al eliminar índices de historial de temperatura: {e}")
         await db.rollback()
         raise
-    
\ No newline at end of file
+
+
+async def create_notification_indexes(db: AsyncSession) -> None:
+    indexes = [
+        """
+        CREATE INDEX IF NOT EXISTS idx_user_notifications_user_status 
+        ON user_notifications(user_id, status)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_notifications_timestamp_id 
+        ON notifications(timestamp DESC, id DESC)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_notifications_global_timestamp 
+        ON notifications(is_global, timestamp DESC)
+        """,
+    ]
+
+    try:
+        for index_sql in indexes:
+            await db.execute(text(index_sql))
+            logger.info(f"Índice creado: {index_sql.strip()[:50]}...")
+        await db.commit()
+        logger.info("Índices de notificaciones creados exitosamente")
+    except Exception as e:
+        logger.error(f"Error al crear índices de notificaciones: {e}")
+        await db.rollback()
+        raise
+
+
+async def drop_notification_indexes(db: AsyncSession) -> None:
+    indexes = [
+        "idx_user_notifications_user_status",
+        "idx_notifications_timestamp_id",
+        "idx_notifications_global_timestamp",
+    ]
+
+    try:
+        for index_name in indexes:
+            await db.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+            logger.info(f"Índice eliminado: {index_name}")
+        await db.commit()
+        logger.info("Todos los índices de notificaciones eliminados")
+    except Exception as e:
+        logger.error(f"Error al eliminar índices de notificaciones: {e}")
+        await db.rollback()
+        raise
+
+
+async def migrate_user_embeddings(db: AsyncSession) -> int:
+    """
+    Convierte `users.speaker_embedding` (JSON) y `users.face_embedding` (bytes float64 sin
+    cabecera) al formato binario float32 con cabecera de `embedding_codec`.
+
+    Es idempotente: las filas ya convertidas se ignoran.
+
+    Returns:
+        int: Número de usuarios actualizados.
+    """
+    from src.db.embedding_codec import decode_embedding, encode_embedding, is_encoded_embedding
+
+    try:
+        result = await db.execute(text(
+            "SELECT id, speaker_embedding, face_embedding FROM users "
+            "WHERE speaker_embedding IS NOT NULL OR face_embedding IS NOT NULL"
+        ))
+        migrated = 0
+        for user_id, speaker_value, face_value in result.all():
+            changes = {}
+            for column, value in (("speaker_embedding", speaker_value), ("face_embedding", face_value)):
+                if value is None or is_encoded_embedding(value):
+                    continue
+                embedding = decode_embedding(value)
+                if embedding is None:
+                    logger.warning(f"Embedding '{column}' del usuario {user_id} no convertible; se elimina.")
+                changes[column] = encode_embedding(embedding) if embedding is not None else None
+
+            if changes:
+                assignments = ", ".join(f"{column} = :{column}" for column in changes)
+                await db.execute(text(f"UPDATE users SET {assignments} WHERE id = :id"), {**changes, "id": user_id})
+                migrated += 1
+
+        await db.commit()
+        if migrated:
+            logger.info(f"Embeddings de {migrated} usuarios convertidos a formato binario")
+        return migrated
+
+    except Exception as e:
+        logger.error(f"Error al migrar embeddings de usuarios: {e}")
+        await db.rollback()
+        raise
+
+
+async def _migration_applied(db: AsyncSession, name: str) -> bool:
+    await db.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "name VARCHAR PRIMARY KEY, applied_at DATETIME DEFAULT CURRENT_TIMESTAMP)"
+    ))
+    result = await db.execute(text("SELECT 1 FROM schema_migrations WHERE name = :name"), {"name": name})
+    return result.first() is not None
+
+
+async def _mark_migration_applied(db: AsyncSession, name: str) -> None:
+    await db.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": name})
+
+
+GLOBAL_NOTIFICATION_FANOUT_MIGRATION = "global_notification_fanout"
+
+
+async def migrate_global_notification_fanout(db: AsyncSession) -> int:
+    """
+    Pasa las notificaciones globales al modelo de fan-out en lectura.
+
+    Antes cada notificación global se replicaba en una UserNotification "new" por
+    usuario; ahora se guarda una sola vez y la ausencia de fila equivale a "new". Se
+    eliminan esas réplicas y se conservan las filas con otro estado (leída, archivada...).
+
+    Se ejecuta una sola vez (queda registrada en `schema_migrations`): después, una fila
+    "new" de una global es una marca intencionada (p. ej. marcar como no leída) y no se toca.
+
+    Returns:
+        int: Número de filas eliminadas.
+    """
+    try:
+        if await _migration_applied(db, GLOBAL_NOTIFICATION_FANOUT_MIGRATION):
+            await db.commit()
+            return 0
+
+        result = await db.execute(text(
+            "DELETE FROM user_notifications WHERE status = 'new' AND notification_id IN "
+            "(SELECT id FROM notifications WHERE is_global = 1)"
+        ))
+        await _mark_migration_applied(db, GLOBAL_NOTIFICATION_FANOUT_MIGRATION)
+        await db.commit()
+        removed = result.rowcount or 0
+        if removed:
+            logger.info(f"Eliminadas {removed} réplicas de notificaciones globales")
+        return removed
+
+    except Exception as e:
+        logger.error(f"Error al migrar notificaciones globales: {e}")
+        await db.rollback()
+        raise
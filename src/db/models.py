@@ -184,7 +184,8 @@ class User(Base):
     Atributos:
         id (int): Identificador único del usuario.
         nombre (str): Nombre único del usuario.
-        embedding (str): Vector de incrustación del usuario (serializado).
+        speaker_embedding (bytes): Embedding de voz float32 con cabecera (ver `embedding_codec`).
+        face_embedding (bytes): Embedding facial float32 con cabecera (ver `embedding_codec`).
         is_owner (bool): Indica si el usuario es el propietario del sistema.
         preferences (List[Preference]): Preferencias del usuario.
         permissions (List[UserPermission]): Permisos del usuario.
@@ -193,8 +194,8 @@ class User(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     nombre = Column(String(100), unique=True, nullable=False)
     hashed_password = Column(String(255), nullable=False)
-    speaker_embedding = Column(Text, nullable=True)
-    face_embedding = Column(Text, nullable=True)
+    speaker_embedding = Column(LargeBinary, nullable=True)
+    face_embedding = Column(LargeBinary, nullable=True)
     refresh_token = Column(String(255), nullable=True)
     is_owner = Column(Boolean, default=False)
 
@@ -487,6 +488,29 @@ class UserNotification(Base):
         return f"<UserNotification(id={self.id}, user_id={self.user_id}, notification_id={self.notification_id}, status='{self.status}')>"
 
 
+class NotificationReadCursor(Base):
+    __tablename__ = "notification_read_cursors"
+    """
+    Marca de agua de lectura de notificaciones globales por usuario.
+
+    Las notificaciones globales no se replican por usuario (fan-out en lectura): un
+    usuario solo tiene UserNotification para las que ha marcado. La compactación sustituye
+    las marcas "read" antiguas por esta marca de agua: toda notificación global anterior a
+    `read_before` sin UserNotification se considera leída.
+
+    Atributos:
+        user_id (int): ID del usuario.
+        read_before (datetime): Las notificaciones globales anteriores se consideran leídas.
+        updated_at (datetime): Fecha de la última compactación que la movió.
+    """
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    read_before = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    def __repr__(self) -> str:
+        return f"<NotificationReadCursor(user_id={self.user_id}, read_before={self.read_before})>"
+
+
 class MusicPlayLog(Base):
     __tablename__ = "music_play_log"
 
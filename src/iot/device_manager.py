@@ -5,6 +5,7 @@ from sqlalchemy.future import select
 from src.db.models import DeviceState, DeviceCountHistory, EnergyConsumption, TemperatureHistory, User
 from src.api.iot_schemas import DeviceStateCreate
 import json
+import time
 from datetime import datetime, timedelta
 
 POWER_CONSUMPTION_RATES = {
@@ -29,6 +30,15 @@ POWER_CONSUMPTION_RATES = {
 
 logger = logging.getLogger("DeviceManager")
 
+# Usuario al que se asignan las lecturas de temperatura recibidas por MQTT (id, instante de la consulta)
+_TEMPERATURE_OWNER_TTL_SEC = 300
+_temperature_owner_cache: Tuple[Optional[int], float] = (None, 0.0)
+
+def _state_registry():
+    # Importación diferida: device_state_store depende de este módulo
+    from src.iot.device_state_store import device_state_store
+    return device_state_store
+
 def _extract_device_info_from_topic(mqtt_topic: str, command_payload: str) -> Tuple[Optional[str], Optional[str], str]:
     """
     Extrae el tipo de dispositivo, el nombre del dispositivo y el valor del estado
@@ -90,6 +100,7 @@ async def delete_device_state(db: AsyncSession, device_id: int) -> bool:
     if db_device_state:
         await db.delete(db_device_state)
         await db.commit()
+        _state_registry().remove(db_device_state.device_type, db_device_state.device_name)
         logger.info(f"Estado del dispositivo con ID {device_id} eliminado.")
         return True
     logger.warning(f"No se encontró el estado del dispositivo con ID {device_id} para eliminar.")
@@ -105,6 +116,7 @@ async def create_device_state(db: AsyncSession, device_state: DeviceStateCreate)
     db.add(db_device_state)
     await db.commit()
     await db.refresh(db_device_state)
+    _state_registry().record(db_device_state.device_type, db_device_state.device_name, device_state.state_json, device_id=db_device_state.id)
     logger.info(f"Estado de dispositivo creado: {device_state.device_name}")
     return db_device_state
 
@@ -115,13 +127,23 @@ async def update_device_state(db: AsyncSession, device_name: str, new_state: Dic
     """
     db_device_state = await get_device_state(db, device_name, device_type)
     if db_device_state:
+        registry = _state_registry()
+        # Incluir los campos recibidos por MQTT que aún no se han volcado a la fila
+        pending_key = (db_device_state.device_type, db_device_state.device_name)
+        pending = registry.take_pending(*pending_key)
         current_state = json.loads(db_device_state.state_json)
+        current_state.update(pending)
         current_state.update(new_state)
         db_device_state.state_json = json.dumps(current_state)
         if device_type:
             db_device_state.device_type = device_type
-        await db.commit()
+        try:
+            await db.commit()
+        except Exception:
+            registry.restore_pending(*pending_key, pending)
+            raise
         await db.refresh(db_device_state)
+        registry.record(db_device_state.device_type, db_device_state.device_name, current_state, device_id=db_device_state.id)
         logger.info(f"Estado de dispositivo actualizado: {device_name}")
         return db_device_state
     else:
@@ -132,6 +154,44 @@ async def update_device_state(db: AsyncSession, device_name: str, new_state: Dic
         logger.info(f"Estado de dispositivo creado (no existía): {device_name}")
         return await create_device_state(db, device_state_create)
 
+async def update_device_states(db: AsyncSession, updates: Dict[Tuple[str, str], Dict[str, Any]]) -> int:
+    """
+    Actualiza (o crea) el estado de varios dispositivos en una única transacción.
+
+    Args:
+        db (AsyncSession): Sesión de base de datos.
+        updates (Dict[Tuple[str, str], Dict[str, Any]]): Estados nuevos indexados por (device_type, device_name).
+
+    Returns:
+        int: Número de dispositivos escritos.
+    """
+    if not updates:
+        return 0
+
+    device_names = {device_name for _, device_name in updates}
+    result = await db.execute(select(DeviceState).filter(DeviceState.device_name.in_(device_names)))
+    existing = {(ds.device_type, ds.device_name): ds for ds in result.scalars().all()}
+
+    written = []
+    for (device_type, device_name), new_state in updates.items():
+        db_device_state = existing.get((device_type, device_name))
+        if db_device_state:
+            current_state = json.loads(db_device_state.state_json or "{}")
+            current_state.update(new_state)
+            db_device_state.state_json = json.dumps(current_state)
+        else:
+            current_state = dict(new_state)
+            db_device_state = DeviceState(device_name=device_name, device_type=device_type, state_json=json.dumps(current_state))
+            db.add(db_device_state)
+        written.append((db_device_state, current_state))
+
+    await db.commit()
+    registry = _state_registry()
+    for db_device_state, current_state in written:
+        registry.record(db_device_state.device_type, db_device_state.device_name, current_state, device_id=db_device_state.id)
+    logger.info(f"Estados de {len(updates)} dispositivos actualizados en una transacción.")
+    return len(updates)
+
 async def get_all_device_states(db: AsyncSession) -> list[DeviceState]:
     """
     Obtiene el estado de todos los dispositivos.
@@ -301,26 +361,42 @@ async def delete_energy_consumption_history_for_user(db: AsyncSession, user_id:
     await db.commit()
     logger.info(f"Historial de consumo de energía eliminado para el usuario {user_id}.")
 
+async def _get_temperature_owner_id(db: AsyncSession) -> Optional[int]:
+    """
+    Devuelve el ID del usuario al que se asignan las lecturas de temperatura (primer propietario
+    o, si no hay, el primer usuario). Se cachea durante unos minutos para no consultar la tabla
+    de usuarios en cada lectura del sensor.
+    """
+    global _temperature_owner_cache
+    owner_id, fetched_at = _temperature_owner_cache
+    if owner_id is not None and time.monotonic() - fetched_at < _TEMPERATURE_OWNER_TTL_SEC:
+        return owner_id
+
+    result = await db.execute(select(User.id).filter(User.is_owner))
+    owner_id = result.scalars().first()
+
+    if owner_id is None:
+        result = await db.execute(select(User.id))
+        owner_id = result.scalars().first()
+
+    _temperature_owner_cache = (owner_id, time.monotonic())
+    return owner_id
+
 async def log_temperature_history(db: AsyncSession, device_name: str, temperature: float):
     """
     Registra el historial de temperatura. Asigna el registro al primer usuario propietario encontrado.
     """
-    result = await db.execute(select(User).filter(User.is_owner))
-    owner = result.scalars().first()
-
-    if not owner:
-        result = await db.execute(select(User))
-        owner = result.scalars().first()
+    owner_id = await _get_temperature_owner_id(db)
     
-    if owner:
+    if owner_id is not None:
         new_record = TemperatureHistory(
-            user_id=owner.id,
+            user_id=owner_id,
             device_name=device_name,
             temperature=temperature
         )
         db.add(new_record)
         await db.commit()
-        logger.info(f"Temperatura registrada: {temperature}°C para {device_name} (User ID: {owner.id})")
+        logger.info(f"Temperatura registrada: {temperature}°C para {device_name} (User ID: {owner_id})")
     else:
         logger.warning(f"No se encontró usuario para asociar el registro de temperatura de {device_name}")
 
@@ -0,0 +1,242 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from src.db.database import SessionLocal
+from src.db.models import DeviceState
+from src.iot import device_manager
+
+logger = logging.getLogger("DeviceStateStore")
+
+DEFAULT_FLUSH_INTERVAL_SEC = 0.5
+DEFAULT_MAX_PENDING = 200
+
+DeviceKey = Tuple[str, str]
+
+
+class DeviceStateStore:
+    """
+    Registro en memoria y almacén write-behind del estado de los dispositivos.
+
+    Es la fuente autoritativa del estado actual: se carga una vez desde `device_states`
+    y se mantiene al día con los mensajes de estado MQTT y con las escrituras directas de
+    `device_manager.update_device_state`, de modo que las lecturas no consultan la base
+    de datos ni deserializan JSON.
+
+    Las actualizaciones recibidas por MQTT quedan pendientes por dispositivo: varias
+    actualizaciones del mismo dispositivo entre dos escrituras se fusionan en una sola
+    fila. Las pendientes se vuelcan a `device_states` en una única transacción cada
+    `flush_interval` segundos o en cuanto hay `max_pending` dispositivos pendientes.
+    """
+
+    def __init__(self, session_factory=SessionLocal, flush_interval: float = DEFAULT_FLUSH_INTERVAL_SEC, max_pending: int = DEFAULT_MAX_PENDING):
+        self._session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._states: Dict[DeviceKey, Dict[str, Any]] = {}
+        self._meta: Dict[DeviceKey, Dict[str, Any]] = {} # id de la fila y última actualización
+        self._pending: Dict[DeviceKey, Dict[str, Any]] = {}
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._flush_event = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._is_running = False
+        self.coalesced_updates = 0
+        self.flushes = 0
+
+    async def start(self) -> None:
+        if self._is_running:
+            return
+        await self.ensure_loaded()
+        self._is_running = True
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        logger.info("DeviceStateStore iniciado")
+
+    async def stop(self) -> None:
+        """Detiene la tarea de volcado y escribe las actualizaciones pendientes."""
+        self._is_running = False
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        logger.info("DeviceStateStore detenido")
+
+    async def ensure_loaded(self) -> None:
+        """Carga una única vez el estado de todos los dispositivos desde la base de datos."""
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            try:
+                async with self._session_factory() as session:
+                    result = await session.execute(select(DeviceState))
+                    rows = result.scalars().all()
+            except Exception as e:
+                logger.error(f"Error cargando el estado de los dispositivos: {e}")
+                return
+            for row in rows:
+                key = (row.device_type, row.device_name)
+                if key in self._states:
+                    continue # Ya hay un estado más reciente recibido por MQTT
+                self._states[key] = json.loads(row.state_json or "{}")
+                self._meta[key] = {"id": row.id, "last_updated": row.last_updated}
+            self._loaded = True
+            logger.info(f"Registro de estados cargado con {len(rows)} dispositivos")
+
+    def _touch(self, key: DeviceKey, device_id: Optional[int] = None) -> None:
+        meta = self._meta.setdefault(key, {"id": None, "last_updated": None})
+        if device_id is not None:
+            meta["id"] = device_id
+        meta["last_updated"] = datetime.now()
+
+    def update(self, device_type: str, device_name: str, new_state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Registra un nuevo estado para un dispositivo y lo deja pendiente de escritura.
+
+        Returns:
+            Dict[str, Any]: Estado completo del dispositivo tras la actualización.
+        """
+        key = (device_type, device_name)
+        state = self._states.setdefault(key, {})
+        state.update(new_state)
+
+        if key in self._pending:
+            self.coalesced_updates += 1
+        self._pending.setdefault(key, {}).update(new_state)
+        self._touch(key)
+
+        if len(self._pending) >= self.max_pending:
+            self._flush_event.set()
+        return state
+
+    def record(self, device_type: str, device_name: str, state: Dict[str, Any], device_id: Optional[int] = None) -> None:
+        """
+        Registra un estado que ya está escrito en la base de datos.
+
+        Las actualizaciones que sigan pendientes llegaron durante la escritura (quien escribe
+        retira antes las suyas con `take_pending`), así que son más recientes: se conservan y
+        se aplican sobre el estado escrito.
+
+        Args:
+            state (Dict[str, Any]): Estado completo persistido.
+            device_id (Optional[int]): ID de la fila en `device_states`.
+        """
+        key = (device_type, device_name)
+        self._states[key] = {**state, **self._pending.get(key, {})}
+        self._touch(key, device_id)
+
+    def take_pending(self, device_type: str, device_name: str) -> Dict[str, Any]:
+        """
+        Retira las actualizaciones pendientes de un dispositivo para incluirlas en una escritura directa.
+
+        Si la escritura falla deben devolverse con `restore_pending`.
+        """
+        return self._pending.pop((device_type, device_name), {})
+
+    def restore_pending(self, device_type: str, device_name: str, pending: Dict[str, Any]) -> None:
+        """Devuelve actualizaciones retiradas sin pisar las más recientes llegadas entretanto."""
+        if not pending:
+            return
+        key = (device_type, device_name)
+        self._pending[key] = {**pending, **self._pending.get(key, {})}
+
+    def remove(self, device_type: str, device_name: str) -> None:
+        """Elimina un dispositivo del registro."""
+        key = (device_type, device_name)
+        self._states.pop(key, None)
+        self._meta.pop(key, None)
+        self._pending.pop(key, None)
+
+    def get(self, device_type: str, device_name: str) -> Optional[Dict[str, Any]]:
+        """Devuelve el último estado conocido en memoria de un dispositivo, o None."""
+        return self._states.get((device_type, device_name))
+
+    async def list_states(self, device_type: Optional[str] = None, device_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Devuelve los estados registrados con el formato de la tabla `device_states`.
+
+        Los dispositivos creados por MQTT que aún no tienen fila se vuelcan antes para
+        poder devolver su ID.
+
+        Returns:
+            List[Dict[str, Any]]: id, device_name, device_type, state_json y last_updated.
+        """
+        await self.ensure_loaded()
+        keys = [
+            key for key in self._states
+            if (device_type is None or key[0] == device_type) and (device_name is None or key[1] == device_name)
+        ]
+        if any(self._meta.get(key, {}).get("id") is None for key in keys):
+            await self.flush()
+
+        states = []
+        for key in keys:
+            meta = self._meta.get(key, {})
+            if meta.get("id") is None or key not in self._states:
+                continue
+            states.append({
+                "id": meta["id"],
+                "device_name": key[1],
+                "device_type": key[0],
+                "state_json": dict(self._states[key]),
+                "last_updated": meta["last_updated"]
+            })
+        return states
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    async def flush(self) -> int:
+        """
+        Escribe en una sola transacción todas las actualizaciones pendientes.
+
+        Returns:
+            int: Número de dispositivos escritos.
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            try:
+                async with self._session_factory() as session:
+                    written = await device_manager.update_device_states(session, batch)
+                self.flushes += 1
+                return written
+            except Exception as e:
+                logger.error(f"Error volcando {len(batch)} estados de dispositivo: {e}")
+                # Reinsertar el lote sin pisar actualizaciones más recientes llegadas durante la escritura
+                for (device_type, device_name), state in batch.items():
+                    self.restore_pending(device_type, device_name, state)
+                return 0
+
+    async def _flush_loop(self) -> None:
+        while self._is_running:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self._loaded,
+            "devices": len(self._states),
+            "pending": len(self._pending),
+            "coalesced_updates": self.coalesced_updates,
+            "flushes": self.flushes
+        }
+
+
+device_state_store = DeviceStateStore()
@@ -3,12 +3,16 @@ import logging
 import asyncio
 import threading
 import time
-from collections import defaultdict
+from src.iot.topic_router import TopicRouter
 
 logger = logging.getLogger("MQTTClient")
 
+DEFAULT_MESSAGE_QUEUE_SIZE = 1000
+DEFAULT_DISPATCH_BATCH_SIZE = 100
+
 class MQTTClient:
-    def __init__(self, broker: str = "localhost", port: int = 1883, client_id: str = "IoTClient", keepalive: int = 120, session_factory = None, device_manager = None):
+    def __init__(self, broker: str = "localhost", port: int = 1883, client_id: str = "IoTClient", keepalive: int = 120, session_factory = None, device_manager = None, state_store = None,
+                 max_queue_size: int = DEFAULT_MESSAGE_QUEUE_SIZE, dispatch_batch_size: int = DEFAULT_DISPATCH_BATCH_SIZE):
         self.broker = broker
         self.port = port
         self.client_id = client_id
@@ -20,19 +24,32 @@ class MQTTClient:
 
         self.is_connected = False
         self._online_event = asyncio.Event()
-        self.subscriptions = defaultdict(list)
-        self.subscriptions["iot/system/console"].append(self._log_arduino_console_output)
-        self.subscriptions["iot/system/confirmations"].append(self._log_confirmation_output)
-        self.subscriptions["iot/sensors/+/status"].append(self._log_arduino_console_output)
+        self.subscriptions = TopicRouter()
+        self.subscriptions.add("iot/system/console", self._log_arduino_console_output)
+        self.subscriptions.add("iot/system/confirmations", self._log_confirmation_output)
+        self.subscriptions.add("iot/sensors/+/status", self._log_arduino_console_output)
         self.loop = asyncio.get_event_loop()
 
         self.reconnect_delay_sec = 5
         self.max_reconnect_delay_sec = 60
         self.session_factory = session_factory
         self.device_manager = device_manager
+        self.state_store = state_store
+
+        # Los mensajes llegan en el hilo de red de paho y se procesan en una única tarea del event loop
+        self._message_queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self.dispatch_batch_size = dispatch_batch_size
+        self._dispatch_task: asyncio.Task | None = None
+        self.dropped_messages = 0
+
+    def _start_dispatcher(self):
+        if self._dispatch_task is None or self._dispatch_task.done():
+            self._dispatch_task = self.loop.create_task(self._dispatch_loop())
+            logger.debug("Tarea de despacho de mensajes MQTT iniciada.")
 
     def connect(self):
         logger.info(f"Conectando a broker MQTT {self.broker}:{self.port} ...")
+        self.loop.call_soon_threadsafe(self._start_dispatcher)
         try:
             self.client.connect(self.broker, self.port, self.keepalive)
             self.client.loop_start()
@@ -50,7 +67,7 @@ class MQTTClient:
             except Exception:
                 pass
             self.reconnect_delay_sec = 5
-            for topic in list(self.subscriptions.keys()):
+            for topic in self.subscriptions.filters():
                 client.subscribe(topic)
                 logger.info(f"Resuscrito automáticamente a {topic}")
         else:
@@ -101,7 +118,13 @@ class MQTTClient:
             return False
 
     def subscribe(self, topic: str, callback) -> bool:
-        self.subscriptions[topic].append(callback)
+        try:
+            first_subscriber = self.subscriptions.add(topic, callback)
+        except ValueError as e:
+            logger.error(f"Error al suscribirse: {e}")
+            return False
+        if not first_subscriber:
+            return self.is_connected # El filtro ya estaba suscrito en el broker
         if self.is_connected:
             try:
                 self.client.subscribe(topic)
@@ -112,45 +135,82 @@ class MQTTClient:
         return False
 
     def unsubscribe(self, topic: str, callback) -> bool:
-        if topic in self.subscriptions and callback in self.subscriptions[topic]:
-            self.subscriptions[topic].remove(callback)
-            if not self.subscriptions[topic]: # Si no quedan callbacks para este tópico, desuscribirse del broker
-                if self.is_connected:
-                    try:
-                        self.client.unsubscribe(topic)
-                        logger.info(f"Desuscrito de {topic}")
-                        return True
-                    except Exception as e:
-                        logger.error(f"Error al desuscribirse: {e}")
-            return True # Se eliminó la callback, pero puede que queden otras
-        return False
+        try:
+            last_subscriber = self.subscriptions.remove(topic, callback)
+        except KeyError:
+            return False
+        if last_subscriber and self.is_connected: # Si no quedan callbacks para este filtro, desuscribirse del broker
+            try:
+                self.client.unsubscribe(topic)
+                logger.info(f"Desuscrito de {topic}")
+            except Exception as e:
+                logger.error(f"Error al desuscribirse: {e}")
+        return True # Se eliminó la callback, pero puede que queden otras
 
     def _on_message(self, client, userdata, msg):
+        # Se ejecuta en el hilo de red de paho: solo se entrega el mensaje al event loop
         try:
-            device_type, device_name, state_value = self.device_manager._extract_device_info_from_topic(msg.topic, msg.payload.decode())
-
-            if device_name and device_type:
-                if self.session_factory and self.device_manager:
-                    async def update_state_in_session():
-                        async with self.session_factory() as session:
-                            await self.device_manager.update_device_state(
-                                db=session,
-                                device_name=device_name,
-                                new_state={"status": state_value},
-                                device_type=device_type
-                            )
-                    asyncio.run(update_state_in_session())
-                    logger.info(f"Device state updated for {device_type}/{device_name}: {state_value}")
-                else:
-                    logger.warning("Database session factory or device manager not available for state update.")
-
-            if msg.topic in self.subscriptions:
-                for callback in self.subscriptions[msg.topic]:
-                    callback(msg.topic, msg.payload.decode())
-            else:
-                logger.debug(f"Received message on topic: {msg.topic} with payload: {msg.payload.decode()}")
+            self.loop.call_soon_threadsafe(self._enqueue_message, msg.topic, msg.payload.decode())
         except Exception as e:
-            logger.error(f"Error processing MQTT message: {e}")
+            logger.error(f"Error encolando mensaje MQTT: {e}")
+
+    def _enqueue_message(self, topic: str, payload: str):
+        try:
+            self._message_queue.put_nowait((topic, payload))
+        except asyncio.QueueFull:
+            self.dropped_messages += 1
+            logger.warning(f"Cola de mensajes MQTT llena. Mensaje descartado en {topic} (total descartados: {self.dropped_messages}).")
+
+    async def _dispatch_loop(self):
+        """Consume la cola de mensajes en lotes: un lote de mensajes de estado cuesta una sola transacción."""
+        while True:
+            batch = [await self._message_queue.get()]
+            while len(batch) < self.dispatch_batch_size:
+                try:
+                    batch.append(self._message_queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                await self._process_batch(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error processing MQTT message batch: {e}")
+
+    async def _process_batch(self, batch):
+        state_updates = {}
+        for topic, payload in batch:
+            try:
+                if self.device_manager:
+                    device_type, device_name, state_value = self.device_manager._extract_device_info_from_topic(topic, payload)
+                    if device_name and device_type:
+                        state_updates.setdefault((device_type, device_name), {}).update({"status": state_value})
+
+                await self._run_callbacks(topic, payload)
+            except Exception as e:
+                logger.error(f"Error processing MQTT message: {e}")
+
+        if state_updates:
+            if self.state_store:
+                # Escritura diferida: el almacén fusiona y vuelca los estados en lotes
+                for (device_type, device_name), new_state in state_updates.items():
+                    self.state_store.update(device_type, device_name, new_state)
+            elif self.session_factory and self.device_manager:
+                async with self.session_factory() as session:
+                    await self.device_manager.update_device_states(session, state_updates)
+                logger.info(f"Device states updated from {len(batch)} MQTT messages: {len(state_updates)} devices")
+            else:
+                logger.warning("Database session factory or device manager not available for state update.")
+
+    async def _run_callbacks(self, topic: str, payload: str):
+        callbacks = self.subscriptions.match(topic)
+        if not callbacks:
+            logger.debug(f"Received message on topic: {topic} with payload: {payload}")
+            return
+        for callback in callbacks:
+            result = callback(topic, payload)
+            if asyncio.iscoroutine(result):
+                await result
 
     def _log_arduino_console_output(self, topic, payload):
         logger.info(f"Message: {payload}")
@@ -165,6 +225,9 @@ class MQTTClient:
             logger.info(f"Message: Dispositivo: {tipo}_{dispositivo} | Accion: {accion} | Resultado: {resultado}")
 
     def disconnect(self):
+        if self._dispatch_task is not None:
+            self._dispatch_task.cancel()
+            self._dispatch_task = None
         if self.is_connected:
             self.client.loop_stop()
             self.client.disconnect()
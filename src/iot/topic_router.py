@@ -0,0 +1,129 @@
+import logging
+from typing import Callable, Dict, List
+
+logger = logging.getLogger("TopicRouter")
+
+SINGLE_LEVEL_WILDCARD = "+"
+MULTI_LEVEL_WILDCARD = "#"
+
+
+class _TopicNode:
+    __slots__ = ("children", "callbacks")
+
+    def __init__(self):
+        self.children: Dict[str, "_TopicNode"] = {}
+        self.callbacks: List[Callable] = []
+
+
+class TopicRouter:
+    """
+    Índice en trie de filtros de tópicos MQTT con soporte para comodines '+' y '#'.
+
+    Cada nivel del tópico es un nodo del trie, por lo que encontrar todas las callbacks
+    que coinciden con un tópico cuesta O(profundidad) en lugar de recorrer todos los filtros.
+    Lleva además la cuenta de callbacks por filtro para que el cliente MQTT solo se suscriba
+    al broker con la primera callback y se desuscriba con la última.
+    """
+
+    def __init__(self):
+        self._root = _TopicNode()
+        self._counts: Dict[str, int] = {}
+
+    @staticmethod
+    def _validate_filter(topic_filter: str) -> List[str]:
+        levels = topic_filter.split("/")
+        for i, level in enumerate(levels):
+            if MULTI_LEVEL_WILDCARD in level and (level != MULTI_LEVEL_WILDCARD or i != len(levels) - 1):
+                raise ValueError(f"Filtro MQTT inválido '{topic_filter}': '#' debe ocupar el último nivel completo")
+            if SINGLE_LEVEL_WILDCARD in level and level != SINGLE_LEVEL_WILDCARD:
+                raise ValueError(f"Filtro MQTT inválido '{topic_filter}': '+' debe ocupar un nivel completo")
+        return levels
+
+    def add(self, topic_filter: str, callback: Callable) -> bool:
+        """
+        Registra una callback para un filtro.
+
+        Returns:
+            bool: True si es la primera callback del filtro (hay que suscribirse en el broker).
+        """
+        node = self._root
+        for level in self._validate_filter(topic_filter):
+            node = node.children.setdefault(level, _TopicNode())
+        node.callbacks.append(callback)
+        self._counts[topic_filter] = self._counts.get(topic_filter, 0) + 1
+        return self._counts[topic_filter] == 1
+
+    def remove(self, topic_filter: str, callback: Callable) -> bool:
+        """
+        Elimina una callback de un filtro y poda las ramas vacías del trie.
+
+        Returns:
+            bool: True si era la última callback del filtro (hay que desuscribirse en el broker).
+
+        Raises:
+            KeyError: Si la callback no estaba registrada para el filtro.
+        """
+        path = [self._root]
+        for level in topic_filter.split("/"):
+            child = path[-1].children.get(level)
+            if child is None:
+                raise KeyError(topic_filter)
+            path.append(child)
+
+        node = path[-1]
+        if callback not in node.callbacks:
+            raise KeyError(topic_filter)
+        node.callbacks.remove(callback)
+
+        levels = topic_filter.split("/")
+        for depth in range(len(levels), 0, -1):
+            current = path[depth]
+            if current.callbacks or current.children:
+                break
+            del path[depth - 1].children[levels[depth - 1]]
+
+        self._counts[topic_filter] -= 1
+        if self._counts[topic_filter] == 0:
+            del self._counts[topic_filter]
+            return True
+        return False
+
+    def match(self, topic: str) -> List[Callable]:
+        """
+        Devuelve las callbacks de todos los filtros que coinciden con un tópico concreto.
+        """
+        levels = topic.split("/")
+        # Según la especificación MQTT, los comodines del primer nivel no coinciden con tópicos '$SYS/...'
+        allow_wildcards = not topic.startswith("$")
+        matched: List[Callable] = []
+        self._match(self._root, levels, 0, matched, allow_wildcards)
+        return matched
+
+    def _match(self, node: _TopicNode, levels: List[str], index: int, matched: List[Callable], allow_wildcards: bool) -> None:
+        if allow_wildcards:
+            multi = node.children.get(MULTI_LEVEL_WILDCARD)
+            if multi is not None:
+                matched.extend(multi.callbacks)
+
+        if index == len(levels):
+            matched.extend(node.callbacks)
+            return
+
+        exact = node.children.get(levels[index])
+        if exact is not None:
+            self._match(exact, levels, index + 1, matched, True)
+
+        if allow_wildcards:
+            single = node.children.get(SINGLE_LEVEL_WILDCARD)
+            if single is not None:
+                self._match(single, levels, index + 1, matched, True)
+
+    def filters(self) -> List[str]:
+        """Devuelve los filtros que tienen al menos una callback registrada."""
+        return list(self._counts.keys())
+
+    def __contains__(self, topic_filter: str) -> bool:
+        return topic_filter in self._counts
+
+    def __len__(self) -> int:
+        return len(self._counts)
@@ -20,6 +20,7 @@ from src.utils.logger_config import setup_logging
 from src.ai.nlp.config.config_manager import ConfigManager
 from src.auth.default_owner_init import init_default_owner_startup
 from src.services.audit_service import get_audit_service
+from src.notification.action_events import action_event_bus
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 RC_DIR = os.path.join(BASE_DIR, "src", "rc")
@@ -85,6 +86,8 @@ async def startup_event() -> None:
 
     # Iniciar tarea periódica para la temperatura (cada 30 min)
     asyncio.create_task(periodic_temperature_check())
+    # Compactación diaria de marcas de lectura de notificaciones globales
+    asyncio.create_task(periodic_notification_compaction())
 
     if _hotword_module and not _hotword_module.is_online():
         logger.warning("HotwordDetector no está en línea. Verifique configuración.")
@@ -99,6 +102,7 @@ async def shutdown_event() -> None:
 
     await shutdown_hotword_module()
     await shutdown_mqtt_client()
+    await action_event_bus.shutdown()
     await shutdown_ollama_manager()
     await shutdown_speaker_module()
     await shutdown_nlp_module()
@@ -225,4 +229,23 @@ async def periodic_temperature_check():
             logger.error(f"Error en tarea periódica de temperatura: {e}")
             await asyncio.sleep(60) # Reintentar en 1 minuto si falla
 
+async def periodic_notification_compaction():
+    """
+    Tarea en segundo plano que compacta una vez al día las marcas de lectura antiguas
+    de notificaciones globales en la marca de agua de lectura de cada usuario.
+    """
+    from src.db.database import get_db
+    from src.notification.compaction import COMPACTION_INTERVAL_S, compact_read_markers
+
+    while True:
+        try:
+            async with get_db() as db:
+                await compact_read_markers(db)
+            await asyncio.sleep(COMPACTION_INTERVAL_S)
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            logger.error(f"Error en tarea periódica de compactación de notificaciones: {e}")
+            await asyncio.sleep(3600) # Reintentar en 1 hora si falla
+
 app.include_router(router, prefix="")
@@ -1,5 +1,4 @@
 import logging
-import json
 from datetime import datetime
 import threading
 from typing import Optional, Dict, Any, Union
@@ -13,7 +12,7 @@ except ImportError:
     yaml = None
 
 from .yt_dlp_extractor import YtDlpExtractor, ExtractorError
-from src.websocket.connection_manager import manager as ws_manager
+from src.websocket.connection_manager import MUSIC_TOPIC, manager as ws_manager
 from src.db.database import get_db
 from src.db.models import MusicPlayLog
 from sqlalchemy import select
@@ -195,7 +194,7 @@ class MusicManager:
                 "position": self.get_position(),
                 "duration": self.get_duration(),
             }
-            await ws_manager.broadcast(json.dumps(payload, ensure_ascii=False))
+            await ws_manager.publish_state(MUSIC_TOPIC, payload)
 
         self._ensure_loop()
         if self._main_loop is not None:
@@ -233,7 +232,7 @@ class MusicManager:
                                     "position": pos,
                                     "duration": dur,
                                 }
-                                await ws_manager.broadcast(json.dumps(payload, ensure_ascii=False))
+                                await ws_manager.publish_state(MUSIC_TOPIC, payload)
                                 self._position_last_sent = pos
                             await asyncio.sleep(self._position_broadcast_interval)
                         except Exception:
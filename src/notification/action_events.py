@@ -0,0 +1,165 @@
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+from src.api.notifications_schemas import NotificationResponse
+from src.db.models import Notification, UserNotification
+
+logger = logging.getLogger("ActionEventBus")
+
+DEFAULT_FLUSH_INTERVAL_S = 0.25
+DEFAULT_MAX_BUFFER = 1000
+DEFAULT_MAX_BATCH = 200
+
+
+@dataclass(frozen=True)
+class UserActionEvent:
+    """Acción de un usuario autenticado, pendiente de registrarse como notificación."""
+    user_id: int
+    method: str
+    path: str
+    message: str = ""
+    timestamp: datetime = field(default_factory=datetime.now)
+
+
+class ActionEventBus:
+    """
+    Bus en proceso para registrar acciones de usuario sin escribir en el camino de la petición.
+
+    Las rutas solo llaman a `emit()`, que encola el evento y vuelve de inmediato. Una tarea
+    de fondo agrupa lo acumulado cada `flush_interval_s` y lo escribe (Notification más su
+    UserNotification) en una única transacción, y después lo difunde por WebSocket. El
+    buffer está acotado: si se llena, el evento se descarta y se cuenta en `dropped`.
+    """
+
+    def __init__(
+        self,
+        flush_interval_s: float = DEFAULT_FLUSH_INTERVAL_S,
+        max_buffer: int = DEFAULT_MAX_BUFFER,
+        max_batch: int = DEFAULT_MAX_BATCH
+    ):
+        self.flush_interval_s = flush_interval_s
+        self.max_buffer = max_buffer
+        self.max_batch = max_batch
+        self._buffer: Deque[UserActionEvent] = deque()
+        self._writer_task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+        self.emitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+
+    def emit(self, event: UserActionEvent) -> bool:
+        """
+        Encola un evento sin bloquear (debe llamarse desde el event loop).
+
+        Returns:
+            bool: False si el buffer estaba lleno y el evento se descartó.
+        """
+        self._ensure_writer()
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                logger.warning(f"Buffer de acciones de usuario lleno; {self.dropped} eventos descartados en total")
+            return False
+        self._buffer.append(event)
+        self.emitted += 1
+        return True
+
+    def _ensure_writer(self) -> None:
+        if self._stop.is_set():
+            return
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(self._writer_loop())
+
+    async def _writer_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Escribe los eventos pendientes, en lotes de como mucho `max_batch` por transacción."""
+        written = 0
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.max_batch, len(self._buffer)))]
+            try:
+                written += await self._write_batch(batch)
+            except asyncio.CancelledError:
+                # El lote no llegó a confirmarse: vuelve al principio del buffer, en orden
+                self._buffer.extendleft(reversed(batch))
+                raise
+        return written
+
+    async def _write_batch(self, batch: List[UserActionEvent]) -> int:
+        from src.db.database import get_db
+        from src.websocket.connection_manager import manager as ws_manager, user_notifications_topic
+
+        pairs = []
+        try:
+            async with get_db() as db:
+                for event in batch:
+                    notification = Notification(
+                        timestamp=event.timestamp,
+                        type="user_action",
+                        title=f"{event.method} {event.path}",
+                        message=event.message,
+                    )
+                    user_notification = UserNotification(user_id=event.user_id, notification=notification, status="new")
+                    db.add_all([notification, user_notification])
+                    pairs.append((notification, user_notification))
+                await db.commit()
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"Error registrando {len(batch)} acciones de usuario en notificaciones: {e}")
+            return 0
+
+        self.batches += 1
+        self.written += len(batch)
+        for notification, user_notification in pairs:
+            notification_response = NotificationResponse(
+                id=notification.id,
+                timestamp=notification.timestamp,
+                type=notification.type,
+                title=notification.title,
+                message=notification.message,
+                status=user_notification.status
+            )
+            try:
+                await ws_manager.broadcast(notification_response.model_dump_json(), topic=user_notifications_topic(user_notification.user_id))
+            except Exception as e:
+                logger.error(f"Error difundiendo notificación de acción de usuario: {e}")
+        return len(batch)
+
+    async def shutdown(self) -> None:
+        """
+        Detiene la tarea de escritura y vuelca lo pendiente.
+
+        No se cancela la tarea: se le indica que pare y se espera a que termine su volcado
+        en curso, así ningún lote ya sacado del buffer se pierde.
+        """
+        self._stop.set()
+        if self._writer_task is not None:
+            await self._writer_task
+            self._writer_task = None
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._buffer),
+            "max_buffer": self.max_buffer,
+            "emitted": self.emitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
+
+
+action_event_bus = ActionEventBus()
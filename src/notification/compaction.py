@@ -0,0 +1,82 @@
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.db.models import Notification, NotificationReadCursor, User, UserNotification
+from src.notification.feed import READ_STATUS
+
+logger = logging.getLogger("NotificationCompaction")
+
+DEFAULT_READ_MARKER_RETENTION_DAYS = 30
+COMPACTION_INTERVAL_S = 24 * 60 * 60
+
+
+async def compact_read_markers(db: AsyncSession, retention_days: int = DEFAULT_READ_MARKER_RETENTION_DAYS) -> int:
+    """
+    Sustituye las marcas "read" antiguas de notificaciones globales por la marca de agua
+    de lectura de cada usuario (`NotificationReadCursor`).
+
+    Para cada usuario la marca de agua avanza hasta el límite de retención, pero nunca
+    más allá de la notificación global más antigua que siga sin leer (sin UserNotification),
+    así el estado efectivo de ninguna notificación cambia. Después se borran las marcas
+    "read" de globales anteriores a la marca de agua. Las marcas con otros estados
+    (archivada, descartada) se conservan.
+
+    Args:
+        db (AsyncSession): Sesión de base de datos.
+        retention_days (int): Antigüedad a partir de la cual se compactan las marcas.
+
+    Returns:
+        int: Número de marcas "read" eliminadas.
+    """
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    removed = 0
+    try:
+        user_ids = (await db.execute(select(User.id))).scalars().all()
+        for user_id in user_ids:
+            cursor = await db.get(NotificationReadCursor, user_id)
+            current = cursor.read_before if cursor else None
+
+            oldest_unmarked_q = select(func.min(Notification.timestamp)).select_from(Notification).outerjoin(
+                UserNotification,
+                and_(UserNotification.notification_id == Notification.id, UserNotification.user_id == user_id)
+            ).where(
+                Notification.is_global.is_(True),
+                Notification.timestamp < cutoff,
+                UserNotification.id.is_(None)
+            )
+            if current is not None:
+                oldest_unmarked_q = oldest_unmarked_q.where(Notification.timestamp >= current)
+            oldest_unmarked = (await db.execute(oldest_unmarked_q)).scalar()
+
+            read_before = oldest_unmarked or cutoff
+            if current is not None and read_before <= current:
+                continue
+
+            result = await db.execute(
+                delete(UserNotification).where(
+                    UserNotification.user_id == user_id,
+                    UserNotification.status == READ_STATUS,
+                    UserNotification.notification_id.in_(
+                        select(Notification.id).where(Notification.is_global.is_(True), Notification.timestamp < read_before)
+                    )
+                ).execution_options(synchronize_session=False)
+            )
+            removed += result.rowcount or 0
+
+            if cursor is None:
+                db.add(NotificationReadCursor(user_id=user_id, read_before=read_before))
+            else:
+                cursor.read_before = read_before
+
+        await db.commit()
+        if removed:
+            logger.info(f"Compactadas {removed} marcas de lectura de notificaciones globales")
+        return removed
+
+    except Exception as e:
+        logger.error(f"Error al compactar marcas de lectura de notificaciones: {e}")
+        await db.rollback()
+        raise
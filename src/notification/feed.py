@@ -0,0 +1,123 @@
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, case, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.db.models import Notification, NotificationReadCursor, UserNotification
+
+logger = logging.getLogger("NotificationFeed")
+
+UNREAD_STATUS = "new"
+READ_STATUS = "read"
+DISMISSED_STATUS = "dismissed"
+
+
+def _feed_status(user_id: int):
+    """
+    Estado efectivo para el usuario.
+
+    Es el de su UserNotification si la tiene; si no, una global anterior a la marca de
+    agua de lectura del usuario (ver `NotificationReadCursor`) cuenta como leída y el
+    resto como 'new'.
+    """
+    read_before = select(NotificationReadCursor.read_before).where(
+        NotificationReadCursor.user_id == user_id
+    ).scalar_subquery()
+    return func.coalesce(
+        UserNotification.status,
+        case((and_(Notification.is_global.is_(True), Notification.timestamp < read_before), READ_STATUS), else_=UNREAD_STATUS)
+    )
+
+
+def _visible_notifications(user_id: int, columns):
+    """
+    SELECT sobre las notificaciones visibles para el usuario con un único LEFT JOIN.
+
+    Son visibles las globales (almacenadas una sola vez, sin fila por usuario) y las que
+    tienen una UserNotification del usuario, salvo las que el usuario descartó. El join
+    usa el índice único (user_id, notification_id) de user_notifications.
+    """
+    return select(*columns).select_from(Notification).outerjoin(
+        UserNotification,
+        and_(UserNotification.notification_id == Notification.id, UserNotification.user_id == user_id)
+    ).where(
+        or_(Notification.is_global.is_(True), UserNotification.id.isnot(None)),
+        or_(UserNotification.status.is_(None), UserNotification.status != DISMISSED_STATUS)
+    )
+
+
+def _apply_filters(query, user_id: int, type: Optional[str], since: Optional[datetime], status: Optional[str]):
+    if type:
+        query = query.where(Notification.type == type)
+    if since:
+        query = query.where(Notification.timestamp >= since)
+    if status:
+        query = query.where(_feed_status(user_id) == status)
+    return query
+
+
+async def fetch_notification_feed(
+    db: AsyncSession,
+    user_id: int,
+    type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    status: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0,
+    before_id: Optional[int] = None
+) -> Tuple[List[Tuple[Notification, str]], int]:
+    """
+    Obtiene una página del feed de notificaciones del usuario en una sola consulta.
+
+    El filtro por estado, el orden (timestamp e id descendentes) y la paginación se
+    resuelven en SQL. Con `before_id` se pagina por cursor (keyset): se devuelven las
+    notificaciones anteriores a esa, sin recorrer las ya vistas como hace OFFSET.
+
+    Args:
+        db (AsyncSession): Sesión de base de datos.
+        user_id (int): Usuario dueño del feed.
+        type (Optional[str]): Filtrar por tipo de notificación.
+        since (Optional[datetime]): Fecha mínima.
+        status (Optional[str]): Filtrar por estado efectivo para el usuario.
+        limit (int): Tamaño de página.
+        offset (int): Notificaciones a omitir (se ignora si se usa `before_id`).
+        before_id (Optional[int]): Cursor: id de la última notificación de la página anterior.
+
+    Returns:
+        Tuple[List[Tuple[Notification, str]], int]: Pares (notificación, estado) de la página
+            y total de notificaciones que cumplen los filtros.
+    """
+    query = _apply_filters(_visible_notifications(user_id, (Notification, _feed_status(user_id))), user_id, type, since, status)
+    count_query = _apply_filters(_visible_notifications(user_id, (func.count(Notification.id),)), user_id, type, since, status)
+
+    if before_id is not None:
+        cursor_timestamp = select(Notification.timestamp).where(Notification.id == before_id).scalar_subquery()
+        query = query.where(or_(
+            Notification.timestamp < cursor_timestamp,
+            and_(Notification.timestamp == cursor_timestamp, Notification.id < before_id)
+        ))
+        offset = 0
+
+    query = query.order_by(Notification.timestamp.desc(), Notification.id.desc()).limit(limit).offset(offset)
+    rows = (await db.execute(query)).all()
+    total = (await db.execute(count_query)).scalar_one()
+    return [(notification, status_value) for notification, status_value in rows], total
+
+
+async def count_unread_notifications(db: AsyncSession, user_id: int) -> int:
+    """
+    Cuenta las notificaciones sin leer del usuario (estado efectivo 'new').
+
+    Se resuelve con los índices de user_notifications (user_id, status) y de
+    notifications (is_global), sin cargar filas.
+    """
+    query = _visible_notifications(user_id, (func.count(Notification.id),)).where(_feed_status(user_id) == UNREAD_STATUS)
+    return (await db.execute(query)).scalar_one()
+
+
+async def list_notification_types(db: AsyncSession, user_id: int) -> List[str]:
+    """Devuelve los tipos distintos de las notificaciones visibles para el usuario."""
+    query = _visible_notifications(user_id, (Notification.type,)).distinct()
+    return list((await db.execute(query)).scalars().all())
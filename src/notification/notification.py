@@ -4,11 +4,18 @@ from typing import Optional, List
 from fastapi import Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from src.db.database import get_async_db
 from src.db.models import Notification, User, UserNotification
 from src.auth.auth_service import get_current_user
-from src.api.notifications_schemas import NotificationCreate, NotificationUpdate, NotificationResponse, NotificationsListResponse
-from src.websocket.connection_manager import manager as ws_manager
+from src.api.notifications_schemas import NotificationCreate, NotificationUpdate, NotificationResponse, NotificationsListResponse, UnreadCountResponse
+from src.notification.action_events import UserActionEvent, action_event_bus
+from src.notification.feed import (
+    DISMISSED_STATUS,
+    UNREAD_STATUS,
+    count_unread_notifications,
+    fetch_notification_feed,
+    list_notification_types
+)
+from src.websocket.connection_manager import NOTIFICATIONS_TOPIC, manager as ws_manager, user_notifications_topic
 
 
 logger = logging.getLogger("NotificationsModule")
@@ -16,17 +23,15 @@ logger = logging.getLogger("NotificationsModule")
 # --- Service Logic ---
 async def log_user_action_dependency(
     request: Request,
-    user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_async_db)
+    user: User = Depends(get_current_user)
 ) -> None:
     """Dependencia que registra una notificación por cada acción del usuario autenticado.
 
-    Guarda: método, path, user_id, username y (opcionalmente) el body como mensaje.
+    Guarda: método, path, user_id y (opcionalmente) el body como mensaje. Solo emite un
+    evento al bus de acciones; la escritura en base de datos y la difusión por WebSocket
+    se hacen en lote en segundo plano, fuera del tiempo de respuesta de la ruta.
     """
     try:
-        path = request.url.path
-        method = request.method
-
         message: Optional[str] = None
         try:
             body_bytes = await request.body()
@@ -36,41 +41,15 @@ async def log_user_action_dependency(
             # Si no se puede leer el body (por streaming o multipart), continuar sin él
             pass
 
-        # Creamos la notificación global
-        new_notification = Notification(
-            timestamp=datetime.now(),
-            type="user_action",
-            title=f"{method} {path}",
-            message=message or "",
-        )
-        db.add(new_notification)
-        await db.flush() # Para obtener el ID de la notificación antes del commit
-
-        # Creamos la UserNotification para el usuario actual
-        user_notification = UserNotification(
+        action_event_bus.emit(UserActionEvent(
             user_id=user.id,
-            notification_id=new_notification.id,
-            status="new",
-        )
-        db.add(user_notification)
-        await db.commit()
-        # Enviar la nueva notificación por WebSocket
-        notification_response = NotificationResponse(
-            id=new_notification.id,
-            timestamp=new_notification.timestamp,
-            type=new_notification.type,
-            title=new_notification.title,
-            message=new_notification.message,
-            status=user_notification.status
-        )
-        await ws_manager.broadcast(notification_response.model_dump_json())
+            method=request.method,
+            path=request.url.path,
+            message=message or "",
+        ))
     except Exception as e:
         # No romper el flujo del endpoint por errores de logging
         logger.error(f"Error registrando acción de usuario en notificaciones: {e}")
-        try:
-            await db.rollback()
-        except Exception:
-            pass
 
 async def get_notifications_logic(
     db: AsyncSession,
@@ -79,88 +58,44 @@ async def get_notifications_logic(
     limit: int = 50,
     offset: int = 0,
     since: Optional[str] = None,
-    status: Optional[str] = None # Nuevo filtro por estado de UserNotification
+    status: Optional[str] = None, # Filtro por estado de UserNotification
+    before_id: Optional[int] = None
 ) -> NotificationsListResponse:
-    """Devuelve la lista de notificaciones, con filtros opcionales."""
-    try:
-        # 1. Obtener todas las notificaciones relevantes para el usuario
-        # Esto incluye:
-        #   a) Notificaciones específicas del usuario (donde existe UserNotification)
-        #   b) Notificaciones globales (donde Notification.is_global es True)
-        
-        # Subconsulta para obtener los IDs de notificaciones específicas del usuario
-        user_specific_notification_ids_q = select(UserNotification.notification_id).where(
-            UserNotification.user_id == current_user.id
-        )
-        user_specific_notification_ids = (await db.execute(user_specific_notification_ids_q)).scalars().all()
-
-        # Consulta principal para obtener las notificaciones
-        query = select(Notification).outerjoin(
-            UserNotification,
-            (Notification.id == UserNotification.notification_id) & (UserNotification.user_id == current_user.id)
-        ).where(
-            (Notification.is_global) | (Notification.id.in_(user_specific_notification_ids))
-        )
+    """Devuelve la lista de notificaciones, con filtros opcionales.
 
-        if type:
-            query = query.where(Notification.type == type)
+    Incluye las notificaciones globales y las específicas del usuario; filtros, orden y
+    paginación (offset o cursor `before_id`) se resuelven en una sola consulta SQL.
+    """
+    try:
+        since_dt = None
         if since:
             try:
                 since_dt = datetime.fromisoformat(since)
-                query = query.where(Notification.timestamp >= since_dt)
             except ValueError:
                 raise HTTPException(status_code=400, detail="Formato de fecha 'since' inválido. Use ISO 8601.")
-        
-        # Ejecutar la consulta para obtener todas las notificaciones relevantes
-        result = await db.execute(query)
-        notifications_raw = result.unique().scalars().all() # Usar unique() para evitar duplicados si hay múltiples UserNotifications (aunque no debería pasar con el join)
-
-        combined_notifications = []
-        for n in notifications_raw:
-            # Intentar obtener el UserNotification para esta notificación y usuario
-            user_notification_q = select(UserNotification).where(
-                UserNotification.user_id == current_user.id,
-                UserNotification.notification_id == n.id
-            )
-            user_notification = (await db.execute(user_notification_q)).scalars().first()
 
-            current_status = "new"
-            if user_notification:
-                current_status = user_notification.status
-            elif status and status != "new":
-                # Si se filtra por un status que no es 'new' y no hay UserNotification,
-                # esta notificación no debería incluirse a menos que sea global y se busque 'new'.
-                # Ya filtramos por (is_global OR user_specific_notification_ids),
-                # así que si llegamos aquí y se busca un status diferente de 'new', la omitimos.
-                continue
-            
-            # Aplicar filtro por status si se especificó
-            if status and current_status != status:
-                continue
-
-            combined_notifications.append(NotificationResponse(
+        rows, total_count = await fetch_notification_feed(
+            db, current_user.id, type=type, since=since_dt, status=status,
+            limit=limit, offset=offset, before_id=before_id
+        )
+        notifications = [
+            NotificationResponse(
                 id=n.id,
                 timestamp=n.timestamp,
                 type=n.type,
                 title=n.title,
                 message=n.message,
                 status=current_status,
-            ))
-
-        # Ordenar por timestamp descendente
-        combined_notifications.sort(key=lambda x: x.timestamp, reverse=True)
-
-        # Calcular total antes de aplicar limit y offset
-        total_count = len(combined_notifications)
-
-        # Aplicar limit y offset
-        paginated_notifications = combined_notifications[offset : offset + limit]
+            )
+            for n, current_status in rows
+        ]
 
         return NotificationsListResponse(
-            notifications=paginated_notifications,
+            notifications=notifications,
             total=total_count,
             limit=limit,
-            offset=offset
+            offset=0 if before_id is not None else offset,
+            next_before_id=notifications[-1].id if len(notifications) == limit else None
         )
     except HTTPException:
         raise
@@ -168,20 +103,21 @@ async def get_notifications_logic(
         logger.error(f"Error al obtener notificaciones: {e}")
         raise HTTPException(status_code=500, detail="Error interno al obtener notificaciones")
 
+async def get_unread_count_logic(db: AsyncSession, current_user: User) -> UnreadCountResponse:
+    """Devuelve el número de notificaciones sin leer del usuario actual."""
+    try:
+        return UnreadCountResponse(unread=await count_unread_notifications(db, current_user.id))
+    except Exception as e:
+        logger.error(f"Error al contar notificaciones sin leer: {e}")
+        raise HTTPException(status_code=500, detail="Error interno al contar notificaciones")
+
 async def get_notification_types_logic(
     db: AsyncSession,
     current_user: User = Depends(get_current_user) # Añadir current_user para filtrar tipos por usuario
 ) -> List[str]:
     """Devuelve la lista de tipos de notificaciones disponibles para el usuario actual."""
     try:
-        result = await db.execute(
-            select(Notification.type)
-            .join(UserNotification)
-            .where(UserNotification.user_id == current_user.id)
-            .distinct()
-        )
-        types = [row[0] for row in result.all()]
-        return types
+        return await list_notification_types(db, current_user.id)
     except Exception as e:
         logger.error(f"Error al obtener tipos de notificación: {e}")
         raise HTTPException(status_code=500, detail="Error interno al obtener tipos")
@@ -189,9 +125,16 @@ async def get_notification_types_logic(
 async def create_notification_logic(
     db: AsyncSession,
     notification_data: NotificationCreate,
-    current_user: User # current_user ya se resuelve en el endpoint
+    current_user: Optional[User] = None # Lo resuelve el endpoint; no hace falta para las globales
 ) -> NotificationResponse:
-    """Crea una nueva notificación. Si es global, crea UserNotifications para todos los usuarios."""
+    """Crea una nueva notificación.
+
+    Una notificación global se guarda una sola vez (fan-out en lectura): no se crea
+    ninguna UserNotification, el estado por usuario se registra solo cuando el usuario
+    actúa sobre ella. Una notificación no global se asocia al usuario que la crea.
+    """
+    if not notification_data.is_global and current_user is None:
+        raise HTTPException(status_code=400, detail="Una notificación no global requiere un usuario")
     try:
         new_notification = Notification(
             timestamp=datetime.now(),
@@ -203,51 +146,18 @@ async def create_notification_logic(
         db.add(new_notification)
         await db.flush() # Para obtener el ID de la notificación antes del commit
 
-        if notification_data.is_global:
-            # Obtener todos los usuarios
-            users_result = await db.execute(select(User))
-            all_users = users_result.scalars().all()
-
-            user_notifications_to_add = []
-            for user in all_users:
-                user_notifications_to_add.append(
-                    UserNotification(
-                        user_id=user.id,
-                        notification_id=new_notification.id,
-                        status=notification_data.status or "new"
-                    )
-                )
-            db.add_all(user_notifications_to_add)
-        else:
-            # Comportamiento actual: solo para el usuario que la crea
-            user_notification = UserNotification(
+        status_to_return = UNREAD_STATUS
+        if not notification_data.is_global:
+            status_to_return = notification_data.status or UNREAD_STATUS
+            db.add(UserNotification(
                 user_id=current_user.id,
                 notification_id=new_notification.id,
-                status=notification_data.status or "new"
-            )
-            db.add(user_notification)
-        
+                status=status_to_return
+            ))
+
         await db.commit()
         await db.refresh(new_notification)
 
-        # Si es global, el status devuelto es el por defecto 'new'
-        # Si no es global, se devuelve el status de la UserNotification creada para el usuario
-        status_to_return = notification_data.status or "new"
-        if not notification_data.is_global:
-            # Si no es global, necesitamos refrescar la user_notification para obtener su status real si se modificó
-            # Aunque en este punto, el status ya debería ser el que se asignó.
-            # Podríamos buscar la user_notification específica para el current_user si fuera necesario.
-            pass # No necesitamos refrescar user_notification aquí para el retorno, ya tenemos el status.
-
-        return NotificationResponse(
-            id=new_notification.id,
-            timestamp=new_notification.timestamp,
-            type=new_notification.type,
-            title=new_notification.title,
-            message=new_notification.message,
-            status=status_to_return # Devolver el status adecuado
-        )
-        # Enviar la nueva notificación por WebSocket
         notification_response = NotificationResponse(
             id=new_notification.id,
             timestamp=new_notification.timestamp,
@@ -256,7 +166,10 @@ async def create_notification_logic(
             message=new_notification.message,
             status=status_to_return
         )
-        await ws_manager.broadcast(notification_response.model_dump_json())
+        # Enviar la nueva notificación por WebSocket
+        topic = NOTIFICATIONS_TOPIC if notification_data.is_global else user_notifications_topic(current_user.id)
+        await ws_manager.broadcast(notification_response.model_dump_json(), topic=topic)
+        return notification_response
     except Exception as e:
         logger.error(f"Error al crear notificación: {e}")
         raise HTTPException(status_code=500, detail="Error interno al crear notificación")
@@ -278,6 +191,9 @@ async def update_notification_logic(
         user_notification = result.scalars().first()
 
         if not user_notification:
+            if notification_data.status is not None:
+                # Las notificaciones globales solo tienen fila cuando el usuario actúa sobre ellas
+                return await update_notification_status_logic(db, notification_id, notification_data.status, current_user)
             raise HTTPException(status_code=404, detail="Notificación no encontrada para este usuario")
 
         # Actualizar solo el status de la UserNotification
@@ -384,9 +300,13 @@ async def delete_notification_logic(
     notification_id: int,
     current_user: User = Depends(get_current_user) # Añadir current_user
 ) -> None:
-    """Elimina la UserNotification para el usuario actual."""
+    """Elimina la notificación del feed del usuario actual.
+
+    Para una notificación propia se borra su UserNotification. Una notificación global
+    se guarda una sola vez, así que se registra una marca "dismissed" para el usuario.
+    """
     try:
-        # Buscar la UserNotification específica para el usuario y la notificación
+        notification = (await db.execute(select(Notification).where(Notification.id == notification_id))).scalars().first()
         result = await db.execute(
             select(UserNotification)
             .where(UserNotification.notification_id == notification_id)
@@ -394,14 +314,20 @@ async def delete_notification_logic(
         )
         user_notification = result.scalars().first()
 
-        if not user_notification:
+        if notification is not None and notification.is_global:
+            if user_notification:
+                user_notification.status = DISMISSED_STATUS
+            else:
+                db.add(UserNotification(user_id=current_user.id, notification_id=notification_id, status=DISMISSED_STATUS))
+        elif user_notification:
+            await db.delete(user_notification)
+        else:
             raise HTTPException(status_code=404, detail="Notificación no encontrada para este usuario")
 
-        await db.delete(user_notification)
         await db.commit()
         return
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error al eliminar notificación: {e}")
-        raise HTTPException(status_code=500, detail="Error interno al eliminar notificación")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Error interno al eliminar notificación")
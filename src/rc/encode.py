@@ -7,6 +7,7 @@ from typing import Tuple, List, Optional
 from sqlalchemy import select
 from src.db.database import get_db
 from src.db.models import User
+from src.db.embedding_codec import decode_embedding, encode_embedding
 import numpy as np
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
@@ -193,7 +194,7 @@ class FaceEncoder:
             best_face_encoding = await self._process_user_images(user_path)
             
             if best_face_encoding is not None:
-                user.face_embedding = best_face_encoding.tobytes()
+                user.face_embedding = encode_embedding(best_face_encoding)
                 await db.commit()
                 logger.info(f"Encoding facial guardado para el usuario {user_name}.")
                 return True
@@ -209,10 +210,11 @@ class FaceEncoder:
             result = await db.execute(select(User).filter(User.id == user_id))
             user = result.scalars().first()
             
-            if not user or not user.face_embedding:
+            encoding = decode_embedding(user.face_embedding) if user else None
+            if encoding is None:
                 raise ValueError(f"No se encontró encoding facial para el usuario {user_id}")
                 
-            return np.frombuffer(user.face_embedding, dtype=np.float64)
+            return encoding
 
     async def generate_all_encodings(self) -> Tuple[int, int]:
         """
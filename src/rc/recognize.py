@@ -13,6 +13,7 @@ from collections import OrderedDict
 
 from src.db.database import get_db
 from src.db.models import User
+from src.db.embedding_codec import decode_embedding
 from src.rc.constants import (
     DEFAULT_FRAME_WIDTH,
     DEFAULT_FRAME_HEIGHT,
@@ -155,8 +156,8 @@ class FaceRecognizer:
                         continue
 
                     # Load from database and cache it
-                    if user.face_embedding:
-                        encoding = np.frombuffer(user.face_embedding, dtype=np.float64)
+                    encoding = decode_embedding(user.face_embedding)
+                    if encoding is not None:
                         self.known_face_encodings.append(encoding)
                         self.known_face_names.append(user.nombre)
                         self.encoding_cache.set(user.nombre, encoding)
@@ -0,0 +1,252 @@
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import select
+
+from src.auth import jwt_manager
+from src.db.database import get_db
+from src.db.models import User
+from src.iot import device_manager
+from src.iot.device_state_store import device_state_store
+from src.websocket.connection_manager import DEVICES_TOPIC, manager
+
+logger = logging.getLogger("CommandDispatcher")
+
+
+@dataclass
+class _PreparedCommand:
+    """Comando validado y pendiente de publicar."""
+    mqtt_topic: str
+    command_payload: str
+    device_type: Optional[str]
+    device_name: Optional[str]
+    requested_state: str
+    status_only: bool = False
+    is_new_device: bool = False
+    result: Optional[Dict[str, Any]] = None # Respuesta inmediata (el dispositivo ya está en ese estado)
+
+
+class CommandDispatcher:
+    """
+    Despachador interno de comandos IoT.
+
+    Publica los comandos directamente con el `MQTTClient` compartido aplicando las mismas
+    comprobaciones que `/iot/arduino/send_command` (usuario autenticado, cliente MQTT
+    conectado, tópico válido y estado duplicado), sin pasar por HTTP. Lo usan la propia
+    ruta, el procesador de comandos del NLP y las rutinas.
+    """
+
+    async def resolve_user(self, user_id: Optional[int] = None, token: Optional[str] = None) -> User:
+        """
+        Obtiene el usuario que ejecuta el comando a partir de su token o de su ID.
+
+        Raises:
+            HTTPException: 401 si el token no es válido o el usuario no existe.
+        """
+        credentials_exception = HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="No se pudieron validar las credenciales",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+        if token:
+            subject = jwt_manager.verify_token(token).get("sub")
+            if subject is None:
+                raise credentials_exception
+            user_id = int(subject)
+        if user_id is None:
+            raise credentials_exception
+
+        async with get_db() as db:
+            result = await db.execute(select(User).filter(User.id == user_id))
+            user = result.scalars().first()
+        if user is None:
+            logger.warning(f"Usuario con ID {user_id} no encontrado para ejecutar comandos IoT.")
+            raise credentials_exception
+        return user
+
+    @staticmethod
+    def _connected_mqtt_client():
+        from src.api.utils import get_mqtt_client
+        mqtt_client = get_mqtt_client()
+        if not mqtt_client or not mqtt_client.is_connected:
+            logger.error("MQTT client no está inicializado o conectado.")
+            raise HTTPException(status_code=500, detail="MQTT client no está inicializado o conectado.")
+        return mqtt_client
+
+    async def _prepare(self, mqtt_topic: str, command_payload: str) -> _PreparedCommand:
+        """
+        Valida el comando y lo compara con el estado en memoria, sin escribir en la base de datos.
+
+        Raises:
+            HTTPException: 400 si el tópico no es válido.
+        """
+        device_type, device_name, requested_state = device_manager._extract_device_info_from_topic(mqtt_topic, command_payload)
+        command = _PreparedCommand(mqtt_topic, command_payload, device_type, device_name, requested_state)
+
+        if not device_name or not device_type:
+            # Si no se puede extraer información válida, verificar si es un comando de estado (status/get)
+            if mqtt_topic.endswith("/status/get"):
+                logger.info(f"Comando de estado detectado para {mqtt_topic}. Publicando sin guardar en DB.")
+                command.status_only = True
+                return command
+            logger.warning(f"No se pudo extraer información de dispositivo válida del tema MQTT: {mqtt_topic}")
+            raise HTTPException(status_code=400, detail="Tema MQTT o payload de comando inválido.")
+
+        await device_state_store.ensure_loaded()
+        current_state_json = device_state_store.get(device_type, device_name)
+        if current_state_json is None:
+            command.is_new_device = True
+            return command
+
+        current_status = current_state_json.get("status")
+        if current_status and current_status.lower() == requested_state.lower():
+            logger.info(f"El dispositivo {device_name} ya está en el estado solicitado: {requested_state}")
+            await manager.broadcast(json.dumps({"type": "device_status_update", "device_name": device_name, "status": requested_state, "message": "El dispositivo ya está en el estado solicitado"}), topic=DEVICES_TOPIC)
+            command.result = {"status": f"El dispositivo {device_name} ya está en el estado solicitado: {requested_state}", "topic": mqtt_topic, "payload": command_payload}
+        return command
+
+    @staticmethod
+    async def _publish(mqtt_client, command: _PreparedCommand) -> None:
+        """
+        Publica el comando por MQTT.
+
+        Raises:
+            HTTPException: 500 si falla la publicación.
+        """
+        success = await mqtt_client.publish(command.mqtt_topic, command.command_payload)
+        if success:
+            return
+        if command.status_only:
+            logger.error(f"Fallo al enviar comando MQTT de estado a {command.mqtt_topic} con payload {command.command_payload}")
+            raise HTTPException(status_code=500, detail="Fallo al enviar comando MQTT de estado.")
+        logger.error(f"Fallo al enviar comando MQTT a {command.mqtt_topic} con payload {command.command_payload}")
+        raise HTTPException(status_code=500, detail="Fallo al enviar comando MQTT.")
+
+    @staticmethod
+    async def _apply_state(session, command: _PreparedCommand) -> Dict[str, Any]:
+        """Actualiza el estado del dispositivo tras publicar el comando (escrituras en serie en `session`)."""
+        device_type, device_name, requested_state = command.device_type, command.device_name, command.requested_state
+        if command.is_new_device:
+            await device_manager.update_device_state(
+                session,
+                device_name=device_name,
+                new_state={"status": requested_state},
+                device_type=device_type
+            )
+            logger.info(f"Creado nuevo dispositivo {device_name} de tipo {device_type} con estado inicial {requested_state}")
+            await manager.broadcast(json.dumps({"type": "device_created", "device_name": device_name, "device_type": device_type, "status": requested_state, "message": "Nuevo dispositivo creado"}), topic=DEVICES_TOPIC)
+
+        await device_manager.process_mqtt_message_and_update_state(session, command.mqtt_topic, command.command_payload)
+        return {"status": "Comando enviado y estado del dispositivo actualizado", "topic": command.mqtt_topic, "payload": command.command_payload}
+
+    @staticmethod
+    async def _broadcast_state(command: _PreparedCommand) -> None:
+        updated_state = device_state_store.get(command.device_type, command.device_name)
+        if updated_state is not None:
+            await manager.broadcast(json.dumps({"type": "device_state_updated", "device_name": command.device_name, "device_type": command.device_type, "state": updated_state, "message": "Estado del dispositivo actualizado"}), topic=DEVICES_TOPIC)
+
+    async def dispatch(self, mqtt_topic: str, command_payload: str, user: User) -> Dict[str, Any]:
+        """
+        Publica un comando MQTT y actualiza el estado del dispositivo.
+
+        Returns:
+            Dict[str, Any]: status, topic y payload del comando enviado.
+
+        Raises:
+            HTTPException: 500 si MQTT no está disponible o falla la publicación, 400 si el tópico no es válido.
+        """
+        mqtt_client = self._connected_mqtt_client()
+        command = await self._prepare(mqtt_topic, command_payload)
+        if command.result is not None:
+            return command.result
+
+        await self._publish(mqtt_client, command)
+        if command.status_only:
+            return {"status": "Comando de estado enviado exitosamente", "topic": mqtt_topic, "payload": command_payload}
+
+        async with get_db() as session:
+            result = await self._apply_state(session, command)
+            await device_manager.record_current_device_count(session, user.id)
+        await self._broadcast_state(command)
+        return result
+
+    async def dispatch_many(self, commands: List[Tuple[str, str]], user: User) -> List[Dict[str, Any]]:
+        """
+        Ejecuta varios comandos: las publicaciones MQTT van en paralelo y las escrituras en serie.
+
+        Los estados se actualizan después, uno tras otro en una única sesión, y el número de
+        dispositivos conectados se registra una sola vez para todo el lote; así no compiten
+        varias transacciones por el bloqueo de escritura de SQLite.
+
+        Args:
+            commands (List[Tuple[str, str]]): Pares (mqtt_topic, command_payload).
+            user (User): Usuario que ejecuta los comandos.
+
+        Returns:
+            List[Dict[str, Any]]: Un resultado por comando, en el mismo orden, con topic, payload,
+            success y status (o error si el comando falló).
+        """
+        outcomes: List[Any] = [None] * len(commands)
+        try:
+            mqtt_client = self._connected_mqtt_client()
+        except HTTPException as e:
+            outcomes = [e] * len(commands)
+            mqtt_client = None
+
+        prepared: Dict[int, _PreparedCommand] = {}
+        if mqtt_client is not None:
+            for index, (topic, payload) in enumerate(commands):
+                try:
+                    command = await self._prepare(topic, payload)
+                except Exception as e:
+                    outcomes[index] = e
+                    continue
+                if command.result is not None:
+                    outcomes[index] = command.result
+                else:
+                    prepared[index] = command
+
+        published = await asyncio.gather(
+            *(self._publish(mqtt_client, command) for command in prepared.values()),
+            return_exceptions=True
+        )
+        to_apply: Dict[int, _PreparedCommand] = {}
+        for (index, command), publish_error in zip(prepared.items(), published):
+            if isinstance(publish_error, Exception):
+                outcomes[index] = publish_error
+            elif command.status_only:
+                outcomes[index] = {"status": "Comando de estado enviado exitosamente", "topic": command.mqtt_topic, "payload": command.command_payload}
+            else:
+                to_apply[index] = command
+
+        if to_apply:
+            async with get_db() as session:
+                for index, command in to_apply.items():
+                    try:
+                        outcomes[index] = await self._apply_state(session, command)
+                    except Exception as e:
+                        await session.rollback()
+                        outcomes[index] = e
+                try:
+                    await device_manager.record_current_device_count(session, user.id)
+                except Exception as e:
+                    logger.error(f"Error registrando el número de dispositivos conectados: {e}")
+            for command in to_apply.values():
+                await self._broadcast_state(command)
+
+        results = []
+        for (topic, payload), outcome in zip(commands, outcomes):
+            if isinstance(outcome, Exception):
+                error = outcome.detail if isinstance(outcome, HTTPException) else str(outcome)
+                logger.error(f"Error enviando comando {topic} -> {payload}: {error}")
+                results.append({"topic": topic, "payload": payload, "success": False, "error": error})
+            else:
+                results.append({"topic": topic, "payload": payload, "success": True, "status": outcome["status"]})
+        return results
+
+
+command_dispatcher = CommandDispatcher()
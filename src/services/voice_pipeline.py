@@ -0,0 +1,291 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select, func
+
+from src.ai.nlp.core.nlp_core import NLPModule
+from src.ai.nlp.handlers.stream_processor import unspoken_remainder
+from src.ai.sound_processor.audio_buffer import AudioBuffer
+from src.ai.speaker.speaker import SpeakerRecognitionModule
+from src.ai.stt.stt import STTModule, STTQueueFullError
+from src.ai.tts.text_splitter import _split_text_into_sentences
+from src.ai.tts.tts_module import TTSModule
+from src.auth import jwt_manager
+from src.auth.auth_service import AuthService
+from src.db.database import get_db
+from src.db.models import User
+
+logger = logging.getLogger("VoicePipeline")
+
+DEFAULT_NLP_TIMEOUT = 30.0
+
+
+class VoicePipeline:
+    """
+    Pipeline de voz en proceso: STT, identificación de hablante, NLP y TTS.
+
+    Sustituye las llamadas HTTP de loopback (/stt, /speaker, /nlp) por llamadas
+    directas a los módulos ya cargados. El audio se decodifica una sola vez en memoria
+    (AudioBuffer) y se comparte entre STT e identificación de hablante, que se ejecutan
+    en paralelo, sin archivos temporales.
+    """
+
+    def __init__(
+        self,
+        stt_module: STTModule,
+        speaker_module: Optional[SpeakerRecognitionModule],
+        nlp_module: NLPModule,
+        tts_module: Optional[TTSModule] = None,
+        nlp_timeout: float = DEFAULT_NLP_TIMEOUT
+    ):
+        self._stt = stt_module
+        self._speaker = speaker_module
+        self._nlp = nlp_module
+        self._tts = tts_module
+        self.nlp_timeout = nlp_timeout
+
+    async def process(
+        self,
+        audio_bytes: bytes,
+        user: Optional[User] = None,
+        user_token: Optional[str] = None,
+        speak: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Procesa un audio de voz completo.
+
+        Args:
+            audio_bytes (bytes): Contenido del archivo de audio recibido.
+            user (Optional[User]): Usuario ya autenticado. Si se indica, se omite la identificación por voz.
+            user_token (Optional[str]): Token del usuario autenticado.
+            speak (bool): Si es True, reproduce la respuesta NLP mediante TTS.
+
+        Returns:
+            Dict[str, Any]: transcribed_text, identified_speaker, user_id y nlp_response.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            # Una única decodificación a 16 kHz mono compartida por STT e identificación de hablante
+            audio = await loop.run_in_executor(None, AudioBuffer.from_bytes, audio_bytes)
+        except ValueError as e:
+            logger.error(f"No se pudo decodificar el audio recibido: {e}")
+            raise HTTPException(status_code=400, detail="Audio inválido o en un formato no soportado")
+        logger.info(f"Audio decodificado en memoria ({audio.duration:.2f}s)")
+        return await self.process_audio(audio, user=user, user_token=user_token, speak=speak)
+
+    async def process_audio(
+        self,
+        audio: AudioBuffer,
+        user: Optional[User] = None,
+        user_token: Optional[str] = None,
+        speak: bool = True,
+        early_speaker: Optional[Awaitable[Optional[User]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Procesa un audio ya decodificado, p. ej. el capturado directamente del micrófono.
+
+        Args:
+            audio (AudioBuffer): Audio mono a 16 kHz.
+            user (Optional[User]): Usuario ya autenticado. Si se indica, se omite la identificación por voz.
+            user_token (Optional[str]): Token del usuario autenticado.
+            speak (bool): Si es True, reproduce la respuesta NLP mediante TTS.
+            early_speaker (Optional[Awaitable[Optional[User]]]): Identificación ya lanzada con
+                el inicio del audio (ver `HotwordDetector`); si no reconoce al hablante, se
+                identifica con el audio completo.
+
+        Returns:
+            Dict[str, Any]: transcribed_text, identified_speaker, user_id y nlp_response.
+        """
+        if user is not None:
+            transcribed_text = await self._transcribe(audio)
+            user_id = user.id
+            speaker_name = user.nombre if user.nombre else "Usuario Autenticado"
+            token = user_token
+        else:
+            transcribed_text, (user_id, speaker_name) = await asyncio.gather(
+                self._transcribe(audio),
+                self._identify_or_register(audio, early_speaker)
+            )
+            logger.info("STT e identificación de hablante completadas concurrentemente.")
+            token = jwt_manager.create_access_token(data={"sub": str(user_id)})
+
+        if not transcribed_text:
+            logger.error("Texto transcrito vacío después de STT.")
+            raise HTTPException(status_code=500, detail="Error en transcripción STT")
+
+        logger.info(f"Texto transcrito final: '{transcribed_text}'")
+        logger.info(f"Hablante identificado final: '{speaker_name}' (ID: {user_id})")
+
+        if speak and self._tts is not None and self._tts.is_online():
+            # Las frases se sintetizan y reproducen mientras el LLM sigue generando
+            nlp_response_text = await self._query_nlp_streaming(transcribed_text, user_id, token)
+        else:
+            nlp_response_text = await self._query_nlp(transcribed_text, user_id, token)
+            if speak:
+                await self.speak(nlp_response_text)
+
+        return {
+            "transcribed_text": transcribed_text,
+            "identified_speaker": speaker_name,
+            "user_id": user_id,
+            "nlp_response": nlp_response_text
+        }
+
+    async def _transcribe(self, audio: AudioBuffer) -> str:
+        """Transcribe el audio usando la cola acotada del módulo STT sin bloquear el event loop."""
+        try:
+            result = await self._stt.transcribe_audio_async(audio)
+        except STTQueueFullError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        logger.info(f"Texto transcrito: {result['text']} (cola {result['queue_wait_ms']} ms, decodificación {result['decode_ms']} ms)")
+        return result["text"] or ""
+
+    async def _identify_or_register(
+        self,
+        audio: AudioBuffer,
+        early_speaker: Optional[Awaitable[Optional[User]]] = None
+    ) -> Tuple[int, str]:
+        """
+        Identifica al hablante y, si no se reconoce, lo registra como 'Desconocido N'.
+
+        Returns:
+            Tuple[int, str]: ID y nombre del usuario identificado o registrado.
+        """
+        identified_user = None
+        if early_speaker is not None:
+            try:
+                identified_user = await early_speaker
+            except Exception as e:
+                logger.warning(f"Error en la identificación anticipada del hablante: {e}")
+        if identified_user is None:
+            identified_user, _ = await self._speaker.identify_speaker(audio)
+        if identified_user is not None:
+            logger.info(f"Hablante identificado: {identified_user.nombre} (ID: {identified_user.id})")
+            return identified_user.id, identified_user.nombre
+
+        logger.info("Hablante no identificado. Registrando como desconocido.")
+        async with get_db() as db:
+            count_result = await db.execute(
+                select(func.count()).where(User.nombre.like("Desconocido %"))
+            )
+            new_unknown_name = f"Desconocido {count_result.scalar_one() + 1}"
+
+            embedding_data = await self._speaker.register_speaker(new_unknown_name, audio, is_owner=False)
+            if embedding_data is None:
+                logger.error(f"No se pudo registrar el hablante desconocido {new_unknown_name}.")
+                raise HTTPException(status_code=500, detail="Error al registrar hablante desconocido")
+
+            from src.api import utils
+            new_user = await AuthService(db).register_user(
+                username=new_unknown_name,
+                password=utils.generate_random_password(),
+                is_owner=False,
+                speaker_embedding=embedding_data
+            )
+            logger.info(f"Nuevo hablante desconocido registrado: {new_unknown_name} (ID: {new_user.id})")
+            return new_user.id, new_unknown_name
+
+    async def _query_nlp(self, prompt: str, user_id: Optional[int], token: Optional[str]) -> str:
+        """Llama directamente a NLPModule.generate_response y devuelve el texto de respuesta."""
+        if not user_id or not token:
+            logger.warning("No se puede realizar el procesamiento NLP: user_id o token no disponibles.")
+            return "No se pudo procesar el comando sin identificación de usuario."
+
+        try:
+            response = await asyncio.wait_for(
+                self._nlp.generate_response(prompt, user_id=user_id, token=token),
+                timeout=self.nlp_timeout
+            )
+        except asyncio.TimeoutError:
+            logger.error("Timeout en el procesamiento NLP")
+            return "El procesamiento tardó demasiado tiempo. Intenta de nuevo."
+        except Exception as e:
+            logger.error(f"Error inesperado en el procesamiento NLP: {e}", exc_info=True)
+            return f"Error inesperado al procesar NLP: {str(e)}"
+
+        return self._response_text(response)
+
+    @staticmethod
+    def _response_text(response: Optional[Dict[str, Any]]) -> str:
+        if not response:
+            return "Error al procesar NLP: respuesta vacía"
+        if response.get("error"):
+            logger.error(f"Error en el procesamiento NLP: {response.get('error')}")
+            return f"Error al procesar NLP: {response.get('error')}"
+
+        logger.info(f"Respuesta NLP: {response.get('response', '')}")
+        return response.get("response", "")
+
+    async def _query_nlp_streaming(self, prompt: str, user_id: Optional[int], token: Optional[str]) -> str:
+        """
+        Consulta el NLP en streaming y reproduce cada frase en cuanto está completa.
+
+        Al terminar, reproduce la parte de la respuesta procesada que no se haya dicho
+        ya (por ejemplo, el resultado de un comando IoT).
+        """
+        if not user_id or not token:
+            logger.warning("No se puede realizar el procesamiento NLP: user_id o token no disponibles.")
+            return "No se pudo procesar el comando sin identificación de usuario."
+
+        sentence_queue: asyncio.Queue = asyncio.Queue()
+        player_task = asyncio.create_task(self._play_sentences(sentence_queue))
+        streamed_text = ""
+        response = None
+
+        async def consume_stream():
+            nonlocal streamed_text, response
+            async for event in self._nlp.generate_response_stream(prompt, user_id=user_id, token=token):
+                if event["type"] == "delta":
+                    streamed_text += event["text"]
+                elif event["type"] == "sentence":
+                    sentence_queue.put_nowait(event["text"])
+                elif event["type"] == "final":
+                    response = event["response"]
+
+        try:
+            await asyncio.wait_for(consume_stream(), timeout=self.nlp_timeout)
+            response_text = self._response_text(response)
+            if response_text and not response_text.startswith("Error"):
+                for sentence in _split_text_into_sentences(unspoken_remainder(response_text, streamed_text)):
+                    sentence_queue.put_nowait(sentence)
+            return response_text
+        except asyncio.TimeoutError:
+            logger.error("Timeout en el procesamiento NLP")
+            return "El procesamiento tardó demasiado tiempo. Intenta de nuevo."
+        except Exception as e:
+            logger.error(f"Error inesperado en el procesamiento NLP: {e}", exc_info=True)
+            return f"Error inesperado al procesar NLP: {str(e)}"
+        finally:
+            sentence_queue.put_nowait(None)
+            await player_task
+
+    async def _play_sentences(self, sentence_queue: asyncio.Queue) -> None:
+        """Sintetiza (con lookahead) y reproduce en orden las frases de la cola hasta recibir None."""
+        async def queued_sentences():
+            while True:
+                sentence = await sentence_queue.get()
+                if sentence is None:
+                    return
+                yield sentence
+
+        try:
+            await self._tts.speak(queued_sentences())
+        except Exception as e:
+            logger.error(f"Error inesperado en la reproducción TTS en streaming: {e}", exc_info=True)
+
+    async def speak(self, text: str) -> None:
+        """Genera y reproduce el audio TTS de la respuesta, frase a frase."""
+        if not text or text.startswith("Error"):
+            logger.info("No hay respuesta NLP válida para generar TTS.")
+            return
+        if self._tts is None or not self._tts.is_online():
+            logger.info("Módulo TTS no disponible, se omite la reproducción.")
+            return
+
+        try:
+            if not await self._tts.speak(text):
+                logger.error("Error al reproducir audio TTS")
+        except Exception as e:
+            logger.error(f"Error inesperado en la generación TTS: {e}", exc_info=True)
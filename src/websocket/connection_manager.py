@@ -1,35 +1,333 @@
+import asyncio
 import json
-from typing import List
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
 from fastapi import WebSocket
 import logging
 
+from src.websocket.state import VersionedState
+
 logger = logging.getLogger("Websocket")
 
+DEFAULT_SEND_QUEUE_SIZE = 100
+DEFAULT_SEND_TIMEOUT_S = 5.0
+
+# Temas conocidos; `notifications:user:<id>` recibe las notificaciones propias de un usuario
+MUSIC_TOPIC = "music"
+DEVICES_TOPIC = "devices"
+NOTIFICATIONS_TOPIC = "notifications"
+
+
+def user_notifications_topic(user_id: int) -> str:
+    return f"{NOTIFICATIONS_TOPIC}:user:{user_id}"
+
+
+class ClientConnection:
+    """
+    Conexión de un cliente con su cola de salida acotada y su tarea de escritura.
+
+    Los mensajes se encolan ya serializados y una tarea propia los envía en orden, así un
+    cliente lento o caído no retrasa a los demás. Si la cola está llena se descarta el
+    mensaje más antiguo; si el cliente acumula `max_consecutive_drops` descartes sin
+    completar un envío, se desconecta.
+
+    Un cliente sin suscripciones recibe todos los mensajes (comportamiento anterior); en
+    cuanto se suscribe a algún tema solo recibe los de sus temas. Si se descarta un delta
+    de un tema con estado, se encola una instantánea (resync) de ese tema, que se genera
+    con el estado vigente en el momento de enviarla.
+    """
+
+    def __init__(self, websocket: WebSocket, manager: "ConnectionManager", max_queue: int, send_timeout_s: float, max_consecutive_drops: int, client_id: Optional[str] = None):
+        self.websocket = websocket
+        self.client_id = client_id or str(websocket.client)
+        self.topics: Set[str] = set()
+        self._manager = manager
+        self._queue: Deque[Tuple[Optional[str], str]] = deque()
+        # Temas con una instantánea pendiente; se envían antes que la cola y ocupan hueco en ella
+        self._pending_snapshots: Set[str] = set()
+        self._max_queue = max_queue
+        self._send_timeout_s = send_timeout_s
+        self._max_consecutive_drops = max_consecutive_drops
+        self._ready = asyncio.Event()
+        self._writer_task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.dropped = 0
+        self._consecutive_drops = 0
+        self.max_depth = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue) + len(self._pending_snapshots)
+
+    def start(self) -> None:
+        self._writer_task = asyncio.create_task(self._writer_loop())
+
+    def stop(self) -> None:
+        if self._writer_task is not None and self._writer_task is not asyncio.current_task():
+            self._writer_task.cancel()
+        self._writer_task = None
+        self._queue.clear()
+        self._pending_snapshots.clear()
+
+    def accepts(self, topic: Optional[str]) -> bool:
+        """Indica si el mensaje de `topic` va a este cliente (sin tema = para todos)."""
+        return topic is None or not self.topics or topic in self.topics
+
+    def enqueue_snapshot(self, topic: str) -> bool:
+        """Pide una instantánea del tema si no hay ya una pendiente."""
+        if topic in self._pending_snapshots:
+            return True
+        if not self._make_room():
+            return False
+        self._pending_snapshots.add(topic)
+        self._ready.set()
+        return True
+
+    def enqueue(self, message: str, topic: Optional[str] = None) -> bool:
+        """
+        Encola un mensaje sin bloquear.
+
+        Returns:
+            bool: False si el cliente se desconectó por no consumir a tiempo.
+        """
+        if not self._make_room():
+            return False
+        if self.queue_depth >= self._max_queue:
+            # Solo quedan instantáneas pendientes, que ya llevarán el estado vigente
+            self.dropped += 1
+            self._manager.dropped += 1
+            return True
+        self._queue.append((topic, message))
+        self.max_depth = max(self.max_depth, self.queue_depth)
+        self._ready.set()
+        return True
+
+    def _make_room(self) -> bool:
+        """
+        Libera un hueco si la cola (mensajes más instantáneas pendientes) está llena,
+        descartando el mensaje más antiguo. Las instantáneas pendientes nunca se descartan.
+
+        Returns:
+            bool: False si el cliente se desconectó por no consumir a tiempo.
+        """
+        while self.queue_depth >= self._max_queue and self._queue:
+            dropped_topic, _ = self._queue.popleft()
+            self.dropped += 1
+            self._manager.dropped += 1
+            self._consecutive_drops += 1
+            if self._consecutive_drops >= self._max_consecutive_drops:
+                logger.warning(f"Cliente lento {self.websocket.client}: {self._consecutive_drops} mensajes descartados seguidos, se desconecta")
+                self._manager.disconnected_slow += 1
+                self._manager.close_client(self)
+                return False
+            if self.topics and dropped_topic in self._manager.states and dropped_topic not in self._pending_snapshots:
+                # El cliente perderá una versión: se le envía primero la instantánea vigente del
+                # tema (sustituye al mensaje descartado), y los deltas ya encolados los ignorará
+                self._pending_snapshots.add(dropped_topic)
+        return True
+
+    async def _writer_loop(self) -> None:
+        try:
+            while True:
+                if self._pending_snapshots:
+                    message = self._manager.snapshot_message(self._pending_snapshots.pop())
+                    if message is None:
+                        continue
+                elif self._queue:
+                    _, message = self._queue.popleft()
+                else:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                await asyncio.wait_for(self.websocket.send_text(message), timeout=self._send_timeout_s)
+                self.sent += 1
+                self._consecutive_drops = 0
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.warning(f"Error enviando a {self.websocket.client}, se desconecta: {e}")
+            self._manager.close_client(self)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "topics": sorted(self.topics),
+            "queue_depth": self.queue_depth,
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+        }
+
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    """
+    Clientes WebSocket conectados, sus suscripciones a temas y el estado versionado por tema.
+
+    Protocolo de cliente en `/ws/{client_id}` (mensajes JSON):
+        {"action": "subscribe", "topics": ["music", "devices", "notifications:user:<id>"]}
+        {"action": "unsubscribe", "topics": [...]}
+        {"action": "resync", "topic": "music"}
+
+    Al suscribirse a un tema con estado (ver `publish_state`) el cliente recibe una
+    instantánea y después solo deltas (ver `VersionedState`).
+    """
 
-    async def connect(self, websocket: WebSocket):
+    def __init__(
+        self,
+        max_queue: int = DEFAULT_SEND_QUEUE_SIZE,
+        send_timeout_s: float = DEFAULT_SEND_TIMEOUT_S,
+        max_consecutive_drops: Optional[int] = None
+    ):
+        self.max_queue = max_queue
+        self.send_timeout_s = send_timeout_s
+        self.max_consecutive_drops = max_consecutive_drops or max_queue
+        self._clients: Dict[WebSocket, ClientConnection] = {}
+        self.states: Dict[str, VersionedState] = {}
+        self.broadcasts = 0
+        self.dropped = 0
+        self.disconnected_slow = 0
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self._clients)
+
+    async def connect(self, websocket: WebSocket, client_id: Optional[str] = None):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        client = ClientConnection(websocket, self, self.max_queue, self.send_timeout_s, self.max_consecutive_drops, client_id)
+        self._clients[websocket] = client
+        client.start()
         logger.info(f"Cliente conectado: {websocket.client}")
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-        logger.info(f"Cliente desconectado: {websocket.client}")
+        client = self._clients.pop(websocket, None)
+        if client is not None:
+            client.stop()
+            logger.info(f"Cliente desconectado: {websocket.client}")
+
+    def close_client(self, client: ClientConnection) -> None:
+        """Retira a un cliente lento o caído y cierra su socket en segundo plano."""
+        if self._clients.get(client.websocket) is not client:
+            return
+        self.disconnect(client.websocket)
+        asyncio.create_task(self._close_socket(client.websocket))
+
+    @staticmethod
+    async def _close_socket(websocket: WebSocket) -> None:
+        try:
+            await websocket.close(code=1008)
+        except Exception:
+            pass
 
     async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
-        logger.debug(f"Mensaje personal enviado a {websocket.client}: {message}")
+        client = self._clients.get(websocket)
+        if client is not None:
+            client.enqueue(message)
+            logger.debug(f"Mensaje personal encolado para {websocket.client}: {message}")
+
+    async def broadcast(self, message: str, topic: Optional[str] = None):
+        """
+        Encola el mensaje ya serializado para los clientes interesados (no espera a los envíos).
+
+        Args:
+            message (str): Mensaje serializado.
+            topic (Optional[str]): Tema del mensaje; sin tema se envía a todos los clientes.
+        """
+        self.broadcasts += 1
+        logger.debug(f"Broadcast de {len(message)} caracteres (tema {topic}) a {len(self._clients)} clientes")
+        for client in list(self._clients.values()):
+            if client.accepts(topic):
+                client.enqueue(message, topic)
+
+    async def publish_state(self, topic: str, changes: Dict[str, Any]):
+        """
+        Publica el estado (o parte de él) de un tema versionado.
 
-    async def broadcast(self, message: str):
+        Los campos se fusionan en el estado del tema. Los clientes suscritos reciben un único
+        delta con los campos que cambiaron (nada si no cambió ninguno); los clientes sin
+        suscripciones siguen recibiendo `changes` completo, como antes.
+        """
+        state = self.states.get(topic)
+        if state is None:
+            state = self.states[topic] = VersionedState(topic)
+        changed = state.apply(changes)
+
+        self.broadcasts += 1
+        legacy_message = None
+        delta_message = None
+        for client in list(self._clients.values()):
+            if not client.topics:
+                if legacy_message is None:
+                    legacy_message = json.dumps(changes, ensure_ascii=False)
+                client.enqueue(legacy_message, topic)
+            elif changed is not None and topic in client.topics:
+                if delta_message is None:
+                    delta_message = state.delta_message(changed)
+                client.enqueue(delta_message, topic)
+
+    def snapshot_message(self, topic: str) -> Optional[str]:
+        state = self.states.get(topic)
+        return state.snapshot_message() if state is not None else None
+
+    def subscribe(self, websocket: WebSocket, topics: Iterable[str]) -> None:
+        client = self._clients.get(websocket)
+        if client is None:
+            return
+        for topic in topics:
+            if topic not in client.topics:
+                client.topics.add(topic)
+                if topic in self.states:
+                    client.enqueue_snapshot(topic)
+
+    def unsubscribe(self, websocket: WebSocket, topics: Iterable[str]) -> None:
+        client = self._clients.get(websocket)
+        if client is not None:
+            client.topics.difference_update(topics)
+
+    def resync(self, websocket: WebSocket, topic: str) -> None:
+        client = self._clients.get(websocket)
+        if client is not None and topic in self.states:
+            client.enqueue_snapshot(topic)
+
+    async def handle_client_message(self, websocket: WebSocket, data: str) -> bool:
+        """
+        Procesa un mensaje de control del protocolo de suscripción.
+
+        Returns:
+            bool: True si era un mensaje de control, False si no (p. ej. texto libre).
+        """
         try:
-            msg_json = json.loads(message)
-            msg_type = msg_json.get("type", "unknown")
-            logger.debug(f"Broadcast de mensaje de tipo: {msg_type}")
-        except json.JSONDecodeError:
-            logger.debug(f"Broadcast de mensaje (no JSON): {message[:100]}...") # Log first 100 chars if not JSON
-        for connection in self.active_connections:
-            await connection.send_text(message)
+            request = json.loads(data)
+        except (json.JSONDecodeError, TypeError):
+            return False
+        if not isinstance(request, dict) or request.get("action") not in ("subscribe", "unsubscribe", "resync"):
+            return False
+
+        action = request["action"]
+        topics = request.get("topics") or ([request["topic"]] if request.get("topic") else [])
+        topics = [topic for topic in topics if isinstance(topic, str) and topic]
+        if action == "subscribe":
+            self.subscribe(websocket, topics)
+        elif action == "unsubscribe":
+            self.unsubscribe(websocket, topics)
+        else:
+            for topic in topics:
+                self.resync(websocket, topic)
+
+        client = self._clients.get(websocket)
+        if client is not None and action != "resync":
+            client.enqueue(json.dumps({"type": "subscriptions", "topics": sorted(client.topics)}))
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        clients = list(self._clients.values())
+        return {
+            "clients": len(clients),
+            "broadcasts": self.broadcasts,
+            "dropped": self.dropped,
+            "disconnected_slow": self.disconnected_slow,
+            "queue_depth_total": sum(client.queue_depth for client in clients),
+            "queue_depth_max": max((client.queue_depth for client in clients), default=0),
+            "state_versions": {topic: state.version for topic, state in self.states.items()},
+            "per_client": {client.client_id: client.get_stats() for client in clients},
+        }
 
 manager = ConnectionManager()
@@ -0,0 +1,56 @@
+import json
+from typing import Any, Dict, Optional
+
+
+class VersionedState:
+    """
+    Estado de un tema WebSocket (p. ej. `music`) con número de versión.
+
+    Cada publicación fusiona los campos recibidos en el estado y, si alguno cambió, sube
+    la versión. A los suscriptores se les envía una instantánea al suscribirse y después
+    solo deltas con los campos cambiados:
+
+        {"type": "snapshot", "topic": ..., "version": N, "state": {...}}
+        {"type": "delta", "topic": ..., "base_version": N - 1, "version": N, "changes": {...}}
+
+    Un cliente aplica un delta solo si `base_version` coincide con su versión; ignora los
+    de versión ya conocida y, ante un hueco, pide una instantánea con la acción `resync`.
+    """
+
+    def __init__(self, topic: str):
+        self.topic = topic
+        self.version = 0
+        self.state: Dict[str, Any] = {}
+
+    def apply(self, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Fusiona `changes` en el estado.
+
+        Returns:
+            Optional[Dict[str, Any]]: Los campos que cambiaron, o None si no cambió nada
+                (en ese caso la versión no sube).
+        """
+        changed = {key: value for key, value in changes.items() if key not in self.state or self.state[key] != value}
+        if not changed:
+            return None
+        self.state.update(changed)
+        self.version += 1
+        return changed
+
+    def snapshot_message(self) -> str:
+        return json.dumps(
+            {"type": "snapshot", "topic": self.topic, "version": self.version, "state": self.state},
+            ensure_ascii=False
+        )
+
+    def delta_message(self, changed: Dict[str, Any]) -> str:
+        return json.dumps(
+            {
+                "type": "delta",
+                "topic": self.topic,
+                "base_version": self.version - 1,
+                "version": self.version,
+                "changes": changed,
+            },
+            ensure_ascii=False
+        )